@@ -19,6 +19,12 @@ def create_app(config_name='default'):
 
     # Load configuration
     app.config.from_object(config[config_name])
+    app.config['CONFIG_NAME'] = config_name  # Lets worker processes build the same app
+
+    # Engine and pool options for the configured database (explicit options win)
+    from app.utils.database import engine_options, configure_engine
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**engine_options(app.config),
+                                               **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
 
     # Initialize extensions with app
     db.init_app(app)
@@ -40,6 +46,7 @@ def create_app(config_name='default'):
 
     # Create upload folder if it doesn't exist
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['ATTACHMENT_FOLDER'], exist_ok=True)
 
     # Register blueprints
     from app.auth import auth_bp
@@ -61,10 +68,41 @@ def create_app(config_name='default'):
     from app import routes
     app.register_blueprint(routes.main_bp)
 
+    # Request metrics for /metrics (first hooks registered: their timing covers the others)
+    from app.utils import metrics
+    metrics.init_app(app)
+
+    # Audit log: views recorded after each request, changes on commit
+    from app.utils import audit
+    audit.init_app(app)
+
+    # Login: hashing pool, attempt limits and batched last-login writes
+    from app.auth import security
+    security.init_app(app)
+
     # Create database tables
     with app.app_context():
+        configure_engine(db.engine, app.config)
+
+        # Per-request query counts and N+1 detection (sampled)
+        from app.utils import sqlstats
+        sqlstats.init_app(app, db.engine)
+
         db.create_all()
 
+        # Add indexes/columns introduced after the tables were first created
+        from app.utils.schema import upgrade_schema
+        upgrade_schema()
+
+        # Full-text index over medical records (not part of the model metadata)
+        from app.medical.search import ensure_search_index
+        ensure_search_index()
+
+        # Stored counters start from the real counts (new table on an existing database)
+        from app.models import Counter
+        if Counter.query.first() is None:
+            Counter.reconcile()
+
         # Create default admin user if no users exist
         from app.models import User
         if User.query.count() == 0:
@@ -51,7 +51,7 @@ def api_appointments():
     start = request.args.get('start')
     end = request.args.get('end')
 
-    query = Appointment.query
+    query = Appointment.query.options(db.joinedload(Appointment.patient))  # Titles show the patient name
 
     if start:
         start_date = datetime.fromisoformat(start.replace('Z', '+00:00'))
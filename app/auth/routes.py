@@ -1,7 +1,9 @@
-from flask import render_template, redirect, url_for, flash, request
+from flask import render_template, redirect, url_for, flash, request, make_response
 from flask_login import login_user, logout_user, login_required, current_user
 from app.auth import auth_bp
-from app.models import User
+from app.models import User, AuditEvent
+from app.auth import security
+from app.utils import audit
 from app import db
 from datetime import datetime
 
@@ -21,9 +23,25 @@ def login():
             flash('Please provide both username and password.', 'danger')
             return render_template('auth/login.html')
 
+        # Limit attempts before any hashing
+        wait = security.login_wait(username, request.remote_addr)
+        if wait:
+            flash(f'Too many sign-in attempts. Please try again in {int(wait) + 1} seconds.', 'danger')
+            response = make_response(render_template('auth/login.html'), 429)
+            response.headers['Retry-After'] = str(int(wait) + 1)
+            return response
+
         user = User.query.filter_by(username=username).first()
 
-        if user is None or not user.check_password(password):
+        try:
+            valid = user is not None and security.verify_password(user.password_hash, password)
+        except security.HashingBusy:
+            flash('The server is busy signing in other users. Please try again in a moment.', 'warning')
+            response = make_response(render_template('auth/login.html'), 503)
+            response.headers['Retry-After'] = '2'
+            return response
+
+        if not valid:
             flash('Invalid username or password.', 'danger')
             return render_template('auth/login.html')
 
@@ -31,9 +49,19 @@ def login():
             flash('Your account has been deactivated. Please contact an administrator.', 'danger')
             return render_template('auth/login.html')
 
+        # Hash made with older parameters: replace it while we have the password
+        if security.needs_rehash(user.password_hash):
+            try:
+                user.upgrade_password_hash(security.hash_password(password))
+                db.session.commit()
+            except security.HashingBusy:
+                pass  # Next login
+
         # Log in the user
         login_user(user, remember=remember)
-        user.update_last_login()
+        security.login_succeeded(username)
+        security.record_login(user)
+        audit.record(AuditEvent.LOGIN, 'user', user.id)
 
         flash(f'Welcome back, {user.first_name}!', 'success')
 
@@ -50,6 +78,7 @@ def login():
 @login_required
 def logout():
     """User logout"""
+    audit.record(AuditEvent.LOGOUT, 'user', current_user.id)
     logout_user()
     flash('You have been logged out successfully.', 'info')
     return redirect(url_for('auth.login'))
@@ -71,7 +100,12 @@ def change_password():
         new_password = request.form.get('new_password')
         confirm_password = request.form.get('confirm_password')
 
-        if not current_user.check_password(current_password):
+        try:
+            valid = security.verify_password(current_user.password_hash, current_password or '')
+        except security.HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('auth/change_password.html')
+        if not valid:
             flash('Current password is incorrect.', 'danger')
             return render_template('auth/change_password.html')
 
@@ -83,7 +117,12 @@ def change_password():
             flash('Password must be at least 6 characters long.', 'danger')
             return render_template('auth/change_password.html')
 
-        current_user.set_password(new_password)
+        try:
+            password_hash = security.hash_password(new_password)
+        except security.HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('auth/change_password.html')
+        db.session.get(User, current_user.id).password_hash = password_hash  # current_user is a snapshot
         db.session.commit()
 
         flash('Password changed successfully.', 'success')
@@ -0,0 +1,132 @@
+"""
+Login security and throughput
+Password hashing is CPU-bound (about 0.1s per check with scrypt), so a burst
+of logins at shift change must not tie up every request worker.
+
+- Password checks and hashes run in a bounded thread pool
+  (PASSWORD_HASH_WORKERS; hashlib releases the GIL while hashing). When
+  more than PASSWORD_HASH_QUEUE checks are waiting, new ones fail fast with
+  HashingBusy instead of piling up.
+- New hashes use PASSWORD_HASH_METHOD. needs_rehash() tells a stored hash
+  made with other parameters, and the login route replaces it while it has
+  the plain password.
+- Login attempts are rate limited per username and per IP address with
+  token buckets, checked before any hashing.
+- last_login is written by a background batch writer instead of a commit
+  in the login request.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from flask import current_app
+from sqlalchemy import bindparam, update
+from werkzeug.security import check_password_hash, generate_password_hash
+from app.models import User
+from app.models.user import forget_cached_user
+from app.utils.batch import BatchWriter
+from app.utils.ratelimit import TokenBucketLimiter
+
+_executor = None
+_executor_pid = None
+_waiting = 0  # Checks submitted and not finished
+_lock = threading.Lock()
+
+_username_limiter = TokenBucketLimiter(rate=5 / 60, burst=5)
+_ip_limiter = TokenBucketLimiter(rate=60 / 60, burst=60)
+
+
+class HashingBusy(Exception):
+    """Too many password checks are already waiting"""
+
+
+def _run_hashing(function, *args):
+    """Run a hashing function in the pool and wait for its result"""
+    global _executor, _executor_pid, _waiting
+    workers = current_app.config['PASSWORD_HASH_WORKERS']
+    if workers == 0:
+        return function(*args)
+
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+            _executor_pid = os.getpid()
+            _waiting = 0
+        if _waiting >= workers + current_app.config['PASSWORD_HASH_QUEUE']:
+            raise HashingBusy()
+        _waiting += 1
+
+    try:
+        return _executor.submit(function, *args).result()
+    finally:
+        with _lock:
+            _waiting -= 1
+
+
+def verify_password(password_hash, password):
+    """check_password_hash() in the hashing pool; raises HashingBusy"""
+    return _run_hashing(check_password_hash, password_hash, password)
+
+
+def hash_password(password):
+    """A hash of password with PASSWORD_HASH_METHOD, made in the hashing pool; raises HashingBusy"""
+    return _run_hashing(generate_password_hash, password, current_app.config['PASSWORD_HASH_METHOD'])
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method):
+    """The method part of hashes made with method, with default parameters filled in (e.g. 'pbkdf2:sha256:1000000')"""
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def needs_rehash(password_hash):
+    """Whether a stored hash was made with other parameters than PASSWORD_HASH_METHOD"""
+    return password_hash.split('$', 1)[0] != _method_prefix(current_app.config['PASSWORD_HASH_METHOD'])
+
+
+def login_wait(username, ip_address):
+    """Take a login attempt from the buckets of the username and IP. Returns 0 if allowed, else seconds to wait."""
+    wait = _ip_limiter.acquire(ip_address)
+    if wait:
+        return wait
+    return _username_limiter.acquire(username.strip().lower())
+
+
+def login_succeeded(username):
+    """Give a username its attempts back after a successful login"""
+    _username_limiter.reset(username.strip().lower())
+
+
+class LastLoginWriter(BatchWriter):
+    """(user id, time) pairs, written as one executemany UPDATE per batch"""
+
+    name = 'last-login-writer'
+
+    def write(self, connection, batch):
+        latest = {}
+        for user_id, logged_in in batch:
+            latest[user_id] = max(logged_in, latest.get(user_id, logged_in))
+        table = User.__table__
+        connection.execute(
+            update(table).where(table.c.id == bindparam('user_id')).values(last_login=bindparam('logged_in')),
+            [{'user_id': user_id, 'logged_in': logged_in} for user_id, logged_in in latest.items()]
+        )
+        for user_id in latest:
+            forget_cached_user(user_id)
+
+
+last_login_writer = LastLoginWriter()
+
+
+def record_login(user):
+    """Set the user's last login time (written in the background)"""
+    last_login_writer.append((user.id, datetime.utcnow()))
+
+
+def init_app(app):
+    last_login_writer.configure(app, 10000, 500, app.config['LAST_LOGIN_FLUSH_INTERVAL'])
+    for limiter, per_minute in ((_username_limiter, app.config['LOGIN_ATTEMPTS_PER_USERNAME']),
+                                (_ip_limiter, app.config['LOGIN_ATTEMPTS_PER_IP'])):
+        limiter.rate = per_minute / 60
+        limiter.burst = per_minute
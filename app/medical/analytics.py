@@ -0,0 +1,204 @@
+"""
+Population health analytics
+Clinic-level statistics over the medical records of a date range: BMI
+distribution, blood pressure categories by age band, abnormal vitals rates
+by month and the most frequent diagnoses.
+
+Records are streamed by one query, in chunks of only the numeric columns
+needed (dates as YYYYMMDD integers), and reduced with NumPy into fixed-size
+accumulators, so memory does not grow with the number of records.
+Vital flags and BMI come from flags.compute_flags(), the same thresholds as
+MedicalRecord.has_abnormal_vitals() and get_bmi_category(). Results are
+cached per date range for ANALYTICS_CACHE_TTL seconds.
+"""
+from datetime import datetime, timedelta
+import numpy as np
+from flask import current_app
+from app import db
+from app.models import MedicalRecord, Patient
+from app.medical.flags import compute_flags
+from app.utils.cache import TTLCache
+
+DEFAULT_CHUNK_SIZE = 50000
+CACHE_ENTRIES = 32
+TOP_DIAGNOSES = 10
+
+VITAL_COLUMNS = list(MedicalRecord.VITAL_RANGES) + ['weight', 'height']
+
+# Lower bound of each age band (age at the visit)
+AGE_BANDS = [(0, '0-17'), (18, '18-39'), (40, '40-59'), (60, '60-79'), (80, '80+')]
+
+# ACC/AHA 2017 categories, checked from the most severe down
+BP_CATEGORIES = ['Normal', 'Elevated', 'Stage 1', 'Stage 2', 'Crisis']
+
+# BMI histogram bins; values below/above the range fall in the first/last bin
+BMI_BIN_EDGES = np.arange(15, 47.5, 2.5)
+
+_cache = TTLCache(ttl=600, max_entries=CACHE_ENTRIES)  # (start_date, end_date) -> (result, computed_at)
+
+
+def bp_category_index(systolic, diastolic):
+    """Index into BP_CATEGORIES for arrays of blood pressure values"""
+    return np.select(
+        [(systolic > 180) | (diastolic > 120),
+         (systolic >= 140) | (diastolic >= 90),
+         (systolic >= 130) | (diastolic >= 80),
+         systolic >= 120],
+        [4, 3, 2, 1],
+        default=0
+    )
+
+
+def date_number(column, dialect):
+    """SQL expression for a date as the integer YYYYMMDD"""
+    if dialect == 'sqlite':
+        return db.cast(db.func.strftime('%Y%m%d', column), db.Integer)
+    return (db.extract('year', column) * 10000 + db.extract('month', column) * 100
+            + db.extract('day', column))
+
+
+def iter_chunks(start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield float arrays, one row per medical record in [start, end):
+    visit date and birth date as YYYYMMDD, then VITAL_COLUMNS (NaN where missing)
+    """
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+    query = db.select(
+        date_number(MedicalRecord.visit_date, dialect),
+        date_number(Patient.date_of_birth, dialect),
+        *[MedicalRecord.__table__.c[column] for column in VITAL_COLUMNS]
+    ).join_from(MedicalRecord.__table__, Patient.__table__, Patient.id == MedicalRecord.patient_id)
+    if start is not None:
+        query = query.where(MedicalRecord.visit_date >= start)
+    if end is not None:
+        query = query.where(MedicalRecord.visit_date < end)
+
+    # One streamed query (server-side cursor where supported), reduced a chunk at a time
+    result = connection.execute(query.execution_options(stream_results=True, yield_per=chunk_size))
+    for rows in result.partitions(chunk_size):
+        yield np.array([tuple(row) for row in rows], dtype=float)  # None -> NaN
+
+
+class PopulationStats:
+    """Accumulates the statistics of record chunks"""
+
+    def __init__(self):
+        self.records = 0
+        self.bmi_histogram = np.zeros(len(BMI_BIN_EDGES) - 1, dtype=np.int64)
+        self.bmi_categories = np.zeros(len(MedicalRecord.BMI_CATEGORIES) + 1, dtype=np.int64)
+        self.bmi_sum = 0.0
+        self.bp = np.zeros((len(AGE_BANDS), len(BP_CATEGORIES)), dtype=np.int64)
+        self.months = {}  # year * 12 + month - 1 -> [records, abnormal, abnormal per vital...]
+
+    def add(self, data):
+        """Add one chunk from iter_chunks()"""
+        visit, birth = data[:, 0].astype(np.int64), data[:, 1].astype(np.int64)
+        columns = {column: data[:, 2 + i] for i, column in enumerate(VITAL_COLUMNS)}
+        bmi, _, flags = compute_flags(columns)
+        self.records += len(data)
+
+        # BMI
+        measured = bmi[~np.isnan(bmi)]
+        self.bmi_sum += float(measured.sum())
+        clipped = np.clip(measured, BMI_BIN_EDGES[0], BMI_BIN_EDGES[-1] - 1e-9)
+        self.bmi_histogram += np.histogram(clipped, bins=BMI_BIN_EDGES)[0]
+        bounds = [upper_bound for upper_bound, _ in MedicalRecord.BMI_CATEGORIES]
+        self.bmi_categories += np.bincount(np.searchsorted(bounds, measured, side='right'),
+                                           minlength=len(self.bmi_categories))
+
+        # Blood pressure category by age band
+        systolic = columns['blood_pressure_systolic']
+        diastolic = columns['blood_pressure_diastolic']
+        has_bp = ~np.isnan(systolic) & ~np.isnan(diastolic) & (systolic != 0) & (diastolic != 0)
+        ages = (visit[has_bp] - birth[has_bp]) // 10000  # Whole years, as Patient.age
+        bands = np.searchsorted([low for low, _ in AGE_BANDS], ages, side='right') - 1
+        categories = bp_category_index(systolic[has_bp], diastolic[has_bp])
+        self.bp += np.bincount(np.clip(bands, 0, None) * len(BP_CATEGORIES) + categories,
+                               minlength=self.bp.size).reshape(self.bp.shape)
+
+        # Abnormal vitals by month
+        month_keys, inverse = np.unique(visit // 10000 * 12 + visit // 100 % 100 - 1, return_inverse=True)
+        counts = [np.bincount(inverse), np.bincount(inverse, weights=flags != 0)]
+        counts += [np.bincount(inverse, weights=(flags >> bit) & 1) for bit in range(len(MedicalRecord.VITAL_RANGES))]
+        totals = np.column_stack(counts).astype(np.int64)
+        for key, row in zip(month_keys.tolist(), totals):
+            if key in self.months:
+                self.months[key] += row
+            else:
+                self.months[key] = row
+
+    def result(self):
+        """Statistics as plain (JSON serializable) data"""
+        measured = int(self.bmi_categories.sum())
+        bin_labels = [f'{low:g}-{high:g}' for low, high in zip(BMI_BIN_EDGES[:-1], BMI_BIN_EDGES[1:])]
+        bin_labels[0] = f'<{BMI_BIN_EDGES[1]:g}'
+        bin_labels[-1] = f'{BMI_BIN_EDGES[-2]:g}+'
+
+        months = []
+        for key in sorted(self.months):
+            row = self.months[key]
+            months.append({
+                'month': f'{key // 12}-{key % 12 + 1:02d}',
+                'records': int(row[0]),
+                'abnormal': int(row[1]),
+                'rate': round(int(row[1]) / int(row[0]) * 100, 1) if row[0] else 0.0,
+                'by_vital': {column: int(count) for column, count in zip(MedicalRecord.VITAL_RANGES, row[2:])}
+            })
+
+        return {
+            'records': self.records,
+            'bmi': {
+                'measured': measured,
+                'mean': round(self.bmi_sum / measured, 1) if measured else None,
+                'histogram': list(zip(bin_labels, self.bmi_histogram.tolist())),
+                'categories': list(zip([category for _, category in MedicalRecord.BMI_CATEGORIES] + ['Obese'],
+                                       self.bmi_categories.tolist())),
+            },
+            'blood_pressure': {
+                'categories': BP_CATEGORIES,
+                'age_bands': [{'band': label, 'counts': counts}
+                              for (_, label), counts in zip(AGE_BANDS, self.bp.tolist())],
+            },
+            'months': months,
+        }
+
+
+def top_diagnoses(start=None, end=None, limit=TOP_DIAGNOSES):
+    """Most frequent diagnoses (case and surrounding spaces ignored) as [(diagnosis, count)]"""
+    diagnosis = db.func.lower(db.func.trim(MedicalRecord.diagnosis))
+    query = db.session.query(diagnosis, db.func.count()).filter(MedicalRecord.diagnosis.isnot(None))
+    if start is not None:
+        query = query.filter(MedicalRecord.visit_date >= start)
+    if end is not None:
+        query = query.filter(MedicalRecord.visit_date < end)
+    rows = query.group_by(diagnosis).order_by(db.func.count().desc(), diagnosis).limit(limit).all()
+    return [(name, count) for name, count in rows if name]
+
+
+def compute_population_health(start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Statistics of the medical records with start <= visit_date < end"""
+    stats = PopulationStats()
+    for data in iter_chunks(start, end, chunk_size):
+        stats.add(data)
+    result = stats.result()
+    result['top_diagnoses'] = top_diagnoses(start, end)
+    return result
+
+
+def population_health(start_date=None, end_date=None):
+    """
+    Cached statistics for visits from start_date to end_date (dates, inclusive)
+    Returns (result, computed_at)
+    """
+    def compute():
+        start = datetime.combine(start_date, datetime.min.time()) if start_date else None
+        end = datetime.combine(end_date + timedelta(days=1), datetime.min.time()) if end_date else None
+        return compute_population_health(start, end), datetime.utcnow()
+
+    return _cache.get_or_set((start_date, end_date), compute, ttl=current_app.config['ANALYTICS_CACHE_TTL'])
+
+
+def clear_cache():
+    """Drop all cached results"""
+    _cache.clear()
@@ -0,0 +1,132 @@
+"""
+Attachment storage
+Content-addressed file store for medical record attachments.
+
+Uploads are read from the request stream in fixed-size chunks, written to a
+temporary file and hashed (SHA-256) as they go, so no upload is ever held in
+memory. The finished file is renamed to its hash; if that hash is already
+stored the new copy is dropped, which deduplicates repeated lab reports.
+
+Files are laid out as ATTACHMENT_FOLDER/ab/cd/abcd... and are removed only
+when no attachment (live or archived) refers to their hash any more.
+"""
+import hashlib
+import mimetypes
+import os
+import tempfile
+from urllib.parse import quote
+from flask import current_app, send_file, Response
+from werkzeug.utils import secure_filename
+from app import db
+from app.models import Attachment, ArchivedRecord
+from app.medical.thumbnails import discard_derivatives
+
+CHUNK_SIZE = 64 * 1024
+
+
+def allowed_file(filename):
+    """Check the file extension against ALLOWED_EXTENSIONS"""
+    return '.' in filename and \
+        filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
+
+
+def store_stream(stream):
+    """
+    Copy a binary stream into the content store, hashing it on the way.
+    Returns (sha256, size).
+    """
+    folder = current_app.config['ATTACHMENT_FOLDER']
+    temp_folder = os.path.join(folder, 'tmp')
+    os.makedirs(temp_folder, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    handle, temp_path = tempfile.mkstemp(dir=temp_folder)
+    try:
+        with os.fdopen(handle, 'wb') as temp_file:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                temp_file.write(chunk)
+                size += len(chunk)
+
+        sha256 = digest.hexdigest()
+        final_path = os.path.join(folder, Attachment.relative_path(sha256))
+        if os.path.exists(final_path):
+            os.remove(temp_path)  # Same content already stored
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(temp_path, final_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return sha256, size
+
+
+def save_attachment(record, stream, filename, content_type=None, uploaded_by_id=None):
+    """Store an uploaded file and attach it to a medical record"""
+    sha256, size = store_stream(stream)
+    if not content_type or content_type == 'application/octet-stream':
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    attachment = Attachment(
+        medical_record_id=record.id,
+        patient_id=record.patient_id,
+        uploaded_by_id=uploaded_by_id,
+        filename=secure_filename(filename) or 'attachment',
+        content_type=content_type,
+        size=size,
+        sha256=sha256
+    )
+    db.session.add(attachment)
+    db.session.commit()
+    return attachment
+
+
+def release_file(sha256):
+    """Delete a stored file once nothing refers to its hash (call after the rows are deleted)"""
+    if Attachment.query.filter_by(sha256=sha256).first():
+        return False
+    if ArchivedRecord.query.filter_by(sha256=sha256).first():
+        return False
+
+    path = os.path.join(current_app.config['ATTACHMENT_FOLDER'], Attachment.relative_path(sha256))
+    if os.path.exists(path):
+        os.remove(path)
+    discard_derivatives(sha256)
+    return True
+
+
+def send_attachment(attachment):
+    """
+    Response for downloading an attachment.
+    With ATTACHMENT_ACCEL_REDIRECT set, nginx sends the file (X-Accel-Redirect);
+    otherwise send_file handles conditional and range requests, and uses
+    X-Sendfile when USE_X_SENDFILE is enabled.
+    """
+    as_attachment = not attachment.is_inline()
+    accel_prefix = current_app.config.get('ATTACHMENT_ACCEL_REDIRECT')
+
+    if accel_prefix:
+        relative_url = Attachment.relative_path(attachment.sha256).replace(os.sep, '/')
+        response = Response(mimetype=attachment.content_type)
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{relative_url}"
+        disposition = 'attachment' if as_attachment else 'inline'
+        response.headers['Content-Disposition'] = \
+            f"{disposition}; filename*=UTF-8''{quote(attachment.filename)}"
+        response.set_etag(attachment.sha256)
+        return response
+
+    return send_file(
+        attachment.path,
+        mimetype=attachment.content_type,
+        as_attachment=as_attachment,
+        download_name=attachment.filename,
+        conditional=True,
+        etag=attachment.sha256,
+        max_age=3600
+    )
@@ -0,0 +1,94 @@
+"""
+Vital flags backfill
+Computes bmi_value, bmi_category and abnormal_flags for existing medical
+records in chunks, vectorized with NumPy over column arrays.
+
+New and edited records get these columns from MedicalRecord.compute_vital_flags();
+the thresholds come from MedicalRecord.VITAL_RANGES / BMI_CATEGORIES so both
+paths agree.
+"""
+import numpy as np
+from sqlalchemy import bindparam
+from app import db
+from app.models import MedicalRecord
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def compute_flags(columns):
+    """
+    Vectorized equivalent of MedicalRecord.compute_vital_flags().
+    `columns` maps column name -> float array (NaN where the value is missing).
+    Returns (bmi, bmi_category, abnormal_flags) arrays.
+    """
+    length = len(next(iter(columns.values())))
+    flags = np.zeros(length, dtype=np.int64)
+
+    with np.errstate(invalid='ignore'):
+        for bit, (column, (low, high)) in enumerate(MedicalRecord.VITAL_RANGES.items()):
+            values = columns[column]
+            # Missing and zero values count as "not recorded", as in has_abnormal_vitals()
+            recorded = ~np.isnan(values) & (values != 0)
+            abnormal = np.zeros(length, dtype=bool)
+            if low is not None:
+                abnormal |= values < low
+            if high is not None:
+                abnormal |= values > high
+            flags |= (recorded & abnormal).astype(np.int64) << bit
+
+        weight = columns['weight']
+        height = columns['height']
+        measured = ~np.isnan(weight) & ~np.isnan(height) & (weight != 0) & (height != 0)
+        bmi = np.full(length, np.nan)
+        bmi[measured] = np.round(weight[measured] / (height[measured] / 100) ** 2, 2)
+
+    bounds = [upper_bound for upper_bound, _ in MedicalRecord.BMI_CATEGORIES]
+    labels = np.array([category for _, category in MedicalRecord.BMI_CATEGORIES] + ['Obese'], dtype=object)
+    category = labels[np.searchsorted(bounds, np.nan_to_num(bmi), side='right')]
+    category[~measured] = None
+
+    return bmi, category, flags
+
+
+def backfill_vital_flags(chunk_size=DEFAULT_CHUNK_SIZE, only_missing=True):
+    """
+    Compute the derived vital columns for existing records, one committed chunk at a time.
+    Returns the number of records updated.
+    """
+    column_names = list(MedicalRecord.VITAL_RANGES) + ['weight', 'height']
+    table = MedicalRecord.__table__
+    statement = table.update().where(table.c.id == bindparam('record_id')).values(
+        bmi_value=bindparam('bmi'),
+        bmi_category=bindparam('category'),
+        abnormal_flags=bindparam('flags'),
+        updated_at=table.c.updated_at  # Derived data: leave the edit timestamp alone
+    )
+
+    last_id = 0
+    total = 0
+    while True:
+        query = db.session.query(MedicalRecord.id, *[getattr(MedicalRecord, name) for name in column_names]) \
+            .filter(MedicalRecord.id > last_id)
+        if only_missing:
+            query = query.filter(MedicalRecord.abnormal_flags.is_(None))
+        rows = query.order_by(MedicalRecord.id).limit(chunk_size).all()
+        if not rows:
+            return total
+
+        ids = [row[0] for row in rows]
+        data = np.array([row[1:] for row in rows], dtype=float)  # None -> NaN
+        bmi, category, flags = compute_flags({name: data[:, i] for i, name in enumerate(column_names)})
+
+        db.session.execute(statement, [
+            {
+                'record_id': record_id,
+                'bmi': None if np.isnan(bmi_value) else float(bmi_value),
+                'category': category_value,
+                'flags': int(flag_value)
+            }
+            for record_id, bmi_value, category_value, flag_value in zip(ids, bmi, category, flags)
+        ])
+        db.session.commit()
+
+        last_id = ids[-1]
+        total += len(ids)
@@ -0,0 +1,162 @@
+"""
+Follow-up worklist
+Lists medical records that asked for a follow-up, grouped by due date, and
+schedules the missing follow-up appointments in bulk.
+
+A follow-up counts as scheduled when the patient has an upcoming
+(scheduled or confirmed) appointment. That check is a correlated EXISTS in
+the same query as the worklist, so filtering on "not scheduled" is an
+anti-join rather than one lookup per row.
+"""
+from datetime import datetime, time, timedelta
+from app import db
+from app.models import MedicalRecord, Appointment, Patient
+
+BUCKETS = ('overdue', 'this_week', 'later', 'all')
+ACTIVE_APPOINTMENT_STATUSES = ('scheduled', 'confirmed')
+BOOKED_STATUSES = ('scheduled', 'confirmed', 'in_progress')  # Statuses Appointment.get_schedule_conflicts() checks
+DEFAULT_START_TIME = time(9, 0)
+DEFAULT_DURATION = 30
+
+
+def upcoming_appointment_exists(now=None):
+    """Correlated EXISTS: the record's patient has an upcoming appointment"""
+    return db.session.query(Appointment.id).filter(
+        Appointment.patient_id == MedicalRecord.patient_id,
+        Appointment.appointment_date >= (now or datetime.utcnow()),
+        Appointment.status.in_(ACTIVE_APPOINTMENT_STATUSES)
+    ).exists()
+
+
+def _bucket_filter(bucket, today):
+    week_end = today + timedelta(days=7)
+    if bucket == 'overdue':
+        return MedicalRecord.follow_up_date < today
+    if bucket == 'this_week':
+        return MedicalRecord.follow_up_date.between(today, week_end - timedelta(days=1))
+    if bucket == 'later':
+        return MedicalRecord.follow_up_date >= week_end
+    return None
+
+
+def follow_up_query(bucket='all', scheduled=None, today=None):
+    """
+    Query (MedicalRecord, is_scheduled) rows ordered by follow-up date.
+    `scheduled`: True/False keeps only follow-ups with/without an upcoming appointment.
+    Uses the (follow_up_required, follow_up_date) index.
+    """
+    today = today or datetime.utcnow().date()
+    is_scheduled = upcoming_appointment_exists()
+
+    query = db.session.query(MedicalRecord, is_scheduled.label('is_scheduled')) \
+        .join(Patient, Patient.id == MedicalRecord.patient_id) \
+        .options(db.contains_eager(MedicalRecord.patient)) \
+        .filter(
+            MedicalRecord.follow_up_required == db.true(),
+            MedicalRecord.follow_up_date.isnot(None),
+            Patient.is_active == db.true()
+        )
+
+    condition = _bucket_filter(bucket, today)
+    if condition is not None:
+        query = query.filter(condition)
+    if scheduled is True:
+        query = query.filter(is_scheduled)
+    elif scheduled is False:
+        query = query.filter(~is_scheduled)
+
+    return query.order_by(MedicalRecord.follow_up_date, MedicalRecord.id)
+
+
+def bucket_counts(today=None):
+    """Pending follow-up counts per bucket in one aggregate query"""
+    today = today or datetime.utcnow().date()
+    week_end = today + timedelta(days=7)
+    due = MedicalRecord.follow_up_date
+
+    row = db.session.query(
+        db.func.count(MedicalRecord.id),
+        db.func.sum(db.case((due < today, 1), else_=0)),
+        db.func.sum(db.case((db.and_(due >= today, due < week_end), 1), else_=0)),
+        db.func.sum(db.case((~upcoming_appointment_exists(), 1), else_=0))
+    ).join(Patient, Patient.id == MedicalRecord.patient_id).filter(
+        MedicalRecord.follow_up_required == db.true(),
+        due.isnot(None),
+        Patient.is_active == db.true()
+    ).one()
+
+    total, overdue, this_week, unscheduled = (value or 0 for value in row)
+    return {
+        'all': total,
+        'overdue': overdue,
+        'this_week': this_week,
+        'later': total - overdue - this_week,
+        'unscheduled': unscheduled
+    }
+
+
+def _booked_intervals(day):
+    """(start, end) of the appointments booked on a day, in one query"""
+    day_start = datetime.combine(day, time.min)
+    rows = db.session.query(Appointment.appointment_date, Appointment.duration_minutes).filter(
+        Appointment.status.in_(BOOKED_STATUSES),
+        Appointment.appointment_date >= day_start,
+        Appointment.appointment_date < day_start + timedelta(days=1)
+    )
+    return [(start, start + timedelta(minutes=duration)) for start, duration in rows]
+
+
+def _first_free_slot(booked, start, duration):
+    """Earliest start at or after `start` whose `duration` overlaps none of the booked intervals"""
+    while True:
+        end = start + duration
+        overlap_ends = [booked_end for booked_start, booked_end in booked if booked_start < end and booked_end > start]
+        if not overlap_ends:
+            return start
+        start = max(overlap_ends)
+
+
+def schedule_follow_ups(record_ids, created_by_id, start_time=DEFAULT_START_TIME,
+                        duration_minutes=DEFAULT_DURATION):
+    """
+    Create follow-up appointments for the given records that are still unscheduled.
+    Each appointment goes on the follow-up date (tomorrow for overdue ones), in the
+    first slot from `start_time` that is free of that day's booked appointments,
+    including the ones created by earlier calls.
+    Returns the created appointments.
+    """
+    if not record_ids:
+        return []
+
+    rows = follow_up_query(scheduled=False).filter(MedicalRecord.id.in_(record_ids)).all()
+    tomorrow = datetime.utcnow().date() + timedelta(days=1)
+    duration = timedelta(minutes=duration_minutes)
+    booked = {}  # day -> booked (start, end) intervals, including the appointments created here
+    appointments = []
+    scheduled_patients = set()
+
+    for record, _ in rows:
+        # One follow-up appointment per patient, even with several pending records
+        if record.patient_id in scheduled_patients:
+            continue
+        scheduled_patients.add(record.patient_id)
+
+        day = max(record.follow_up_date, tomorrow)
+        if day not in booked:
+            booked[day] = _booked_intervals(day)
+        slot = _first_free_slot(booked[day], datetime.combine(day, start_time), duration)
+        booked[day].append((slot, slot + duration))
+
+        appointments.append(Appointment(
+            patient_id=record.patient_id,
+            created_by_id=created_by_id,
+            appointment_date=slot,
+            duration_minutes=duration_minutes,
+            appointment_type='follow_up',
+            reason=f'Follow-up: {record.visit_reason}'[:256],
+            notes=record.follow_up_notes
+        ))
+
+    db.session.add_all(appointments)
+    db.session.commit()
+    return appointments
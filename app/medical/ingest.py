@@ -0,0 +1,183 @@
+"""
+Vitals ingestion
+Bulk intake of vital sign readings pushed by bedside devices as NDJSON.
+
+Each input line is one reading of one patient at one time:
+    {"patient_id": 12, "ts": "2026-01-05T08:30:00Z", "heart_rate": 88, "oxygen_saturation": 97, "ref": "m1-0042"}
+Metric keys are the VitalReading metric names; "ts" defaults to now and
+"ref" is echoed back. Values outside physiologically plausible ranges are
+rejected; accepted values outside the MedicalRecord.VITAL_RANGES normal
+ranges (the has_abnormal_vitals() thresholds) are reported as abnormal.
+
+Accepted readings go to the vital readings series (medical_record_id NULL)
+with one multi-row insert and one commit per batch. Every line gets an
+acknowledgement, returned in input order once the batch it belongs to is
+committed.
+"""
+import json
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import insert
+from app import db
+from app.models import MedicalRecord, Patient, VitalReading
+
+BATCH_SIZE = 1000
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+# Values a device can plausibly report: metric -> (min, max)
+PLAUSIBLE_RANGES = {
+    'temperature': (25.0, 45.0),  # °C
+    'bp_systolic': (40, 300),  # mmHg
+    'bp_diastolic': (20, 200),  # mmHg
+    'heart_rate': (20, 300),  # BPM
+    'respiratory_rate': (2, 80),  # breaths/min
+    'oxygen_saturation': (40, 100),  # %
+    'weight': (0.3, 500),  # kg
+    'height': (20, 260),  # cm
+}
+
+
+def is_abnormal(metric, value):
+    """Whether a value is outside the normal range used by MedicalRecord.has_abnormal_vitals()"""
+    column = VitalReading.METRICS[metric]
+    if column not in MedicalRecord.VITAL_RANGES:
+        return False
+    low, high = MedicalRecord.VITAL_RANGES[column]
+    return (low is not None and value < low) or (high is not None and value > high)
+
+
+def parse_line(line, now):
+    """
+    Validate one NDJSON line.
+    Returns (patient_id, ts, {metric: value}, ref); raises ValueError with the reason.
+    """
+    try:
+        data = json.loads(line)
+    except ValueError:
+        raise ValueError('invalid JSON')
+    if not isinstance(data, dict):
+        raise ValueError('expected a JSON object')
+
+    patient_id = data.get('patient_id')
+    if not isinstance(patient_id, int) or isinstance(patient_id, bool):
+        raise ValueError('patient_id must be an integer')
+
+    ts = now
+    if data.get('ts') is not None:
+        try:
+            ts = datetime.fromisoformat(str(data['ts']))
+        except ValueError:
+            raise ValueError('ts must be an ISO 8601 timestamp')
+        if ts.tzinfo is not None:
+            ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+        if ts > now + MAX_CLOCK_SKEW:
+            raise ValueError('ts is in the future')
+
+    values = {}
+    for metric, (low, high) in PLAUSIBLE_RANGES.items():
+        if data.get(metric) is None:
+            continue
+        value = data[metric]
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise ValueError(f'{metric} must be a number')
+        if not low <= value <= high:
+            raise ValueError(f'{metric} {value} is outside the plausible range {low}-{high}')
+        values[metric] = float(value)
+
+    unknown = set(data) - set(PLAUSIBLE_RANGES) - {'patient_id', 'ts', 'ref'}
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+    if not values:
+        raise ValueError('no vital sign values')
+
+    return patient_id, ts, values, data.get('ref')
+
+
+class VitalsIngest:
+    """Validates lines and stores accepted readings in committed batches"""
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.known_patients = set()
+        self.acks = []
+        self.accepted = 0
+        self.rejected = 0
+        self._pending = []  # (ack, rows) of the current batch
+
+    def _ack(self, line_number, ref, **fields):
+        ack = {'line': line_number, **fields}
+        if ref is not None:
+            ack['ref'] = ref
+        return ack
+
+    def add(self, line_number, line, now):
+        """Process one input line"""
+        try:
+            patient_id, ts, values, ref = parse_line(line, now)
+        except ValueError as error:
+            self.acks.append(self._ack(line_number, None, status='error', error=str(error)))
+            self.rejected += 1
+            return
+
+        ack = self._ack(line_number, ref, status='ok',
+                        abnormal=[metric for metric, value in values.items() if is_abnormal(metric, value)])
+        rows = [{'patient_id': patient_id, 'medical_record_id': None, 'metric': metric, 'ts': ts, 'value': value}
+                for metric, value in values.items()]
+        self.acks.append(ack)
+        self._pending.append((ack, rows))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Insert and commit the current batch"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+
+        # One lookup per batch for patients not seen yet
+        patient_ids = {rows[0]['patient_id'] for _, rows in pending} - self.known_patients
+        if patient_ids:
+            self.known_patients.update(
+                patient_id for (patient_id,) in
+                db.session.query(Patient.id).filter(Patient.id.in_(patient_ids), Patient.is_active == db.true())
+            )
+
+        rows = []
+        stored = []
+        for ack, reading_rows in pending:
+            if reading_rows[0]['patient_id'] not in self.known_patients:
+                ack.update(status='error', error='unknown patient')
+                ack.pop('abnormal', None)
+                self.rejected += 1
+                continue
+            rows.extend(reading_rows)
+            stored.append(ack)
+
+        if not rows:
+            return
+        try:
+            db.session.execute(insert(VitalReading.__table__), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Vitals ingestion batch of %d readings failed', len(rows))
+            for ack in stored:
+                ack.update(status='error', error='storage failed, retry')
+                ack.pop('abnormal', None)
+            self.rejected += len(stored)
+            return
+        self.accepted += len(stored)
+
+
+def ingest_lines(lines, batch_size=BATCH_SIZE):
+    """Ingest an iterable of NDJSON lines (bytes or str). Returns the VitalsIngest with acks."""
+    ingest = VitalsIngest(batch_size)
+    now = datetime.utcnow()
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        if not line.strip():
+            continue
+        ingest.add(line_number, line, now)
+    ingest.flush()
+    return ingest
@@ -1,9 +1,27 @@
-from flask import render_template, redirect, url_for, flash, request
+from flask import render_template, redirect, url_for, flash, request, jsonify, abort, current_app, send_file, Response
 from flask_login import login_required, current_user
 from app.medical import medical_bp
-from app.models import MedicalRecord, Patient
+from app.medical.vitals import load_series, DEFAULT_POINTS
+from app.medical.follow_ups import BUCKETS, follow_up_query, bucket_counts, schedule_follow_ups
+from app.medical.attachments import allowed_file, save_attachment, release_file, send_attachment
+from app.medical import thumbnails
+from app.medical.search import search_records
+from app.medical.ingest import ingest_lines
+from app.medical.analytics import population_health
+from app.models import MedicalRecord, Patient, VitalReading, Attachment, MedicalRecordRevision, DeviceToken
 from app import db
-from datetime import datetime
+from datetime import datetime, timedelta
+from urllib.parse import unquote
+import json
+
+# Shown while a thumbnail is being generated
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="200" height="150" viewBox="0 0 200 150">'
+    '<rect width="200" height="150" fill="#e9ecef"/>'
+    '<text x="100" y="80" font-family="sans-serif" font-size="14" fill="#6c757d" text-anchor="middle">'
+    'Loading preview...</text></svg>'
+)
+NO_PREVIEW_SVG = PLACEHOLDER_SVG.replace('Loading preview...', 'No preview')
 
 
 @medical_bp.route('/patient/<int:patient_id>')
@@ -20,12 +38,148 @@ def patient_records(patient_id):
     return render_template('medical/patient_records.html', patient=patient, records=records)
 
 
+@medical_bp.route('/alerts')
+@login_required
+def alerts():
+    """Clinic-wide worklist of recent visits with abnormal vital signs"""
+    page = request.args.get('page', 1, type=int)
+    days = request.args.get('days', 30, type=int)
+
+    # abnormal_flags is computed on write; the partial index on visit_date holds only flagged records
+    query = MedicalRecord.query.options(db.joinedload(MedicalRecord.patient)).filter(
+        MedicalRecord.abnormal_flags > 0
+    )
+    if days > 0:
+        query = query.filter(MedicalRecord.visit_date >= datetime.utcnow() - timedelta(days=days))
+
+    records = query.order_by(MedicalRecord.visit_date.desc()).paginate(page=page, per_page=25, error_out=False)
+
+    return render_template('medical/alerts.html', records=records, days=days)
+
+
+@medical_bp.route('/follow-ups')
+@login_required
+def follow_ups():
+    """Worklist of pending follow-ups: overdue, due this week, later"""
+    page = request.args.get('page', 1, type=int)
+    bucket = request.args.get('bucket', 'overdue')
+    if bucket not in BUCKETS:
+        bucket = 'overdue'
+    scheduled = {'yes': True, 'no': False}.get(request.args.get('scheduled'))
+
+    rows = follow_up_query(bucket=bucket, scheduled=scheduled).paginate(page=page, per_page=25, error_out=False)
+
+    return render_template('medical/follow_ups.html',
+                           rows=rows,
+                           counts=bucket_counts(),
+                           bucket=bucket,
+                           scheduled=request.args.get('scheduled', ''))
+
+
+@medical_bp.route('/follow-ups/schedule', methods=['POST'])
+@login_required
+def schedule_follow_up_appointments():
+    """Create follow-up appointments for the selected records"""
+    record_ids = request.form.getlist('record_ids', type=int)
+    if not record_ids:
+        flash('Select at least one follow-up to schedule.', 'warning')
+    else:
+        appointments = schedule_follow_ups(record_ids, created_by_id=current_user.id)
+        if appointments:
+            flash(f'{len(appointments)} follow-up appointments created.', 'success')
+        else:
+            flash('The selected follow-ups already have upcoming appointments.', 'info')
+
+    return redirect(url_for('medical.follow_ups',
+                            bucket=request.form.get('bucket', 'overdue'),
+                            scheduled=request.form.get('scheduled') or None))
+
+
+@medical_bp.route('/analytics')
+@login_required
+def analytics():
+    """Population health statistics for a date range (defaults to the last 12 months)"""
+    today = datetime.utcnow().date()
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') \
+            else today - timedelta(days=365)
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else today
+    except ValueError:
+        flash('Invalid date filter.', 'warning')
+        start, end = today - timedelta(days=365), today
+
+    stats, computed_at = population_health(start, end)
+
+    if request.args.get('format') == 'json':
+        return jsonify({'start': start.isoformat(), 'end': end.isoformat(),
+                        'computed_at': computed_at.isoformat(), **stats})
+
+    return render_template('medical/analytics.html', stats=stats, start=start, end=end, computed_at=computed_at)
+
+
+@medical_bp.route('/search')
+@login_required
+def search():
+    """Full-text search over diagnosis, symptoms, treatment, prescriptions, lab results and notes"""
+    query = request.args.get('q', '').strip()
+    patient_id = request.args.get('patient_id', type=int)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = 20
+
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d') if request.args.get('start') else None
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d') + timedelta(days=1) if request.args.get('end') else None
+    except ValueError:
+        flash('Invalid date filter.', 'warning')
+        start = end = None
+
+    results = []
+    if query:
+        # One extra row tells whether there is a next page
+        results = search_records(query, patient_id=patient_id, start=start, end=end,
+                                 limit=per_page + 1, offset=(page - 1) * per_page)
+
+    return render_template('medical/search.html',
+                           query=query,
+                           results=results[:per_page],
+                           has_next=len(results) > per_page,
+                           page=page,
+                           patient=Patient.query.get(patient_id) if patient_id else None)
+
+
 @medical_bp.route('/view/<int:record_id>')
 @login_required
 def view(record_id):
     """View a specific medical record"""
     record = MedicalRecord.query.get_or_404(record_id)
-    return render_template('medical/view.html', record=record)
+    return render_template('medical/view.html', record=record, image_types=thumbnails.IMAGE_TYPES)
+
+
+@medical_bp.route('/history/<int:record_id>')
+@login_required
+def history(record_id):
+    """Revision history of a medical record, optionally showing it as it was at a point in time"""
+    revisions = MedicalRecordRevision.history(record_id)
+    record = MedicalRecord.query.get(record_id)
+    if record is None and not revisions:
+        abort(404)
+
+    snapshot = None
+    at = None
+    if request.args.get('at'):
+        try:
+            at = datetime.fromisoformat(request.args['at'])
+        except ValueError:
+            abort(400)
+        snapshot = MedicalRecordRevision.reconstruct(record_id, at)
+
+    return render_template('medical/history.html',
+                           record_id=record_id,
+                           record=record,
+                           revisions=list(reversed(revisions)),
+                           snapshot=snapshot,
+                           at=at,
+                           fields=MedicalRecordRevision.tracked_fields())
 
 
 @medical_bp.route('/create/<int:patient_id>', methods=['GET', 'POST'])
@@ -127,9 +281,166 @@ def delete(record_id):
 
     record = MedicalRecord.query.get_or_404(record_id)
     patient_id = record.patient_id
+    attachment_hashes = {attachment.sha256 for attachment in record.attachments}
 
     db.session.delete(record)
     db.session.commit()
 
+    for sha256 in attachment_hashes:
+        release_file(sha256)
+
     flash('Medical record deleted successfully.', 'success')
     return redirect(url_for('medical.patient_records', patient_id=patient_id))
+
+
+@medical_bp.route('/<int:record_id>/attachments', methods=['POST'])
+@login_required
+def upload_attachment(record_id):
+    """
+    Attach a file to a medical record
+    Accepts a multipart form (field 'file') or the raw file as the request body
+    with its name in the X-Filename header; the body is streamed to disk
+    """
+    record = MedicalRecord.query.get_or_404(record_id)
+    request.max_content_length = current_app.config['ATTACHMENT_MAX_SIZE']
+
+    if request.mimetype == 'multipart/form-data':
+        file = request.files.get('file')
+        if not file or not file.filename:
+            flash('Please choose a file to upload.', 'danger')
+            return redirect(url_for('medical.view', record_id=record.id))
+        filename, content_type, stream = file.filename, file.mimetype, file.stream
+    else:
+        filename = unquote(request.headers.get('X-Filename', ''))
+        content_type, stream = request.mimetype, request.stream
+        if not filename:
+            abort(400)
+
+    if not allowed_file(filename):
+        if request.mimetype != 'multipart/form-data':
+            abort(415)
+        flash('This file type is not allowed.', 'danger')
+        return redirect(url_for('medical.view', record_id=record.id))
+
+    attachment = save_attachment(record, stream, filename, content_type, uploaded_by_id=current_user.id)
+
+    if request.mimetype != 'multipart/form-data':
+        return jsonify({
+            'id': attachment.id,
+            'filename': attachment.filename,
+            'size': attachment.size,
+            'sha256': attachment.sha256,
+            'url': url_for('medical.download_attachment', attachment_id=attachment.id)
+        }), 201
+
+    flash('File attached successfully.', 'success')
+    return redirect(url_for('medical.view', record_id=record.id))
+
+
+@medical_bp.route('/attachments/<int:attachment_id>')
+@login_required
+def download_attachment(attachment_id):
+    """Download or display an attachment (supports range requests)"""
+    attachment = Attachment.query.get_or_404(attachment_id)
+    return send_attachment(attachment)
+
+
+@medical_bp.route('/attachments/<int:attachment_id>/<any(thumb, preview):size>')
+@login_required
+def attachment_image(attachment_id, size):
+    """
+    Scaled image of an attachment
+    Returns a placeholder (202) while the image is generated in the background,
+    and a "no preview" image (404) when it cannot be rendered
+    """
+    attachment = Attachment.query.get_or_404(attachment_id)
+    if not thumbnails.supports(attachment):
+        abort(404)
+
+    try:
+        path = thumbnails.get_derivative(attachment, size)
+    except thumbnails.RenderFailed:
+        response = Response(NO_PREVIEW_SVG, status=404, mimetype='image/svg+xml')
+        response.headers['Cache-Control'] = 'private, max-age=3600'
+        return response
+    if path is None:
+        response = Response(PLACEHOLDER_SVG, status=202, mimetype='image/svg+xml')
+        response.headers['Cache-Control'] = 'no-store'
+        response.headers['Retry-After'] = '2'
+        return response
+
+    return send_file(path, mimetype='image/jpeg', conditional=True,
+                     etag=f'{attachment.sha256}-{size}', max_age=86400)
+
+
+@medical_bp.route('/attachments/<int:attachment_id>/delete', methods=['POST'])
+@login_required
+def delete_attachment(attachment_id):
+    """Remove an attachment from a medical record"""
+    attachment = Attachment.query.get_or_404(attachment_id)
+    record_id = attachment.medical_record_id
+
+    if not current_user.is_admin() and not current_user.is_doctor():
+        flash('Only administrators and doctors can delete attachments.', 'danger')
+        return redirect(url_for('medical.view', record_id=record_id))
+
+    sha256 = attachment.sha256
+    db.session.delete(attachment)
+    db.session.commit()
+    release_file(sha256)
+
+    flash('Attachment deleted.', 'success')
+    return redirect(url_for('medical.view', record_id=record_id))
+
+
+@medical_bp.route('/api/vitals/<int:patient_id>')
+@login_required
+def api_vitals(patient_id):
+    """API endpoint for vital sign trend charts"""
+    Patient.query.get_or_404(patient_id)
+
+    metrics = request.args.getlist('metric') or list(VitalReading.METRICS)
+    if any(metric not in VitalReading.METRICS for metric in metrics):
+        abort(400)
+
+    try:
+        start = datetime.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        abort(400)
+
+    # points: chart width in pixels (one point per pixel is enough)
+    series = load_series(
+        patient_id,
+        metrics=metrics,
+        start=start,
+        end=end,
+        points=request.args.get('points', DEFAULT_POINTS, type=int)
+    )
+
+    return jsonify({'patient_id': patient_id, 'series': series})
+
+
+@medical_bp.route('/api/vitals/ingest', methods=['POST'])
+def ingest_vitals():
+    """
+    NDJSON vital sign ingestion for bedside devices
+    Authenticated by a logged-in session or an `Authorization: Bearer <device token>` header;
+    responds with one NDJSON acknowledgement per input line
+    """
+    if not current_user.is_authenticated:
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        device = DeviceToken.authenticate(token.strip()) if scheme.lower() == 'bearer' else None
+        if device is None:
+            return jsonify({'error': 'authentication required'}), 401
+        device.last_used_at = datetime.utcnow()
+        db.session.commit()
+
+    # The whole body is read before responding: acks are only sent for committed batches
+    result = ingest_lines(request.stream)
+
+    body = ''.join(json.dumps(ack, separators=(',', ':')) + '\n' for ack in result.acks)
+    response = Response(body, mimetype='application/x-ndjson')
+    response.headers['X-Ingest-Accepted'] = str(result.accepted)
+    response.headers['X-Ingest-Rejected'] = str(result.rejected)
+    return response
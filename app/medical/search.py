@@ -0,0 +1,225 @@
+"""
+Medical record search
+Full-text index over the narrative fields of medical records.
+
+The index is a side table keyed by medical record id:
+- SQLite: FTS5 table medical_records_fts, one column per field, porter
+  stemming on a diacritic-insensitive tokenizer, ranked with bm25().
+- PostgreSQL: medical_records_search(record_id, document tsvector) with a
+  GIN index. Documents are stemmed with every SEARCH_LANGUAGES config and
+  queries are matched against each of them, so Spanish and English word
+  forms both hit.
+
+Rows are written by mapper events on MedicalRecord; records removed with
+Core deletes (patient archive) must call remove_records(). `flask
+rebuild-search-index` rebuilds the whole index.
+"""
+import re
+from markupsafe import escape, Markup
+from sqlalchemy import event, inspect, text
+from app import db
+from app.models import MedicalRecord
+
+SEARCH_FIELDS = ['diagnosis', 'symptoms', 'treatment', 'prescription', 'lab_results', 'doctor_notes']
+SEARCH_LANGUAGES = ('spanish', 'english')  # PostgreSQL text search configurations
+SNIPPET_START = '\x02'  # Highlight markers, replaced by <mark> after escaping
+SNIPPET_END = '\x03'
+DEFAULT_LIMIT = 20
+
+# bm25 weights per field (SQLite); PostgreSQL uses the equivalent setweight() labels
+FIELD_WEIGHTS = {'diagnosis': 4.0, 'symptoms': 2.0, 'treatment': 2.0, 'prescription': 2.0,
+                 'lab_results': 1.0, 'doctor_notes': 1.0}
+FIELD_LABELS = {4.0: 'A', 2.0: 'B', 1.0: 'C'}
+
+
+def _dialect(connection):
+    return connection.dialect.name
+
+
+def _document_sql():
+    """PostgreSQL expression building the tsvector of a medical_records row"""
+    parts = []
+    for field in SEARCH_FIELDS:
+        for language in SEARCH_LANGUAGES:
+            parts.append(f"setweight(to_tsvector('{language}', coalesce({field}, '')), "
+                         f"'{FIELD_LABELS[FIELD_WEIGHTS[field]]}')")
+    return ' || '.join(parts)
+
+
+def ensure_search_index():
+    """Create the index table if missing, filling it from the existing records"""
+    with db.engine.begin() as connection:
+        dialect = _dialect(connection)
+        if dialect == 'sqlite':
+            if inspect(connection).has_table('medical_records_fts'):
+                return
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE medical_records_fts USING fts5({', '.join(SEARCH_FIELDS)}, "
+                f"tokenize = 'porter unicode61 remove_diacritics 2')"
+            ))
+        elif dialect == 'postgresql':
+            if inspect(connection).has_table('medical_records_search'):
+                return
+            connection.execute(text(
+                'CREATE TABLE medical_records_search ('
+                'record_id INTEGER PRIMARY KEY REFERENCES medical_records(id) ON DELETE CASCADE, '
+                'document TSVECTOR NOT NULL)'
+            ))
+            connection.execute(text(
+                'CREATE INDEX ix_medical_records_search_document ON medical_records_search USING gin (document)'
+            ))
+        else:
+            return
+    rebuild_search_index()
+
+
+def index_records(connection, record_ids):
+    """(Re)index the given medical records from their stored values"""
+    if not record_ids:
+        return
+    dialect = _dialect(connection)
+    ids = {'ids': list(record_ids)}
+    if dialect == 'sqlite':
+        remove_records(connection, record_ids)
+        connection.execute(text(
+            f"INSERT INTO medical_records_fts(rowid, {', '.join(SEARCH_FIELDS)}) "
+            f"SELECT id, {', '.join(SEARCH_FIELDS)} FROM medical_records WHERE id IN :ids"
+        ).bindparams(db.bindparam('ids', expanding=True)), ids)
+    elif dialect == 'postgresql':
+        connection.execute(text(
+            f"INSERT INTO medical_records_search(record_id, document) "
+            f"SELECT id, {_document_sql()} FROM medical_records WHERE id IN :ids "
+            f"ON CONFLICT (record_id) DO UPDATE SET document = EXCLUDED.document"
+        ).bindparams(db.bindparam('ids', expanding=True)), ids)
+
+
+def remove_records(connection, record_ids):
+    """Drop medical records from the index"""
+    if not record_ids:
+        return
+    dialect = _dialect(connection)
+    table, key = {'sqlite': ('medical_records_fts', 'rowid'),
+                  'postgresql': ('medical_records_search', 'record_id')}.get(dialect, (None, None))
+    if table:
+        connection.execute(text(f'DELETE FROM {table} WHERE {key} IN :ids')
+                           .bindparams(db.bindparam('ids', expanding=True)), {'ids': list(record_ids)})
+
+
+def rebuild_search_index():
+    """Reindex every medical record. Returns the number of indexed records."""
+    with db.engine.begin() as connection:
+        dialect = _dialect(connection)
+        if dialect == 'sqlite':
+            connection.execute(text('DELETE FROM medical_records_fts'))
+            connection.execute(text(
+                f"INSERT INTO medical_records_fts(rowid, {', '.join(SEARCH_FIELDS)}) "
+                f"SELECT id, {', '.join(SEARCH_FIELDS)} FROM medical_records"
+            ))
+        elif dialect == 'postgresql':
+            connection.execute(text('DELETE FROM medical_records_search'))
+            connection.execute(text(
+                f"INSERT INTO medical_records_search(record_id, document) "
+                f"SELECT id, {_document_sql()} FROM medical_records"
+            ))
+        return connection.execute(text('SELECT count(*) FROM medical_records')).scalar()
+
+
+def build_match_query(query):
+    """
+    Turn user input into an FTS5 MATCH expression: every word must match,
+    "quoted phrases" are kept, a trailing * searches by prefix
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+        if phrase:
+            words = re.findall(r'\w+', phrase)
+            if words:
+                terms.append('"' + ' '.join(words) + '"')
+        else:
+            prefix = word.endswith('*')
+            for part in re.findall(r'\w+', word):
+                terms.append(f'"{part}"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+
+def _markup(snippet):
+    """Escape a snippet and turn the highlight markers into <mark> tags"""
+    return Markup(str(escape(snippet or ''))
+                  .replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>'))
+
+
+def search_records(query, patient_id=None, start=None, end=None, limit=DEFAULT_LIMIT, offset=0):
+    """
+    Ranked search over medical record narratives.
+    Returns a list of (MedicalRecord, snippet) pairs, best match first.
+    """
+    connection = db.session.connection()
+    dialect = _dialect(connection)
+    filters = []
+    params = {'limit': limit, 'offset': offset}
+    if patient_id:
+        filters.append('mr.patient_id = :patient_id')
+        params['patient_id'] = patient_id
+    if start:
+        filters.append('mr.visit_date >= :start')
+        params['start'] = start
+    if end:
+        filters.append('mr.visit_date < :end')
+        params['end'] = end
+    where = ''.join(f' AND {condition}' for condition in filters)
+
+    if dialect == 'sqlite':
+        match = build_match_query(query)
+        if not match:
+            return []
+        params['match'] = match
+        weights = ', '.join(str(FIELD_WEIGHTS[field]) for field in SEARCH_FIELDS)
+        rows = connection.execute(text(
+            f"SELECT mr.id, snippet(medical_records_fts, -1, :mark_start, :mark_end, '...', 16) "
+            f"FROM medical_records_fts JOIN medical_records mr ON mr.id = medical_records_fts.rowid "
+            f"WHERE medical_records_fts MATCH :match{where} "
+            f"ORDER BY bm25(medical_records_fts, {weights}) LIMIT :limit OFFSET :offset"
+        ), dict(params, mark_start=SNIPPET_START, mark_end=SNIPPET_END)).all()
+    elif dialect == 'postgresql':
+        if not query.strip():
+            return []
+        params['query'] = query
+        tsquery = ' || '.join(f"websearch_to_tsquery('{language}', :query)" for language in SEARCH_LANGUAGES)
+        narrative = " || ' ... ' || ".join(f"coalesce(mr.{field}, '')" for field in SEARCH_FIELDS)
+        # Headlines are computed only for the page of results, after ranking
+        rows = connection.execute(text(
+            f"WITH q AS (SELECT ({tsquery}) AS query), "
+            f"ranked AS (SELECT s.record_id, ts_rank_cd(s.document, q.query) AS rank "
+            f"FROM medical_records_search s JOIN medical_records mr ON mr.id = s.record_id, q "
+            f"WHERE s.document @@ q.query{where} ORDER BY rank DESC LIMIT :limit OFFSET :offset) "
+            f"SELECT mr.id, ts_headline('{SEARCH_LANGUAGES[0]}', {narrative}, q.query, "
+            f"'StartSel=' || chr(2) || ', StopSel=' || chr(3) || ', MaxFragments=2, MaxWords=20, MinWords=5') "
+            f"FROM ranked JOIN medical_records mr ON mr.id = ranked.record_id, q ORDER BY ranked.rank DESC"
+        ), params).all()
+    else:
+        return []
+
+    records = {record.id: record for record in MedicalRecord.query
+               .options(db.joinedload(MedicalRecord.patient))
+               .filter(MedicalRecord.id.in_([row[0] for row in rows]))}
+    return [(records[record_id], _markup(snippet)) for record_id, snippet in rows if record_id in records]
+
+
+@event.listens_for(MedicalRecord, 'after_insert')
+def index_new_record(mapper, connection, record):
+    """Index a new medical record"""
+    index_records(connection, [record.id])
+
+
+@event.listens_for(MedicalRecord, 'after_update')
+def reindex_record(mapper, connection, record):
+    """Reindex a medical record when one of its narrative fields changed"""
+    state = inspect(record)
+    if any(state.attrs[field].history.has_changes() for field in SEARCH_FIELDS):
+        index_records(connection, [record.id])
+
+
+@event.listens_for(MedicalRecord, 'after_delete')
+def unindex_record(mapper, connection, record):
+    """Remove a deleted medical record from the index"""
+    remove_records(connection, [record.id])
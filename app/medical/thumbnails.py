@@ -0,0 +1,208 @@
+"""
+Attachment thumbnails
+Scaled-down JPEG derivatives of image attachments, generated off the
+request path in a process pool and kept in an on-disk LRU cache.
+
+Derivatives are keyed by content hash and size name
+(DERIVATIVE_FOLDER/ab/<sha256>_<size>.jpg), so identical images share them.
+A request for a derivative that does not exist yet submits it to the pool
+and gets None back; the caller serves a placeholder instead of waiting.
+An image that cannot be rendered is logged and marked with a
+<sha256>_<size>.failed file; later requests raise RenderFailed instead of
+submitting it again (until the attachment's derivatives are discarded).
+
+The cache is bounded by DERIVATIVE_CACHE_SIZE bytes. File mtimes record
+the last use (refreshed at most once per TOUCH_INTERVAL), and the least
+recently used files are evicted when a new derivative pushes the cache
+over its limit.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+
+# Size name -> longest side in pixels
+SIZES = {
+    'thumb': 200,
+    'preview': 1280,
+}
+IMAGE_TYPES = {'image/jpeg', 'image/png', 'image/gif'}
+TOUCH_INTERVAL = 3600  # seconds
+JPEG_QUALITY = 85
+
+_executor = None
+_executor_pid = None
+_pending = {}  # (sha256, size) -> Future
+_lock = threading.RLock()  # Reentrant: done callbacks may run inside submit()
+_cache_bytes = None  # Tracked size of the derivative folder, scanned on first use
+
+logger = logging.getLogger(__name__)
+
+
+class RenderFailed(Exception):
+    """The image could not be rendered; no derivative will be made"""
+
+
+def render_derivative(source_path, target_path, max_side):
+    """
+    Decode an image and write a JPEG no larger than max_side x max_side.
+    Runs in a worker process; returns the size of the written file.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as image:
+        image.draft('RGB', (max_side, max_side))  # JPEG: decode at reduced scale
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        temp_path = f'{target_path}.{os.getpid()}.tmp'
+        image.save(temp_path, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    os.replace(temp_path, target_path)
+    return os.path.getsize(target_path)
+
+
+def supports(attachment):
+    """Whether derivatives can be made for this attachment"""
+    return attachment.content_type in IMAGE_TYPES
+
+
+def derivative_path(sha256, size, folder=None):
+    """Cache path of a derivative"""
+    folder = folder or current_app.config['DERIVATIVE_FOLDER']
+    return os.path.join(folder, sha256[:2], f'{sha256}_{size}.jpg')
+
+
+def _failure_marker(path):
+    return path[:-len('.jpg')] + '.failed'
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    # A forked server worker must not reuse its parent's pool
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ProcessPoolExecutor(max_workers=current_app.config['THUMBNAIL_WORKERS'])
+        _executor_pid = os.getpid()
+        _pending.clear()
+    return _executor
+
+
+def _reset_executor(executor):
+    """Drop a broken pool so the next submit builds a new one"""
+    global _executor
+    if _executor is executor:
+        _executor = None
+
+
+def _scan_folder(folder):
+    """Derivative files as (mtime, size, path)"""
+    files = []
+    for directory, _, names in os.walk(folder):
+        for name in names:
+            if not name.endswith('.jpg'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    return files
+
+
+def evict(folder, limit):
+    """Remove least recently used derivatives until the folder fits in `limit` bytes"""
+    global _cache_bytes
+    files = sorted(_scan_folder(folder))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in files:
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+    _cache_bytes = total
+    return total
+
+
+def _finished(key, path, folder, limit, executor, future):
+    """Pool callback: account for the new file and evict if over the limit, or record a failed render"""
+    global _cache_bytes
+    with _lock:
+        _pending.pop(key, None)
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            # A worker died: the pool takes no more work, so the next request builds a new one
+            logger.error('Thumbnail worker died while rendering %s_%s', *key)
+            _reset_executor(executor)
+            return
+        if error is not None:
+            logger.error('Cannot render %s_%s', *key, exc_info=error)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(_failure_marker(path), 'w').close()
+            return
+        if _cache_bytes is None:
+            _cache_bytes = sum(size for _, size, _ in _scan_folder(folder))
+        else:
+            _cache_bytes += future.result()
+        if _cache_bytes > limit:
+            evict(folder, limit)
+
+
+def get_derivative(attachment, size):
+    """
+    Path of a ready derivative, or None when it is still being generated
+    (generation is started on the first call). Raises RenderFailed for an
+    image that could not be rendered.
+    """
+    path = derivative_path(attachment.sha256, size)
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        pass
+    else:
+        if time.time() - mtime > TOUCH_INTERVAL:
+            os.utime(path)  # Mark as recently used
+        return path
+
+    if os.path.exists(_failure_marker(path)):
+        raise RenderFailed()
+
+    key = (attachment.sha256, size)
+    folder = current_app.config['DERIVATIVE_FOLDER']
+    limit = current_app.config['DERIVATIVE_CACHE_SIZE']
+    with _lock:
+        if key not in _pending:
+            executor = _get_executor()
+            try:
+                future = executor.submit(render_derivative, attachment.path, path, SIZES[size])
+            except BrokenProcessPool:
+                _reset_executor(executor)
+                executor = _get_executor()
+                future = executor.submit(render_derivative, attachment.path, path, SIZES[size])
+            _pending[key] = future
+            future.add_done_callback(lambda done: _finished(key, path, folder, limit, executor, done))
+    return None
+
+
+def discard_derivatives(sha256):
+    """Remove the cached derivatives (and failure markers) of a content hash"""
+    for size in SIZES:
+        path = derivative_path(sha256, size)
+        for file_path in (path, _failure_marker(path)):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+
+@atexit.register
+def _shutdown():
+    if _executor is not None and _executor_pid == os.getpid():
+        _executor.shutdown(wait=False, cancel_futures=True)
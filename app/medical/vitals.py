@@ -0,0 +1,94 @@
+"""
+Vital sign trends
+Reads vital reading series and downsamples them to the chart width.
+
+Series are returned array-packed: {'t': [epoch seconds...], 'v': [values...]}
+instead of one object per point. Long series are reduced with
+Largest-Triangle-Three-Buckets (LTTB), which keeps the visual shape
+(peaks and dips) of the line with a fixed number of points.
+"""
+from datetime import timezone
+from app import db
+from app.models import VitalReading
+
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+
+
+def lttb(times, values, threshold):
+    """
+    Downsample a series to `threshold` points with Largest-Triangle-Three-Buckets.
+    `times` must be ascending. Returns (times, values) lists.
+    """
+    length = len(times)
+    if threshold >= length or threshold < 3:
+        return list(times), list(values)
+
+    sampled_times = [times[0]]
+    sampled_values = [values[0]]
+    bucket_size = (length - 2) / (threshold - 2)
+    selected = 0
+
+    for bucket in range(threshold - 2):
+        # Average point of the next bucket
+        next_start = int((bucket + 1) * bucket_size) + 1
+        next_end = min(int((bucket + 2) * bucket_size) + 1, length)
+        next_count = next_end - next_start
+        average_time = sum(times[next_start:next_end]) / next_count
+        average_value = sum(values[next_start:next_end]) / next_count
+
+        # Point in this bucket forming the largest triangle with the
+        # previously selected point and the next bucket's average
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        selected_time = times[selected]
+        selected_value = values[selected]
+        best_area = -1.0
+        best = start
+        for index in range(start, end):
+            area = abs(
+                (selected_time - average_time) * (values[index] - selected_value) -
+                (selected_time - times[index]) * (average_value - selected_value)
+            )
+            if area > best_area:
+                best_area = area
+                best = index
+
+        sampled_times.append(times[best])
+        sampled_values.append(values[best])
+        selected = best
+
+    sampled_times.append(times[-1])
+    sampled_values.append(values[-1])
+    return sampled_times, sampled_values
+
+
+def load_series(patient_id, metrics=None, start=None, end=None, points=DEFAULT_POINTS):
+    """
+    Load vital series for a patient, downsampled to at most `points` per metric.
+    Each metric is one range scan of the covering (patient_id, metric, ts, value) index.
+    """
+    points = max(3, min(points, MAX_POINTS))
+    series = {}
+
+    for metric in metrics or VitalReading.METRICS:
+        query = db.session.query(VitalReading.ts, VitalReading.value).filter(
+            VitalReading.patient_id == patient_id,
+            VitalReading.metric == metric
+        )
+        if start:
+            query = query.filter(VitalReading.ts >= start)
+        if end:
+            query = query.filter(VitalReading.ts <= end)
+
+        times = []
+        values = []
+        for ts, value in query.order_by(VitalReading.ts):
+            times.append(int(ts.replace(tzinfo=timezone.utc).timestamp()))
+            values.append(value)
+
+        total = len(times)
+        times, values = lttb(times, values, points)
+        series[metric] = {'t': times, 'v': values, 'total': total}
+
+    return series
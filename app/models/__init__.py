@@ -9,6 +9,16 @@ from app.models.medical_record import MedicalRecord
 from app.models.appointment import Appointment
 from app.models.transaction import Transaction
 from app.models.referral import Referral
+from app.models.patient_import import PatientImport
+from app.models.medical_tag import MedicalTag
+from app.models.archive import ArchivedPatient, ArchivedRecord
+from app.models.vital_reading import VitalReading
+from app.models.attachment import Attachment
+from app.models.export_job import ExportJob
+from app.models.medical_record_revision import MedicalRecordRevision
+from app.models.device_token import DeviceToken
+from app.models.counter import Counter
+from app.models.audit_event import AuditEvent
 
 __all__ = [
     'User',
@@ -16,5 +26,16 @@ __all__ = [
     'MedicalRecord',
     'Appointment',
     'Transaction',
-    'Referral'
+    'Referral',
+    'PatientImport',
+    'MedicalTag',
+    'ArchivedPatient',
+    'ArchivedRecord',
+    'VitalReading',
+    'Attachment',
+    'ExportJob',
+    'MedicalRecordRevision',
+    'DeviceToken',
+    'Counter',
+    'AuditEvent'
 ]
@@ -6,6 +6,10 @@ class Appointment(db.Model):
     """Appointment model for scheduling patient visits"""
 
     __tablename__ = 'appointments'
+    __table_args__ = (
+        # Per-patient appointments in date order (patient pages, timeline)
+        db.Index('ix_appointments_patient_date', 'patient_id', 'appointment_date'),
+    )
 
     # Primary Key
     id = db.Column(db.Integer, primary_key=True)
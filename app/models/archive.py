@@ -0,0 +1,112 @@
+"""
+Archive Models
+Cold storage for long-inactive patients and their history
+"""
+import json
+from datetime import date, datetime
+from app import db
+
+
+def serialize_row(row):
+    """Convert a table row mapping into a JSON string"""
+    data = {}
+    for key, value in row.items():
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        data[key] = value
+    return json.dumps(data)
+
+
+def restore_instance(model, data):
+    """Build a transient (never added to the session) model instance from archived JSON"""
+    values = json.loads(data)
+    for column in model.__table__.columns:
+        value = values.get(column.name)
+        if value is None:
+            continue
+        if isinstance(column.type, db.DateTime):
+            values[column.name] = datetime.fromisoformat(value)
+        elif isinstance(column.type, db.Date):
+            values[column.name] = date.fromisoformat(value)
+    return model(**{key: value for key, value in values.items() if key in model.__table__.columns})
+
+
+class ArchivedPatient(db.Model):
+    """
+    A patient moved out of the patients table by the archive command
+    The id is the original patient id, so old links keep resolving
+    """
+    __tablename__ = 'archived_patients'
+
+    # Primary Key (original patients.id)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    # Searchable copy of the name
+    first_name = db.Column(db.String(64), nullable=False)
+    last_name = db.Column(db.String(64), nullable=False, index=True)
+
+    # Full patients row as JSON
+    data = db.Column(db.Text, nullable=False)
+
+    # Timestamps
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # Relationships
+    records = db.relationship('ArchivedRecord',
+                             backref='archived_patient',
+                             lazy='dynamic',
+                             cascade='all, delete-orphan',
+                             order_by='ArchivedRecord.record_date.desc()')
+
+    def __repr__(self):
+        return f'<ArchivedPatient {self.first_name} {self.last_name}>'
+
+    def to_patient(self):
+        """Rebuild a read-only Patient object"""
+        from app.models.patient import Patient
+        return restore_instance(Patient, self.data)
+
+    def get_records(self, entity):
+        """Rebuild the archived rows of one kind (an ArchivedRecord.ENTITIES key)"""
+        return [record.to_instance() for record in self.records.filter_by(entity=entity)]
+
+
+class ArchivedRecord(db.Model):
+    """A row that depended on an archived patient (medical record, appointment, transaction, referral, ...)"""
+    __tablename__ = 'archived_records'
+    __table_args__ = (
+        db.Index('ix_archived_records_patient_entity_date', 'patient_id', 'entity', 'record_date'),
+    )
+
+    # Entity name -> (model module, model class)
+    ENTITIES = {
+        'medical_record': ('app.models.medical_record', 'MedicalRecord'),
+        'appointment': ('app.models.appointment', 'Appointment'),
+        'transaction': ('app.models.transaction', 'Transaction'),
+        'referral': ('app.models.referral', 'Referral'),
+        'attachment': ('app.models.attachment', 'Attachment'),
+        'vital_reading': ('app.models.vital_reading', 'VitalReading'),
+    }
+
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Foreign Keys
+    patient_id = db.Column(db.Integer, db.ForeignKey('archived_patients.id', ondelete='CASCADE'), nullable=False)
+
+    # Original row
+    entity = db.Column(db.String(32), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    record_date = db.Column(db.DateTime)  # visit / appointment / transaction / creation date
+    data = db.Column(db.Text, nullable=False)  # Full row as JSON
+    sha256 = db.Column(db.String(64), index=True)  # Stored file of an archived attachment, which stays in the store
+
+    def __repr__(self):
+        return f'<ArchivedRecord {self.entity} #{self.entity_id} Patient:{self.patient_id}>'
+
+    def to_instance(self):
+        """Rebuild a read-only model object for the original row"""
+        import importlib
+        module_name, class_name = self.ENTITIES[self.entity]
+        model = getattr(importlib.import_module(module_name), class_name)
+        return restore_instance(model, self.data)
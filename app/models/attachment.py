@@ -0,0 +1,64 @@
+"""
+Attachment Model
+Files attached to medical records, stored once per content hash
+"""
+import os
+from datetime import datetime
+from flask import current_app
+from app import db
+
+
+class Attachment(db.Model):
+    """
+    A file attached to a medical record
+    The file itself lives in ATTACHMENT_FOLDER under its SHA-256, so the same
+    lab PDF attached to many records is stored once
+    """
+    __tablename__ = 'attachments'
+    __table_args__ = (
+        db.Index('ix_attachments_record_created', 'medical_record_id', 'created_at'),
+    )
+
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Foreign Keys
+    medical_record_id = db.Column(db.Integer, db.ForeignKey('medical_records.id', ondelete='CASCADE'), nullable=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id', ondelete='CASCADE'), nullable=False, index=True)
+    uploaded_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    # File
+    filename = db.Column(db.String(256), nullable=False)  # Original name, shown to users
+    content_type = db.Column(db.String(128))
+    size = db.Column(db.BigInteger, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)  # Content address
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<Attachment {self.filename} Record:{self.medical_record_id}>'
+
+    @staticmethod
+    def relative_path(sha256):
+        """Storage path of a content hash, relative to ATTACHMENT_FOLDER (two fan-out levels)"""
+        return os.path.join(sha256[:2], sha256[2:4], sha256)
+
+    @property
+    def path(self):
+        """Absolute path of the stored file"""
+        return os.path.join(current_app.config['ATTACHMENT_FOLDER'], Attachment.relative_path(self.sha256))
+
+    @property
+    def size_display(self):
+        """Human readable file size"""
+        size = float(self.size)
+        for unit in ('B', 'KB', 'MB'):
+            if size < 1024:
+                return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+            size /= 1024
+        return f'{size:.1f} GB'
+
+    def is_inline(self):
+        """Whether browsers can display the file instead of downloading it"""
+        return (self.content_type or '').startswith('image/') or self.content_type == 'application/pdf'
@@ -0,0 +1,44 @@
+"""
+Audit Event Model
+Append-only log of who viewed or changed patient data
+"""
+from datetime import datetime
+from app import db
+
+
+class AuditEvent(db.Model):
+    """
+    One action of a user on an entity (a view, create, update, delete, login, ...)
+    Written in batches by the audit buffer (app/utils/audit.py), never updated
+    """
+    __tablename__ = 'audit_events'
+    __table_args__ = (
+        db.Index('ix_audit_events_user', 'user_id', 'id'),
+        db.Index('ix_audit_events_entity', 'entity', 'entity_id', 'id'),
+    )
+
+    # Actions
+    VIEW = 'view'
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    LOGIN = 'login'
+    LOGOUT = 'logout'
+
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+
+    # No foreign key constraints: the log outlives users and entities
+    user_id = db.Column(db.Integer, nullable=True)  # NULL: anonymous, device or command line
+    action = db.Column(db.String(10), nullable=False)
+    entity = db.Column(db.String(32), nullable=False)  # 'patient', 'medical_record', ...
+    entity_id = db.Column(db.Integer, nullable=True)
+    ip_address = db.Column(db.String(45))
+
+    # Timestamps (when the action happened, not when it was written)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    user = db.relationship('User', primaryjoin='foreign(AuditEvent.user_id) == User.id')
+
+    def __repr__(self):
+        return f'<AuditEvent {self.action} {self.entity}:{self.entity_id} by {self.user_id}>'
@@ -0,0 +1,213 @@
+"""
+Counter Model
+Stored counts maintained in the same transaction as the rows they count
+"""
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models.patient import Patient
+from app.models.medical_record import MedicalRecord
+from app.models.appointment import Appointment
+from app.models.transaction import Transaction
+from app.utils.history import load_old_values
+
+
+class Counter(db.Model):
+    """
+    A named count, global (subject_id 0) or per patient (subject_id = patient id)
+    Reading one is a primary key lookup instead of a COUNT(*). Model events keep
+    the values current; bulk statements that bypass them must call adjust(),
+    and `flask reconcile-counters` repairs any drift.
+    """
+    __tablename__ = 'counters'
+
+    # Global counters
+    ACTIVE_PATIENTS = 'active_patients'
+    PENDING_PAYMENTS = 'pending_payments'  # Pending income transactions
+
+    # Per-patient counters
+    MEDICAL_RECORDS = 'medical_records'
+    APPOINTMENTS = 'appointments'
+
+    # Composite Primary Key
+    name = db.Column(db.String(32), primary_key=True)
+    subject_id = db.Column(db.Integer, primary_key=True, default=0, autoincrement=False)
+
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<Counter {self.name}:{self.subject_id}={self.value}>'
+
+    @staticmethod
+    def get(name, subject_id=0):
+        """Current value of a counter"""
+        value = db.session.query(Counter.value).filter_by(name=name, subject_id=subject_id).scalar()
+        return value or 0
+
+    @staticmethod
+    def value_of(name, subject_id=0):
+        """SQL expression for a counter value, to embed in a larger query"""
+        return db.func.coalesce(
+            db.select(Counter.value).where(Counter.name == name, Counter.subject_id == subject_id).scalar_subquery(),
+            0
+        )
+
+    @staticmethod
+    def for_patient(patient_id):
+        """Per-patient counters as {name: value}"""
+        values = dict(db.session.query(Counter.name, Counter.value).filter(
+            Counter.name.in_([Counter.MEDICAL_RECORDS, Counter.APPOINTMENTS]),
+            Counter.subject_id == patient_id
+        ))
+        return {name: values.get(name, 0) for name in (Counter.MEDICAL_RECORDS, Counter.APPOINTMENTS)}
+
+    @staticmethod
+    def adjust(connection, name, delta, subject_id=0):
+        """Add delta to a counter (creating it) on the given connection, inside the current transaction"""
+        if not delta:
+            return
+        table = Counter.__table__
+        dialect = connection.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+            connection.execute(
+                insert(table).values(name=name, subject_id=subject_id, value=delta)
+                .on_conflict_do_update(index_elements=['name', 'subject_id'], set_={'value': table.c.value + delta})
+            )
+            return
+        result = connection.execute(
+            table.update().where(table.c.name == name, table.c.subject_id == subject_id)
+            .values(value=table.c.value + delta)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(name=name, subject_id=subject_id, value=delta))
+
+    @staticmethod
+    def actual_counts():
+        """Counts recomputed from the counted tables, as {(name, subject_id): value}"""
+        counts = {
+            (Counter.ACTIVE_PATIENTS, 0): Patient.query.filter(Patient.is_active == db.true()).count(),
+            (Counter.PENDING_PAYMENTS, 0): Transaction.query.filter_by(transaction_type='income',
+                                                                      status='pending').count(),
+        }
+        for name, model in ((Counter.MEDICAL_RECORDS, MedicalRecord), (Counter.APPOINTMENTS, Appointment)):
+            for patient_id, count in db.session.query(model.patient_id, db.func.count()).group_by(model.patient_id):
+                counts[(name, patient_id)] = count
+        return counts
+
+    @staticmethod
+    def reconcile():
+        """
+        Recompute every counter and repair the ones that drifted.
+        Returns [(name, subject_id, stored, actual)] of the repaired counters.
+        Writes made while it runs can be miscounted; run it when the clinic is quiet.
+        """
+        actual = Counter.actual_counts()
+        stored = {(name, subject_id): value for name, subject_id, value in
+                  db.session.query(Counter.name, Counter.subject_id, Counter.value)}
+
+        repaired = [(name, subject_id, stored.get((name, subject_id)), actual.get((name, subject_id), 0))
+                    for name, subject_id in sorted(set(actual) | set(stored))
+                    if stored.get((name, subject_id)) != actual.get((name, subject_id), 0)]
+
+        table = Counter.__table__
+        for name, subject_id, _, value in repaired:
+            db.session.execute(table.delete().where(table.c.name == name, table.c.subject_id == subject_id))
+        rows = [{'name': name, 'subject_id': subject_id, 'value': value}
+                for name, subject_id, _, value in repaired if value or subject_id == 0]
+        if rows:
+            db.session.execute(table.insert(), rows)
+        db.session.commit()
+        return repaired
+
+
+def _old_and_new(target, attribute):
+    """(committed value, new value) of an attribute being flushed"""
+    history = inspect(target).attrs[attribute].history
+    if not history.has_changes():
+        value = getattr(target, attribute)
+        return value, value
+    old = history.deleted[0] if history.deleted else None
+    new = history.added[0] if history.added else None
+    return old, new
+
+
+def _is_pending_payment(transaction_type, status):
+    return transaction_type == 'income' and status == 'pending'
+
+
+# Updates need to know what a counted attribute replaces
+load_old_values(Patient.is_active, Transaction.transaction_type, Transaction.status,
+                MedicalRecord.patient_id, Appointment.patient_id)
+
+
+# Patients: active count
+
+@event.listens_for(Patient, 'after_insert')
+def count_new_patient(mapper, connection, patient):
+    if patient.is_active:
+        Counter.adjust(connection, Counter.ACTIVE_PATIENTS, 1)
+
+
+@event.listens_for(Patient, 'after_update')
+def count_patient_update(mapper, connection, patient):
+    old, new = _old_and_new(patient, 'is_active')
+    Counter.adjust(connection, Counter.ACTIVE_PATIENTS, bool(new) - bool(old))
+
+
+@event.listens_for(Patient, 'before_delete')
+def count_deleted_patient(mapper, connection, patient):
+    old, _ = _old_and_new(patient, 'is_active')
+    if old:
+        Counter.adjust(connection, Counter.ACTIVE_PATIENTS, -1)
+    table = Counter.__table__
+    connection.execute(table.delete().where(table.c.subject_id == patient.id,
+                                            table.c.name.in_([Counter.MEDICAL_RECORDS, Counter.APPOINTMENTS])))
+
+
+# Transactions: pending payments
+
+@event.listens_for(Transaction, 'after_insert')
+def count_new_transaction(mapper, connection, transaction):
+    if _is_pending_payment(transaction.transaction_type, transaction.status):
+        Counter.adjust(connection, Counter.PENDING_PAYMENTS, 1)
+
+
+@event.listens_for(Transaction, 'after_update')
+def count_transaction_update(mapper, connection, transaction):
+    old_type, new_type = _old_and_new(transaction, 'transaction_type')
+    old_status, new_status = _old_and_new(transaction, 'status')
+    Counter.adjust(connection, Counter.PENDING_PAYMENTS,
+                   _is_pending_payment(new_type, new_status) - _is_pending_payment(old_type, old_status))
+
+
+@event.listens_for(Transaction, 'before_delete')
+def count_deleted_transaction(mapper, connection, transaction):
+    old_type, _ = _old_and_new(transaction, 'transaction_type')
+    old_status, _ = _old_and_new(transaction, 'status')
+    if _is_pending_payment(old_type, old_status):
+        Counter.adjust(connection, Counter.PENDING_PAYMENTS, -1)
+
+
+# Medical records and appointments: per-patient counts
+
+def _listen_per_patient(model, name):
+    @event.listens_for(model, 'after_insert')
+    def count_new(mapper, connection, target):
+        Counter.adjust(connection, name, 1, target.patient_id)
+
+    @event.listens_for(model, 'after_update')
+    def count_moved(mapper, connection, target):
+        old, new = _old_and_new(target, 'patient_id')
+        if old != new:
+            Counter.adjust(connection, name, -1, old)
+            Counter.adjust(connection, name, 1, new)
+
+    @event.listens_for(model, 'before_delete')
+    def count_deleted(mapper, connection, target):
+        old, _ = _old_and_new(target, 'patient_id')
+        Counter.adjust(connection, name, -1, old)
+
+
+_listen_per_patient(MedicalRecord, Counter.MEDICAL_RECORDS)
+_listen_per_patient(Appointment, Counter.APPOINTMENTS)
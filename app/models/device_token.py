@@ -0,0 +1,55 @@
+"""
+Device Token Model
+API credentials for bedside devices that push vital signs
+"""
+import hashlib
+import secrets
+from datetime import datetime
+from app import db
+
+
+class DeviceToken(db.Model):
+    """
+    Bearer token of a device (monitor, gateway) allowed to call the ingestion API
+    Only the SHA-256 of the token is stored; the token is shown once at creation
+    """
+    __tablename__ = 'device_tokens'
+
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Foreign Keys
+    created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    # Device
+    name = db.Column(db.String(64), unique=True, nullable=False)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_used_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<DeviceToken {self.name}>'
+
+    @staticmethod
+    def hash_token(token):
+        """Stored form of a token"""
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @staticmethod
+    def issue(name, created_by_id=None):
+        """Create a device token. Returns (DeviceToken, plain token)"""
+        token = secrets.token_urlsafe(32)
+        device = DeviceToken(name=name, token_hash=DeviceToken.hash_token(token), created_by_id=created_by_id)
+        db.session.add(device)
+        db.session.commit()
+        return device, token
+
+    @staticmethod
+    def authenticate(token):
+        """Active device for a presented token, or None"""
+        if not token:
+            return None
+        return DeviceToken.query.filter_by(token_hash=DeviceToken.hash_token(token), is_active=True).first()
@@ -0,0 +1,75 @@
+"""
+Export Job Model
+Tracks documents generated in the background (patient history PDFs)
+"""
+import os
+from datetime import datetime
+from app import db
+
+
+class ExportJob(db.Model):
+    """
+    A background export: queued by a user, built by a worker process,
+    downloaded from result_path once completed
+    """
+    __tablename__ = 'export_jobs'
+    __table_args__ = (
+        db.Index('ix_export_jobs_status_created', 'status', 'created_at'),
+    )
+
+    # Kinds
+    PATIENT_HISTORY = 'patient_history'
+
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Foreign Keys
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id', ondelete='CASCADE'), nullable=True, index=True)
+    requested_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
+
+    # Job
+    kind = db.Column(db.String(32), nullable=False)
+    # Status: 'pending', 'running', 'completed', 'failed'
+    status = db.Column(db.String(20), default='pending', nullable=False)
+
+    # Progress
+    items_total = db.Column(db.Integer, default=0, nullable=False)
+    items_done = db.Column(db.Integer, default=0, nullable=False)
+
+    # Result
+    result_path = db.Column(db.String(512))  # Relative to EXPORT_FOLDER
+    result_size = db.Column(db.Integer)
+    failure_reason = db.Column(db.Text)
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<ExportJob {self.id} {self.kind} ({self.status})>'
+
+    @property
+    def progress(self):
+        """Completion percentage"""
+        if self.status == 'completed':
+            return 100
+        if not self.items_total:
+            return 0
+        return min(99, int(100 * self.items_done / self.items_total))
+
+    @property
+    def download_name(self):
+        """File name offered to the browser"""
+        return os.path.basename(self.result_path) if self.result_path else None
+
+    @property
+    def status_badge_class(self):
+        """Return Bootstrap badge class based on status"""
+        status_classes = {
+            'pending': 'bg-secondary',
+            'running': 'bg-info',
+            'completed': 'bg-success',
+            'failed': 'bg-danger'
+        }
+        return status_classes.get(self.status, 'bg-secondary')
@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy import event
 from app import db
 
 
@@ -6,6 +7,29 @@ class MedicalRecord(db.Model):
     """Medical Record model for storing patient medical history"""
 
     __tablename__ = 'medical_records'
+    __table_args__ = (
+        # Per-patient history in date order and "seen since" cohort filters
+        db.Index('ix_medical_records_patient_visit', 'patient_id', 'visit_date'),
+        # Abnormal vitals worklist: only flagged records enter the index (SQLite / PostgreSQL)
+        db.Index('ix_medical_records_abnormal_visit', 'visit_date',
+                 sqlite_where=db.text('abnormal_flags > 0'),
+                 postgresql_where=db.text('abnormal_flags > 0')),
+        # Follow-up worklist: pending follow-ups by due date
+        db.Index('ix_medical_records_follow_up', 'follow_up_required', 'follow_up_date'),
+    )
+
+    # Normal ranges used by has_abnormal_vitals(): column -> (low, high); None = no bound.
+    # The position of each vital is its bit in abnormal_flags.
+    VITAL_RANGES = {
+        'temperature': (36.0, 37.5),  # °C
+        'blood_pressure_systolic': (90, 140),  # mmHg
+        'blood_pressure_diastolic': (60, 90),  # mmHg
+        'heart_rate': (60, 100),  # BPM
+        'oxygen_saturation': (95, None),  # %
+    }
+
+    # BMI category upper bounds (exclusive); anything above the last bound is 'Obese'
+    BMI_CATEGORIES = [(18.5, 'Underweight'), (25, 'Normal'), (30, 'Overweight')]
 
     # Primary Key
     id = db.Column(db.Integer, primary_key=True)
@@ -40,16 +64,25 @@ class MedicalRecord(db.Model):
     follow_up_date = db.Column(db.Date)
     follow_up_notes = db.Column(db.Text)
 
-    # Files
-    attachments = db.Column(db.Text)  # JSON array of file paths
-
     # Doctor Notes
     doctor_notes = db.Column(db.Text)
 
+    # Derived on write (see compute_vital_flags); NULL until computed for older rows
+    bmi_value = db.Column(db.Float)
+    bmi_category = db.Column(db.String(20), index=True)
+    abnormal_flags = db.Column(db.Integer)  # Bitmask over VITAL_RANGES, 0 = all normal
+
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
+    # Relationships
+    attachments = db.relationship('Attachment',
+                                  backref='medical_record',
+                                  lazy='dynamic',
+                                  cascade='all, delete-orphan',
+                                  order_by='Attachment.created_at')
+
     def __repr__(self):
         return f'<MedicalRecord Patient:{self.patient_id} Date:{self.visit_date.strftime("%Y-%m-%d")}>'
 
@@ -71,38 +104,46 @@ class MedicalRecord(db.Model):
 
     def get_bmi_category(self):
         """Get BMI category"""
-        bmi = self.bmi
+        return MedicalRecord.classify_bmi(self.bmi)
+
+    @staticmethod
+    def classify_bmi(bmi):
+        """Map a BMI value to its category"""
         if bmi is None:
             return None
-        if bmi < 18.5:
-            return 'Underweight'
-        elif 18.5 <= bmi < 25:
-            return 'Normal'
-        elif 25 <= bmi < 30:
-            return 'Overweight'
-        else:
-            return 'Obese'
+        for upper_bound, category in MedicalRecord.BMI_CATEGORIES:
+            if bmi < upper_bound:
+                return category
+        return 'Obese'
+
+    def get_abnormal_flags(self):
+        """Bitmask of the vital signs outside their normal range"""
+        flags = 0
+        for bit, (column, (low, high)) in enumerate(MedicalRecord.VITAL_RANGES.items()):
+            value = getattr(self, column)
+            if value and ((low is not None and value < low) or (high is not None and value > high)):
+                flags |= 1 << bit
+        return flags
 
     def has_abnormal_vitals(self):
         """Check if any vital signs are abnormal"""
-        abnormal = False
-
-        # Temperature (normal: 36.5-37.5°C)
-        if self.temperature and (self.temperature < 36.0 or self.temperature > 37.5):
-            abnormal = True
+        return self.get_abnormal_flags() != 0
 
-        # Blood Pressure (normal systolic: 90-120, diastolic: 60-80)
-        if self.blood_pressure_systolic and (self.blood_pressure_systolic < 90 or self.blood_pressure_systolic > 140):
-            abnormal = True
-        if self.blood_pressure_diastolic and (self.blood_pressure_diastolic < 60 or self.blood_pressure_diastolic > 90):
-            abnormal = True
-
-        # Heart Rate (normal: 60-100 BPM)
-        if self.heart_rate and (self.heart_rate < 60 or self.heart_rate > 100):
-            abnormal = True
-
-        # Oxygen Saturation (normal: >95%)
-        if self.oxygen_saturation and self.oxygen_saturation < 95:
-            abnormal = True
-
-        return abnormal
+    @property
+    def abnormal_vital_names(self):
+        """Names of the abnormal vitals recorded in abnormal_flags"""
+        flags = self.abnormal_flags if self.abnormal_flags is not None else self.get_abnormal_flags()
+        return [column for bit, column in enumerate(MedicalRecord.VITAL_RANGES) if flags & (1 << bit)]
+
+    def compute_vital_flags(self):
+        """Persist BMI, BMI category and abnormal vitals flags"""
+        self.bmi_value = self.bmi
+        self.bmi_category = self.get_bmi_category()
+        self.abnormal_flags = self.get_abnormal_flags()
+
+
+@event.listens_for(MedicalRecord, 'before_insert')
+@event.listens_for(MedicalRecord, 'before_update')
+def compute_record_vital_flags(mapper, connection, record):
+    """Keep the derived vital columns current on every write"""
+    record.compute_vital_flags()
@@ -0,0 +1,169 @@
+"""
+Medical Record Revision Model
+Append-only change history of medical records
+"""
+import json
+from datetime import date, datetime
+from flask import has_request_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app import db
+from app.models.archive import restore_instance
+from app.models.medical_record import MedicalRecord
+from app.utils.history import load_old_values
+
+
+def _to_json(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+class MedicalRecordRevision(db.Model):
+    """
+    One create / update / delete of a medical record, written in the same flush
+    Only the fields that changed are stored, as {field: [old, new]}, so any past
+    version can be rebuilt by undoing newer revisions on top of the current row
+    """
+    __tablename__ = 'medical_record_revisions'
+    __table_args__ = (
+        db.Index('ix_medical_record_revisions_record', 'medical_record_id', 'id'),
+    )
+
+    # Actions
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+
+    # Columns that are not versioned (bookkeeping or derived from other fields)
+    UNTRACKED = {'id', 'created_at', 'updated_at', 'bmi_value', 'bmi_category', 'abnormal_flags'}
+
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+
+    # No foreign key constraint: history outlives deleted records
+    medical_record_id = db.Column(db.Integer, nullable=False)
+    changed_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    # Change
+    action = db.Column(db.String(10), nullable=False)
+    changes = db.Column(db.Text, nullable=False)  # Compact JSON {field: [old, new]}
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # Lets a revision of a new record pick up its id when both are flushed together
+    medical_record = db.relationship(
+        'MedicalRecord',
+        primaryjoin='foreign(MedicalRecordRevision.medical_record_id) == MedicalRecord.id'
+    )
+    changed_by = db.relationship('User')
+
+    def __repr__(self):
+        return f'<MedicalRecordRevision {self.action} Record:{self.medical_record_id} at {self.created_at}>'
+
+    @staticmethod
+    def tracked_fields():
+        """Versioned MedicalRecord columns"""
+        return [column.name for column in MedicalRecord.__table__.columns
+                if column.name not in MedicalRecordRevision.UNTRACKED]
+
+    def get_changes(self):
+        """Changed fields as {field: (old, new)}"""
+        return {field: tuple(values) for field, values in json.loads(self.changes).items()}
+
+    @staticmethod
+    def history(record_id):
+        """Revisions of a medical record, oldest first"""
+        return MedicalRecordRevision.query.filter_by(medical_record_id=record_id) \
+            .order_by(MedicalRecordRevision.id).all()
+
+    @staticmethod
+    def reconstruct(record_id, at):
+        """
+        Rebuild a medical record as it was at `at` (a datetime).
+        Returns a transient MedicalRecord, or None if it did not exist then.
+        """
+        current = MedicalRecord.query.get(record_id)
+        newer = MedicalRecordRevision.query.filter(
+            MedicalRecordRevision.medical_record_id == record_id,
+            MedicalRecordRevision.created_at > at
+        ).order_by(MedicalRecordRevision.id.desc()).all()
+
+        if current is None and not newer:
+            return None  # Deleted before `at`, or never existed
+        if current is not None:
+            if not newer and current.created_at > at:
+                return None  # Created before history was kept, but after `at`
+            state = {field: _to_json(getattr(current, field))
+                     for field in MedicalRecordRevision.tracked_fields() + ['created_at']}
+        else:
+            state = {}
+
+        for revision in newer:
+            if revision.action == MedicalRecordRevision.CREATE:
+                return None
+            for field, (old, _) in revision.get_changes().items():
+                state[field] = old
+
+        state['id'] = record_id
+        return restore_instance(MedicalRecord, json.dumps(state))
+
+
+# Revisions record what a tracked field replaced
+load_old_values(*[getattr(MedicalRecord, field) for field in MedicalRecordRevision.tracked_fields()])
+
+
+def _current_user_id():
+    if not has_request_context():
+        return None
+    from flask_login import current_user
+    return current_user.id if current_user and current_user.is_authenticated else None
+
+
+def _record_changes(record, action):
+    """{field: [old, new]} for the tracked fields of a record that changed"""
+    state = inspect(record)
+    changes = {}
+    for field in MedicalRecordRevision.tracked_fields():
+        history = state.attrs[field].history
+        if action == MedicalRecordRevision.CREATE:
+            old, new = None, getattr(record, field)
+        elif action == MedicalRecordRevision.DELETE:
+            old, new = getattr(record, field), None
+        else:
+            if not history.has_changes():
+                continue
+            old = history.deleted[0] if history.deleted else None
+            new = history.added[0] if history.added else None
+        if old != new:
+            changes[field] = [_to_json(old), _to_json(new)]
+    return changes
+
+
+@event.listens_for(Session, 'before_flush')
+def record_medical_record_revisions(session, flush_context, instances):
+    """Append a revision for every medical record created, changed or deleted in this flush"""
+    revisions = []
+    for action, objects in ((MedicalRecordRevision.CREATE, session.new),
+                            (MedicalRecordRevision.UPDATE, session.dirty),
+                            (MedicalRecordRevision.DELETE, session.deleted)):
+        for record in objects:
+            if not isinstance(record, MedicalRecord):
+                continue
+            changes = _record_changes(record, action)
+            if not changes and action == MedicalRecordRevision.UPDATE:
+                continue
+            revision = MedicalRecordRevision(
+                action=action,
+                changes=json.dumps(changes, separators=(',', ':'), ensure_ascii=False)
+            )
+            if action == MedicalRecordRevision.CREATE:
+                revision.medical_record = record
+            else:
+                revision.medical_record_id = record.id
+            revisions.append(revision)
+
+    if revisions:
+        user_id = _current_user_id()
+        for revision in revisions:
+            revision.changed_by_id = user_id
+        session.add_all(revisions)
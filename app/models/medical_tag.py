@@ -0,0 +1,166 @@
+"""
+Medical Tag Model
+Normalized allergies and chronic conditions parsed from the patient's free text
+"""
+import re
+from datetime import datetime
+from sqlalchemy import event, insert, inspect, intersect, select
+from sqlalchemy.orm import Session
+from app import db
+
+
+# Many-to-many link between patients and tags.
+# The primary key serves patient -> tags; the reverse index serves tag -> patients lookups.
+patient_medical_tags = db.Table(
+    'patient_medical_tags',
+    db.Column('patient_id', db.Integer, db.ForeignKey('patients.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('medical_tags.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_patient_medical_tags_tag_patient', 'tag_id', 'patient_id')
+)
+
+
+class MedicalTag(db.Model):
+    """
+    A single allergy or chronic condition (e.g. 'penicillin', 'diabetes')
+    Patient.allergies / Patient.chronic_conditions stay the editable source;
+    tags are re-derived from them whenever they change
+    """
+    __tablename__ = 'medical_tags'
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'name', name='uq_medical_tags_kind_name'),
+    )
+
+    ALLERGY = 'allergy'
+    CONDITION = 'condition'
+
+    # Free-text entries that mean "nothing to record"
+    EMPTY_VALUES = {'none', 'no', 'n/a', 'na', 'nka', 'nkda', 'ninguna', 'ninguno', 'no known allergies', '-'}
+
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Tag Information
+    kind = db.Column(db.String(20), nullable=False)  # 'allergy' or 'condition'
+    name = db.Column(db.String(128), nullable=False)  # Normalized (lowercase, single spaces)
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<MedicalTag {self.kind}:{self.name}>'
+
+    @staticmethod
+    def normalize(text):
+        """Normalize a tag name ('  Penicillin. ' -> 'penicillin')"""
+        return ' '.join(text.split()).strip(' .').lower()[:128]
+
+    @staticmethod
+    def parse(text):
+        """Split free text (comma, semicolon or line separated) into unique normalized names"""
+        names = []
+        for part in re.split(r'[,;\n]+', text or ''):
+            name = MedicalTag.normalize(part)
+            if name and name not in MedicalTag.EMPTY_VALUES and name not in names:
+                names.append(name)
+        return names
+
+    @staticmethod
+    def get_or_create(kind, names):
+        """Get tags by name, creating the missing ones in the current session"""
+        if not names:
+            return []
+        # Tags created earlier in this unit of work are not in the database yet
+        existing = {
+            obj.name: obj for obj in db.session.new
+            if isinstance(obj, MedicalTag) and obj.kind == kind and obj.name in names
+        }
+        with db.session.no_autoflush:
+            existing.update({tag.name: tag for tag in MedicalTag.query.filter(
+                MedicalTag.kind == kind,
+                MedicalTag.name.in_(names)
+            )})
+        tags = []
+        for name in names:
+            tag = existing.get(name)
+            if tag is None:
+                tag = MedicalTag(kind=kind, name=name)
+                db.session.add(tag)
+                existing[name] = tag
+            tags.append(tag)
+        return tags
+
+    @staticmethod
+    def link_patients(patients):
+        """
+        Bulk (re)build tag links for many patients without loading them.
+        `patients` is a list of (patient_id, allergies_text, chronic_conditions_text).
+        """
+        patient_ids = [patient_id for patient_id, _, _ in patients]
+        parsed = {
+            MedicalTag.ALLERGY: {patient_id: MedicalTag.parse(text) for patient_id, text, _ in patients},
+            MedicalTag.CONDITION: {patient_id: MedicalTag.parse(text) for patient_id, _, text in patients},
+        }
+
+        links = set()
+        for kind, names_by_patient in parsed.items():
+            all_names = sorted({name for names in names_by_patient.values() for name in names})
+            tags = MedicalTag.get_or_create(kind, all_names)
+            db.session.flush()
+            tag_ids = {tag.name: tag.id for tag in tags}
+            for patient_id, names in names_by_patient.items():
+                links.update((patient_id, tag_ids[name]) for name in names)
+
+        db.session.execute(
+            patient_medical_tags.delete().where(patient_medical_tags.c.patient_id.in_(patient_ids))
+        )
+        if links:
+            db.session.execute(
+                insert(patient_medical_tags),
+                [{'patient_id': patient_id, 'tag_id': tag_id} for patient_id, tag_id in sorted(links)]
+            )
+
+    @staticmethod
+    def patient_ids_with_all(allergies=None, conditions=None):
+        """
+        Select the ids of patients that have every given allergy and condition.
+        Each tag is answered from the (tag_id, patient_id) index and the
+        per-tag id sets are intersected in the database.
+        Returns None if a requested tag does not exist (no patient can match).
+        """
+        wanted = [(MedicalTag.ALLERGY, MedicalTag.normalize(name)) for name in allergies or []] + \
+                 [(MedicalTag.CONDITION, MedicalTag.normalize(name)) for name in conditions or []]
+        wanted = list(dict.fromkeys(wanted))
+        if not wanted:
+            raise ValueError('At least one allergy or condition is required')
+
+        tag_ids = []
+        for kind in (MedicalTag.ALLERGY, MedicalTag.CONDITION):
+            names = [name for tag_kind, name in wanted if tag_kind == kind]
+            if names:
+                tag_ids += [tag_id for (tag_id,) in db.session.query(MedicalTag.id).filter(
+                    MedicalTag.kind == kind,
+                    MedicalTag.name.in_(names)
+                )]
+        if len(tag_ids) < len(wanted):
+            return None
+
+        selects = [
+            select(patient_medical_tags.c.patient_id).where(patient_medical_tags.c.tag_id == tag_id)
+            for tag_id in tag_ids
+        ]
+        return selects[0] if len(selects) == 1 else intersect(*selects)
+
+
+@event.listens_for(Session, 'before_flush')
+def sync_patient_medical_tags(session, flush_context, instances):
+    """Re-derive tags for new patients and patients whose allergies/conditions changed"""
+    from app.models.patient import Patient
+
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Patient):
+            continue
+        if obj in session.new or any(
+            inspect(obj).attrs[field].history.has_changes()
+            for field in ('allergies', 'chronic_conditions')
+        ):
+            obj.sync_medical_tags()
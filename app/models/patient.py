@@ -6,6 +6,24 @@ class Patient(db.Model):
     """Patient model for storing patient information"""
 
     __tablename__ = 'patients'
+    __table_args__ = (
+        # Bulk import duplicate checks look up existing patients by birth date
+        db.Index('ix_patients_dob_last_name', 'date_of_birth', 'last_name'),
+        # Partial indexes over active patients only (SQLite and PostgreSQL; a plain
+        # index elsewhere). Deactivated patients never enter these, and the
+        # archive command removes them from the table altogether.
+        # Cohort queries: demographic filters resolve to date_of_birth ranges
+        db.Index('ix_patients_active_only_gender_dob', 'gender', 'date_of_birth',
+                 sqlite_where=db.text('is_active = 1'),
+                 postgresql_where=db.text('is_active = true')),
+        # Patient list (newest first) and patient pickers (by first name)
+        db.Index('ix_patients_active_created_at', 'created_at',
+                 sqlite_where=db.text('is_active = 1'),
+                 postgresql_where=db.text('is_active = true')),
+        db.Index('ix_patients_active_first_name', 'first_name',
+                 sqlite_where=db.text('is_active = 1'),
+                 postgresql_where=db.text('is_active = true')),
+    )
 
     # Primary Key
     id = db.Column(db.Integer, primary_key=True)
@@ -15,13 +33,13 @@ class Patient(db.Model):
     last_name = db.Column(db.String(64), nullable=False)
     date_of_birth = db.Column(db.Date, nullable=False)
     gender = db.Column(db.String(20))  # 'male', 'female', 'other'
-    blood_type = db.Column(db.String(5))  # 'A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'
+    blood_type = db.Column(db.String(5), index=True)  # 'A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'
 
     # Contact Information
     email = db.Column(db.String(120))
     phone = db.Column(db.String(20), nullable=False)
     address = db.Column(db.String(256))
-    city = db.Column(db.String(64))
+    city = db.Column(db.String(64), index=True)
     state = db.Column(db.String(64))
     zip_code = db.Column(db.String(10))
     country = db.Column(db.String(64))
@@ -32,7 +50,7 @@ class Patient(db.Model):
     emergency_contact_relationship = db.Column(db.String(64))
 
     # Medical Information
-    insurance_provider = db.Column(db.String(128))
+    insurance_provider = db.Column(db.String(128), index=True)
     insurance_number = db.Column(db.String(64))
     allergies = db.Column(db.Text)  # Comma-separated or JSON
     chronic_conditions = db.Column(db.Text)  # Comma-separated or JSON
@@ -77,6 +95,11 @@ class Patient(db.Model):
                                cascade='all, delete-orphan',
                                order_by='Referral.created_at.desc()')
 
+    # Normalized allergies / chronic conditions (kept in sync with the text fields above)
+    medical_tags = db.relationship('MedicalTag',
+                                  secondary='patient_medical_tags',
+                                  backref=db.backref('patients', lazy='dynamic'))
+
     def __repr__(self):
         return f'<Patient {self.full_name}>'
 
@@ -118,3 +141,36 @@ class Patient(db.Model):
             Transaction.status == 'pending'
         ).scalar()
         return total or 0.0
+
+    @property
+    def allergy_tags(self):
+        """Get normalized allergy names"""
+        from app.models.medical_tag import MedicalTag
+        return [tag.name for tag in self.medical_tags if tag.kind == MedicalTag.ALLERGY]
+
+    @property
+    def condition_tags(self):
+        """Get normalized chronic condition names"""
+        from app.models.medical_tag import MedicalTag
+        return [tag.name for tag in self.medical_tags if tag.kind == MedicalTag.CONDITION]
+
+    def sync_medical_tags(self):
+        """Rebuild allergy/condition tags from the free-text fields"""
+        from app.models.medical_tag import MedicalTag
+        self.medical_tags = (
+            MedicalTag.get_or_create(MedicalTag.ALLERGY, MedicalTag.parse(self.allergies)) +
+            MedicalTag.get_or_create(MedicalTag.CONDITION, MedicalTag.parse(self.chronic_conditions))
+        )
+
+    @staticmethod
+    def find_by_tags(allergies=None, conditions=None, active_only=True):
+        """Query patients having every given allergy and chronic condition"""
+        from app.models.medical_tag import MedicalTag
+        patient_ids = MedicalTag.patient_ids_with_all(allergies, conditions)
+        if patient_ids is None:
+            return Patient.query.filter(db.false())
+
+        query = Patient.query.filter(Patient.id.in_(patient_ids))
+        if active_only:
+            query = query.filter_by(is_active=True)
+        return query
@@ -0,0 +1,68 @@
+"""
+Patient Import Model
+Tracks bulk patient imports so an interrupted file can be resumed
+"""
+import json
+from datetime import datetime
+from app import db
+
+
+class PatientImport(db.Model):
+    """
+    Progress of a bulk patient import from a CSV/XLSX file
+    Imports are identified by the SHA-256 of the file contents, so uploading
+    the same file again resumes after the last committed chunk
+    """
+    __tablename__ = 'patient_imports'
+
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Foreign Keys
+    created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
+
+    # Source File
+    filename = db.Column(db.String(256), nullable=False)
+    checksum = db.Column(db.String(64), nullable=False, index=True)  # SHA-256 of the file contents
+    column_mapping = db.Column(db.Text)  # JSON object: spreadsheet header -> Patient field
+
+    # Status: 'running', 'completed', 'failed'
+    status = db.Column(db.String(20), default='running', nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+
+    # Progress (row numbers are 1-based data rows, header excluded)
+    rows_processed = db.Column(db.Integer, default=0, nullable=False)  # Last row of the last committed chunk
+    rows_imported = db.Column(db.Integer, default=0, nullable=False)
+    rows_duplicate = db.Column(db.Integer, default=0, nullable=False)
+    rows_invalid = db.Column(db.Integer, default=0, nullable=False)
+    errors = db.Column(db.Text)  # JSON array of {'row': n, 'error': message}
+    failure_reason = db.Column(db.Text)
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    completed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<PatientImport {self.filename} ({self.status}) row {self.rows_processed}>'
+
+    def get_errors(self):
+        """Get the stored row errors as a list"""
+        return json.loads(self.errors) if self.errors else []
+
+    def add_errors(self, new_errors, limit):
+        """Append row errors, keeping at most `limit` entries"""
+        errors = self.get_errors()
+        if len(errors) < limit:
+            errors.extend(new_errors[:limit - len(errors)])
+            self.errors = json.dumps(errors)
+
+    @property
+    def status_badge_class(self):
+        """Return Bootstrap badge class based on status"""
+        status_classes = {
+            'running': 'bg-info',
+            'completed': 'bg-success',
+            'failed': 'bg-danger'
+        }
+        return status_classes.get(self.status, 'bg-secondary')
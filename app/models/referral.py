@@ -12,6 +12,10 @@ class Referral(db.Model):
     When a patient wants to refer a family member, friend, etc.
     """
     __tablename__ = 'referrals'
+    __table_args__ = (
+        # Per-patient referrals in date order (patient page, timeline)
+        db.Index('ix_referrals_patient_created', 'patient_id', 'created_at'),
+    )
 
     # Primary Key
     id = db.Column(db.Integer, primary_key=True)
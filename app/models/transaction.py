@@ -6,6 +6,10 @@ class Transaction(db.Model):
     """Transaction model for managing income and expenses"""
 
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Per-patient transactions in date order (patient pages, timeline)
+        db.Index('ix_transactions_patient_date', 'patient_id', 'transaction_date'),
+    )
 
     # Primary Key
     id = db.Column(db.Integer, primary_key=True)
@@ -119,7 +123,7 @@ class Transaction(db.Model):
     @staticmethod
     def get_total_income(start_date=None, end_date=None, status='completed'):
         """Calculate total income for a period"""
-        query = Transaction.query.filter(
+        query = db.session.query(db.func.sum(Transaction.amount)).filter(
             Transaction.transaction_type == 'income',
             Transaction.status == status
         )
@@ -129,16 +133,14 @@ class Transaction(db.Model):
         if end_date:
             query = query.filter(Transaction.transaction_date <= end_date)
 
-        total = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.id.in_([t.id for t in query.all()])
-        ).scalar()
+        total = query.scalar()
 
         return total or 0.0
 
     @staticmethod
     def get_total_expenses(start_date=None, end_date=None, status='completed'):
         """Calculate total expenses for a period"""
-        query = Transaction.query.filter(
+        query = db.session.query(db.func.sum(Transaction.amount)).filter(
             Transaction.transaction_type == 'expense',
             Transaction.status == status
         )
@@ -148,9 +150,7 @@ class Transaction(db.Model):
         if end_date:
             query = query.filter(Transaction.transaction_date <= end_date)
 
-        total = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.id.in_([t.id for t in query.all()])
-        ).scalar()
+        total = query.scalar()
 
         return total or 0.0
 
@@ -1,10 +1,37 @@
+import os
+import time
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
+from flask import current_app, has_app_context
 from flask_login import UserMixin
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
 from app import db, login_manager
+from app.utils.cache import TTLCache
 
 
-class User(UserMixin, db.Model):
+class UserRoles:
+    """Name and role helpers shared by User and CachedUser"""
+
+    @property
+    def full_name(self):
+        """Get user's full name"""
+        return f"{self.first_name} {self.last_name}"
+
+    def is_admin(self):
+        """Check if user is admin"""
+        return self.role == 'admin'
+
+    def is_doctor(self):
+        """Check if user is doctor"""
+        return self.role == 'doctor'
+
+    def is_receptionist(self):
+        """Check if user is receptionist"""
+        return self.role == 'receptionist'
+
+
+class User(UserMixin, UserRoles, db.Model):
     """User model for system authentication and role-based access"""
 
     __tablename__ = 'users'
@@ -48,37 +75,138 @@ class User(UserMixin, db.Model):
         return f'<User {self.username} ({self.role})>'
 
     def set_password(self, password):
-        """Hash and set user password"""
-        self.password_hash = generate_password_hash(password)
+        """Hash and set user password (with PASSWORD_HASH_METHOD)"""
+        self.password_hash = generate_password_hash(password, current_app.config['PASSWORD_HASH_METHOD'])
+
+    def upgrade_password_hash(self, password_hash):
+        """
+        Replace the hash with a new hash of the same password (e.g. made with newer parameters)
+        The password does not change, so unlike set_password() this is not a security
+        change: other workers' user snapshots stay valid.
+        """
+        self.password_hash = password_hash
+        db.session.info.setdefault(_REHASHED_KEY, set()).add(self.id)
 
     def check_password(self, password):
         """Verify password against hash"""
         return check_password_hash(self.password_hash, password)
 
+
+class CachedUser(UserMixin, UserRoles):
+    """
+    Detached snapshot of a user, served as current_user by the cached user loader
+    Holds the fields read on most requests, so role checks and the navbar
+    need no query. Anything else (check_password, set_password, relationships)
+    is delegated to the User row, loaded on first use in the current session,
+    so changes made through it are saved by the next commit as usual.
+    """
+    FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'phone',
+              'role', 'created_at', 'last_login')
+
+    def __init__(self, user):
+        for field in self.FIELDS:
+            self.__dict__[field] = getattr(user, field)
+        self._active = user.is_active
+
+    def __repr__(self):
+        return f'<CachedUser {self.username} ({self.role})>'
+
     @property
-    def full_name(self):
-        """Get user's full name"""
-        return f"{self.first_name} {self.last_name}"
+    def is_active(self):
+        return self._active
 
-    def is_admin(self):
-        """Check if user is admin"""
-        return self.role == 'admin'
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(db.session.get(User, self.id), name)
 
-    def is_doctor(self):
-        """Check if user is doctor"""
-        return self.role == 'doctor'
 
-    def is_receptionist(self):
-        """Check if user is receptionist"""
-        return self.role == 'receptionist'
+# Per-process snapshot cache, user id -> CachedUser. Commits that change a user drop
+# its snapshot here; password, role and status changes also bump the stamp file,
+# which makes every worker process drop all its snapshots on its next request
+# (a hash upgraded at login, User.upgrade_password_hash(), is not a password change).
+SECURITY_FIELDS = {'password_hash', 'role', 'is_active'}
+_PENDING_KEY = 'user_cache_changes'  # session.info key: (user ids, security change) to apply on commit
+_REHASHED_KEY = 'user_rehashed'  # session.info key: ids of users whose hash was upgraded, not changed
+_user_cache = TTLCache(ttl=60, max_entries=1024)
+_seen_stamp = None
+
+
+def _read_stamp():
+    try:
+        return os.stat(current_app.config['USER_CACHE_STAMP']).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _check_stamp():
+    """Drop every snapshot if another process bumped the stamp since the last check"""
+    global _seen_stamp
+    stamp = _read_stamp()
+    if stamp != _seen_stamp:
+        _user_cache.clear()
+        _seen_stamp = stamp
+
+
+def bump_user_cache_stamp():
+    """Invalidate the user snapshots of every worker process"""
+    path = current_app.config['USER_CACHE_STAMP']
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a'):
+        pass
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+    _user_cache.clear()
+
 
-    def update_last_login(self):
-        """Update last login timestamp"""
-        self.last_login = datetime.utcnow()
-        db.session.commit()
+def forget_cached_user(user_id):
+    """Drop this process's snapshot of a user changed outside the session (e.g. by a Core UPDATE)"""
+    _user_cache.pop(user_id)
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    """Flask-Login user loader"""
-    return User.query.get(int(user_id))
+    """Flask-Login user loader, served from the per-process snapshot cache"""
+    _check_stamp()
+    user_id = int(user_id)
+    user = _user_cache.get(user_id)
+    if user is None:
+        row = db.session.get(User, user_id)
+        if row is None:
+            return None
+        user = CachedUser(row)
+        _user_cache.set(user_id, user, ttl=current_app.config['USER_CACHE_TTL'])
+    return user
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_user_changes(session, flush_context):
+    user_ids, security = session.info.get(_PENDING_KEY, (set(), False))
+    for instance in list(session.dirty) + list(session.deleted):
+        if not isinstance(instance, User):
+            continue
+        state = inspect(instance)
+        changed = {attr.key for attr in state.mapper.column_attrs if state.attrs[attr.key].history.has_changes()}
+        if instance.id in session.info.get(_REHASHED_KEY, ()):
+            changed.discard('password_hash')
+        if changed or state.deleted:
+            user_ids.add(instance.id)
+            security = security or state.deleted or bool(changed & SECURITY_FIELDS)
+    if user_ids:
+        session.info[_PENDING_KEY] = (user_ids, security)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_users(session):
+    session.info.pop(_REHASHED_KEY, None)
+    user_ids, security = session.info.pop(_PENDING_KEY, (set(), False))
+    if security and has_app_context():
+        bump_user_cache_stamp()
+    for user_id in user_ids:
+        _user_cache.pop(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_user_changes(session):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_REHASHED_KEY, None)
@@ -0,0 +1,105 @@
+"""
+Vital Reading Model
+Narrow time-series copy of the vital signs stored on medical records
+"""
+from sqlalchemy import event, insert, inspect
+from app import db
+from app.models.medical_record import MedicalRecord
+
+
+class VitalReading(db.Model):
+    """
+    One vital sign value at one point in time (patient_id, metric, ts, value)
+    Trend charts read these instead of whole medical records; the covering
+    index answers a (patient, metric, time range) query without touching the table
+    """
+    __tablename__ = 'vital_readings'
+    __table_args__ = (
+        db.Index('ix_vital_readings_series', 'patient_id', 'metric', 'ts', 'value'),
+    )
+
+    # Metric name -> MedicalRecord column
+    METRICS = {
+        'temperature': 'temperature',
+        'bp_systolic': 'blood_pressure_systolic',
+        'bp_diastolic': 'blood_pressure_diastolic',
+        'heart_rate': 'heart_rate',
+        'respiratory_rate': 'respiratory_rate',
+        'oxygen_saturation': 'oxygen_saturation',
+        'weight': 'weight',
+        'height': 'height',
+    }
+
+    # Primary Key
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Foreign Keys
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id', ondelete='CASCADE'), nullable=False)
+    medical_record_id = db.Column(db.Integer, db.ForeignKey('medical_records.id', ondelete='CASCADE'),
+                                  nullable=True, index=True)  # Source record
+
+    # Reading
+    metric = db.Column(db.String(32), nullable=False)
+    ts = db.Column(db.DateTime, nullable=False)
+    value = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<VitalReading Patient:{self.patient_id} {self.metric}={self.value} at {self.ts}>'
+
+    @staticmethod
+    def rows_for_record(record_id, patient_id, visit_date, values):
+        """Reading rows for one medical record; `values` maps MedicalRecord column -> value"""
+        return [
+            {
+                'patient_id': patient_id,
+                'medical_record_id': record_id,
+                'metric': metric,
+                'ts': visit_date,
+                'value': float(values[column])
+            }
+            for metric, column in VitalReading.METRICS.items()
+            if values.get(column) is not None
+        ]
+
+    @staticmethod
+    def sync_records(connection, records):
+        """
+        Replace the readings of many medical records.
+        `records` is a list of (record_id, patient_id, visit_date, {column: value}).
+        """
+        if not records:
+            return
+        table = VitalReading.__table__
+        connection.execute(table.delete().where(
+            table.c.medical_record_id.in_([record[0] for record in records])
+        ))
+        rows = [row for record in records for row in VitalReading.rows_for_record(*record)]
+        if rows:
+            connection.execute(insert(table), rows)
+
+
+def _record_values(record):
+    return (record.id, record.patient_id, record.visit_date,
+            {column: getattr(record, column) for column in VitalReading.METRICS.values()})
+
+
+@event.listens_for(MedicalRecord, 'after_insert')
+def insert_record_vitals(mapper, connection, record):
+    """Add the readings of a new medical record"""
+    VitalReading.sync_records(connection, [_record_values(record)])
+
+
+@event.listens_for(MedicalRecord, 'after_update')
+def update_record_vitals(mapper, connection, record):
+    """Rewrite the readings of a medical record when its vitals, date or patient change"""
+    state = inspect(record)
+    if any(state.attrs[column].history.has_changes()
+           for column in list(VitalReading.METRICS.values()) + ['visit_date', 'patient_id']):
+        VitalReading.sync_records(connection, [_record_values(record)])
+
+
+@event.listens_for(MedicalRecord, 'before_delete')
+def delete_record_vitals(mapper, connection, record):
+    """Remove the readings of a deleted medical record"""
+    table = VitalReading.__table__
+    connection.execute(table.delete().where(table.c.medical_record_id == record.id))
@@ -0,0 +1,143 @@
+"""
+Patient archive
+Moves long-inactive patients and their history out of the hot tables.
+
+A patient is archived when it has been deactivated, not updated for
+`inactive_days`, and has no visits or appointments in that period and no
+pending payments. Its medical records, appointments, referrals, attachment
+rows and device-ingested vital readings are moved to archived_records
+together with the patient row (readings copied from medical records are
+rebuilt from the archived records, so those are only deleted). Transactions stay in the
+ledger so financial reports are unchanged: a copy is archived with the
+patient and the ledger row is detached (patient_id set to NULL).
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app import db
+from app.models import (Patient, MedicalRecord, Appointment, Transaction, Referral, VitalReading, Attachment, Counter,
+                        AuditEvent)
+from app.models.archive import ArchivedPatient, ArchivedRecord, serialize_row
+from app.models.medical_tag import patient_medical_tags
+from app.medical.search import remove_records
+from app.utils import audit
+
+DEFAULT_INACTIVE_DAYS = 730
+
+# Dependent tables archived with the patient: (entity name, model, date column, extra condition)
+DEPENDENTS = [
+    ('medical_record', MedicalRecord, MedicalRecord.visit_date, None),
+    ('appointment', Appointment, Appointment.appointment_date, None),
+    ('transaction', Transaction, Transaction.transaction_date, None),
+    ('referral', Referral, Referral.created_at, None),
+    ('attachment', Attachment, Attachment.created_at, None),
+    # Readings from bedside devices have no source medical record
+    ('vital_reading', VitalReading, VitalReading.ts, VitalReading.medical_record_id.is_(None)),
+]
+
+
+def archivable_patients(inactive_days=DEFAULT_INACTIVE_DAYS):
+    """Query the ids of patients eligible for archiving"""
+    cutoff = datetime.utcnow() - timedelta(days=inactive_days)
+
+    recent_visit = db.session.query(MedicalRecord.id).filter(
+        MedicalRecord.patient_id == Patient.id,
+        MedicalRecord.visit_date >= cutoff
+    ).exists()
+    recent_appointment = db.session.query(Appointment.id).filter(
+        Appointment.patient_id == Patient.id,
+        Appointment.appointment_date >= cutoff
+    ).exists()
+    pending_payment = db.session.query(Transaction.id).filter(
+        Transaction.patient_id == Patient.id,
+        Transaction.status == 'pending'
+    ).exists()
+
+    return db.session.query(Patient.id).filter(
+        Patient.is_active == db.false(),
+        Patient.updated_at < cutoff,
+        ~recent_visit,
+        ~recent_appointment,
+        ~pending_payment
+    )
+
+
+def _archive_batch(patient_ids):
+    """Copy a batch of patients and their dependents to the archive, then remove them"""
+    now = datetime.utcnow()
+    patients = db.session.execute(
+        Patient.__table__.select().where(Patient.__table__.c.id.in_(patient_ids))
+    ).mappings().all()
+    db.session.execute(insert(ArchivedPatient), [{
+        'id': row['id'],
+        'first_name': row['first_name'],
+        'last_name': row['last_name'],
+        'data': serialize_row(row),
+        'archived_at': now
+    } for row in patients])
+
+    archived_appointment_ids = []
+    for entity, model, date_column, condition in DEPENDENTS:
+        table = model.__table__
+        query = table.select().where(table.c.patient_id.in_(patient_ids))
+        if condition is not None:
+            query = query.where(condition)
+        rows = db.session.execute(query).mappings().all()
+        if not rows:
+            continue
+        db.session.execute(insert(ArchivedRecord), [{
+            'patient_id': row['patient_id'],
+            'entity': entity,
+            'entity_id': row['id'],
+            'record_date': row[date_column.key],
+            'data': serialize_row(row),
+            'sha256': row['sha256'] if entity == 'attachment' else None
+        } for row in rows])
+        if entity == 'appointment':
+            archived_appointment_ids = [row['id'] for row in rows]
+
+    # Transactions stay in the ledger, detached from the archived patient/appointments
+    transactions = Transaction.__table__
+    db.session.execute(
+        transactions.update().where(transactions.c.patient_id.in_(patient_ids)).values(patient_id=None)
+    )
+    if archived_appointment_ids:
+        db.session.execute(
+            transactions.update()
+            .where(transactions.c.appointment_id.in_(archived_appointment_ids))
+            .values(appointment_id=None)
+        )
+
+    # Search index rows are not covered by the Core deletes below
+    record_ids = [record_id for (record_id,) in
+                  db.session.query(MedicalRecord.id).filter(MedicalRecord.patient_id.in_(patient_ids))]
+    remove_records(db.session.connection(), record_ids)
+
+    # Vital readings: copied from the medical records or, for device readings, archived above
+    db.session.execute(VitalReading.__table__.delete().where(VitalReading.__table__.c.patient_id.in_(patient_ids)))
+    # Attachment files stay in the store; the archived rows still refer to their hash
+    for model in (Attachment, MedicalRecord, Appointment, Referral):
+        db.session.execute(model.__table__.delete().where(model.__table__.c.patient_id.in_(patient_ids)))
+    db.session.execute(patient_medical_tags.delete().where(patient_medical_tags.c.patient_id.in_(patient_ids)))
+    db.session.execute(Patient.__table__.delete().where(Patient.__table__.c.id.in_(patient_ids)))
+    audit.record_on_commit(db.session, AuditEvent.DELETE, 'medical_record', record_ids)
+    audit.record_on_commit(db.session, AuditEvent.DELETE, 'patient', patient_ids)
+    # Archived patients are inactive with no pending payments: only their own counters go
+    db.session.execute(Counter.__table__.delete().where(Counter.__table__.c.subject_id.in_(patient_ids),
+                                                        Counter.__table__.c.name.in_([Counter.MEDICAL_RECORDS,
+                                                                                      Counter.APPOINTMENTS])))
+    db.session.commit()
+
+
+def archive_inactive_patients(inactive_days=DEFAULT_INACTIVE_DAYS, batch_size=200):
+    """
+    Archive every eligible patient, one committed batch at a time.
+    Returns the number of patients archived.
+    """
+    total = 0
+    while True:
+        patient_ids = [patient_id for (patient_id,) in
+                       archivable_patients(inactive_days).order_by(Patient.id).limit(batch_size)]
+        if not patient_ids:
+            return total
+        _archive_batch(patient_ids)
+        total += len(patient_ids)
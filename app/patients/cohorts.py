@@ -0,0 +1,168 @@
+"""
+Patient cohort queries
+Builds demographic/clinical patient filters into a single indexed SQL query.
+
+Example: women 40-60, blood type O-, diabetic, seen in the last year
+
+    cohort = (Cohort()
+              .gender('female')
+              .age_between(40, 60)
+              .blood_type('O-')
+              .with_conditions('diabetes')
+              .seen_within(days=365))
+    cohort.count()
+    for patient_id in cohort.iter_ids():
+        ...
+
+Age never goes through Patient.age: an age range is turned into a
+date_of_birth range so the filter can use the patients indexes.
+"""
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+from app import db
+from app.models import Patient, MedicalRecord, MedicalTag
+
+
+class Cohort:
+    """Composable patient filter; every method returns the cohort for chaining"""
+
+    def __init__(self, active_only=True):
+        self.criteria = []
+        self.empty = False
+        if active_only:
+            self.criteria.append(Patient.is_active == db.true())
+
+    def age_between(self, min_age=None, max_age=None):
+        """Keep patients whose age (in whole years, as Patient.age) is within the range"""
+        today = datetime.utcnow().date()
+        if min_age is not None:
+            self.criteria.append(Patient.date_of_birth <= today - relativedelta(years=min_age))
+        if max_age is not None:
+            self.criteria.append(Patient.date_of_birth > today - relativedelta(years=max_age + 1))
+        return self
+
+    def born_between(self, start_date=None, end_date=None):
+        """Keep patients born within the date range (inclusive)"""
+        if start_date:
+            self.criteria.append(Patient.date_of_birth >= start_date)
+        if end_date:
+            self.criteria.append(Patient.date_of_birth <= end_date)
+        return self
+
+    def _any_of(self, column, values):
+        values = [value for value in values if value]
+        if values:
+            self.criteria.append(column == values[0] if len(values) == 1 else column.in_(values))
+        return self
+
+    def gender(self, *values):
+        return self._any_of(Patient.gender, values)
+
+    def blood_type(self, *values):
+        return self._any_of(Patient.blood_type, values)
+
+    def city(self, *values):
+        return self._any_of(Patient.city, values)
+
+    def insurance_provider(self, *values):
+        return self._any_of(Patient.insurance_provider, values)
+
+    def _with_tags(self, allergies=(), conditions=()):
+        allergies = [name for name in allergies if name]
+        conditions = [name for name in conditions if name]
+        if allergies or conditions:
+            patient_ids = MedicalTag.patient_ids_with_all(allergies, conditions)
+            if patient_ids is None:
+                self.empty = True
+            else:
+                self.criteria.append(Patient.id.in_(patient_ids))
+        return self
+
+    def with_conditions(self, *names):
+        """Keep patients having every given chronic condition"""
+        return self._with_tags(conditions=names)
+
+    def with_allergies(self, *names):
+        """Keep patients having every given allergy"""
+        return self._with_tags(allergies=names)
+
+    def seen_since(self, since):
+        """Keep patients with a medical record (visit) on or after `since`"""
+        self.criteria.append(
+            db.session.query(MedicalRecord.id).filter(
+                MedicalRecord.patient_id == Patient.id,
+                MedicalRecord.visit_date >= since
+            ).exists()
+        )
+        return self
+
+    def seen_within(self, days):
+        """Keep patients seen in the last `days` days"""
+        return self.seen_since(datetime.utcnow() - timedelta(days=days))
+
+    def not_seen_since(self, since):
+        """Keep patients without any visit on or after `since`"""
+        self.criteria.append(
+            ~db.session.query(MedicalRecord.id).filter(
+                MedicalRecord.patient_id == Patient.id,
+                MedicalRecord.visit_date >= since
+            ).exists()
+        )
+        return self
+
+    def query(self):
+        """Patient query for the cohort"""
+        if self.empty:
+            return Patient.query.filter(db.false())
+        return Patient.query.filter(*self.criteria)
+
+    def count(self):
+        """Number of patients in the cohort (single COUNT query)"""
+        if self.empty:
+            return 0
+        return db.session.query(db.func.count(Patient.id)).filter(*self.criteria).scalar()
+
+    def iter_rows(self, *columns, batch_size=1000):
+        """
+        Stream selected patient columns in id order, one keyset-paginated batch at a time.
+        Memory stays bounded by `batch_size` regardless of cohort size.
+        """
+        if self.empty:
+            return
+        columns = columns or (Patient.id,)
+        last_id = 0
+        while True:
+            batch = db.session.query(Patient.id, *columns).filter(
+                *self.criteria, Patient.id > last_id
+            ).order_by(Patient.id).limit(batch_size).all()
+            if not batch:
+                return
+            for row in batch:
+                yield row[1:]
+            last_id = batch[-1][0]
+
+    def iter_ids(self, batch_size=1000):
+        """Stream patient ids in the cohort"""
+        for (patient_id,) in self.iter_rows(Patient.id, batch_size=batch_size):
+            yield patient_id
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Build a cohort from request arguments:
+        min_age, max_age, gender, blood_type, city, insurance_provider
+        (repeatable), condition, allergy (repeatable or comma separated),
+        seen_within_days
+        """
+        cohort = cls()
+        cohort.age_between(args.get('min_age', type=int), args.get('max_age', type=int))
+        cohort.gender(*args.getlist('gender'))
+        cohort.blood_type(*args.getlist('blood_type'))
+        cohort.city(*args.getlist('city'))
+        cohort.insurance_provider(*args.getlist('insurance_provider'))
+        cohort.with_conditions(*MedicalTag.parse(','.join(args.getlist('condition'))))
+        cohort.with_allergies(*MedicalTag.parse(','.join(args.getlist('allergy'))))
+        seen_within_days = args.get('seen_within_days', type=int)
+        if seen_within_days:
+            cohort.seen_within(seen_within_days)
+        return cohort
@@ -0,0 +1,262 @@
+"""
+Patient history export
+Builds a PDF of a patient's medical records, appointments and transactions
+in a background worker process.
+
+Requests only queue an ExportJob; a ProcessPoolExecutor (EXPORT_WORKERS
+processes, each with its own app and database connections) renders it. Rows
+are read in keyset-paginated chunks of only the columns printed and written
+straight to a streaming PDF writer, so memory stays flat however long the
+history is. Progress is committed after every chunk for the status page to
+poll. With EXPORT_WORKERS = 0 the job runs inline (used for testing).
+
+If a worker process dies the pool is broken; the next export builds a new
+one. Jobs it was handling stay pending/running and are marked failed once
+they are older than EXPORT_TIMEOUT.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import ExportJob, Patient, MedicalRecord, Appointment, Transaction
+from app.utils.pdf import PdfWriter
+
+CHUNK_SIZE = 200
+
+_executor = None
+_executor_pid = None
+_worker_app = None
+
+# Section title, model, date column, printed columns
+SECTIONS = [
+    ('Medical Records', MedicalRecord, MedicalRecord.visit_date, [
+        'visit_reason', 'symptoms', 'diagnosis', 'treatment', 'prescription', 'lab_results',
+        'temperature', 'blood_pressure_systolic', 'blood_pressure_diastolic', 'heart_rate',
+        'oxygen_saturation', 'weight', 'height', 'follow_up_required', 'follow_up_date',
+    ]),
+    ('Appointments', Appointment, Appointment.appointment_date, [
+        'appointment_type', 'reason', 'status', 'duration_minutes',
+    ]),
+    ('Transactions', Transaction, Transaction.transaction_date, [
+        'transaction_type', 'category', 'description', 'amount', 'currency', 'status',
+    ]),
+]
+
+
+def iter_chunks(model, date_column, columns, patient_id, chunk_size=CHUNK_SIZE):
+    """Yield lists of row tuples (id, date, *columns) for a patient, oldest first"""
+    selected = [model.id, date_column] + [getattr(model, column) for column in columns]
+    last = None
+    while True:
+        query = db.session.query(*selected).filter(model.patient_id == patient_id)
+        if last is not None:
+            query = query.filter(db.tuple_(date_column, model.id) > last)
+        rows = query.order_by(date_column, model.id).limit(chunk_size).all()
+        if not rows:
+            return
+        yield rows
+        last = (rows[-1][1], rows[-1][0])
+
+
+def _write_medical_record(writer, row):
+    (_, visit_date, reason, symptoms, diagnosis, treatment, prescription, lab_results,
+     temperature, systolic, diastolic, heart_rate, oxygen, weight, height, follow_up, follow_up_date) = row
+
+    writer.text(f"{visit_date.strftime('%Y-%m-%d %H:%M')} - {reason}", size=10, bold=True)
+    vitals = [label for label in (
+        f'Temp {temperature} C' if temperature else None,
+        f'BP {systolic}/{diastolic}' if systolic and diastolic else None,
+        f'HR {heart_rate} bpm' if heart_rate else None,
+        f'SpO2 {oxygen}%' if oxygen else None,
+        f'Weight {weight} kg' if weight else None,
+        f'Height {height} cm' if height else None,
+    ) if label]
+    if vitals:
+        writer.text('Vitals: ' + ', '.join(vitals), size=9, indent=12)
+    for label, value in (('Symptoms', symptoms), ('Diagnosis', diagnosis), ('Treatment', treatment),
+                         ('Prescription', prescription), ('Lab results', lab_results)):
+        if value:
+            writer.text(f'{label}: {value}', size=9, indent=12)
+    if follow_up:
+        writer.text('Follow-up: ' + (follow_up_date.strftime('%Y-%m-%d') if follow_up_date else 'required'),
+                    size=9, indent=12)
+    writer.spacer(4)
+
+
+def _write_appointment(writer, row):
+    _, appointment_date, appointment_type, reason, status, duration = row
+    writer.text(f"{appointment_date.strftime('%Y-%m-%d %H:%M')}  {(appointment_type or 'appointment').replace('_', ' ')}"
+                f" ({duration} min) - {status}: {reason}", size=9)
+
+
+def _write_transaction(writer, row):
+    _, transaction_date, transaction_type, category, description, amount, currency, status = row
+    writer.text(f"{transaction_date.strftime('%Y-%m-%d')}  {transaction_type} / {category}  "
+                f"{amount:,.2f} {currency} ({status}) - {description}", size=9)
+
+
+WRITERS = {
+    MedicalRecord: _write_medical_record,
+    Appointment: _write_appointment,
+    Transaction: _write_transaction,
+}
+
+
+def write_patient_history(fileobj, patient, progress=None):
+    """Write the PDF of a patient's history; progress(n) is called after each chunk"""
+    writer = PdfWriter(fileobj, title=f'{patient.full_name} - Medical History',
+                       footer=f'{patient.full_name} - generated {datetime.utcnow():%Y-%m-%d %H:%M} UTC')
+
+    writer.text(f'{patient.full_name}', size=18, bold=True)
+    writer.text(f"Date of birth: {patient.date_of_birth.strftime('%Y-%m-%d')}  Gender: {patient.gender}  "
+                f"Blood type: {patient.blood_type or 'unknown'}", size=10)
+    if patient.allergies:
+        writer.text(f'Allergies: {patient.allergies}', size=10)
+    if patient.chronic_conditions:
+        writer.text(f'Chronic conditions: {patient.chronic_conditions}', size=10)
+    writer.rule()
+
+    for title, model, date_column, columns in SECTIONS:
+        writer.heading(title)
+        empty = True
+        for rows in iter_chunks(model, date_column, columns, patient.id):
+            empty = False
+            for row in rows:
+                WRITERS[model](writer, row)
+            if progress:
+                progress(len(rows))
+        if empty:
+            writer.text('None', size=9)
+
+    writer.close()
+
+
+def run_export_job(job_id):
+    """Build the result of a pending export job (runs inside an app context)"""
+    job = ExportJob.query.get(job_id)
+    if job is None or job.status != 'pending':
+        return
+
+    patient = Patient.query.get(job.patient_id)
+    job.status = 'running'
+    job.started_at = datetime.utcnow()
+    job.items_total = sum(model.query.filter_by(patient_id=job.patient_id).count() for _, model, _, _ in SECTIONS)
+    db.session.commit()
+
+    folder = current_app.config['EXPORT_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    filename = f'patient-{job.patient_id}-history-{job.id}.pdf'
+    temp_path = os.path.join(folder, filename + '.part')
+
+    def progress(count):
+        job.items_done += count
+        db.session.commit()
+
+    try:
+        with open(temp_path, 'wb') as fileobj:
+            write_patient_history(fileobj, patient, progress)
+        os.replace(temp_path, os.path.join(folder, filename))
+    except Exception as error:
+        db.session.rollback()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        job.status = 'failed'
+        job.failure_reason = str(error)
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+        current_app.logger.exception('Export job %s failed', job_id)
+        return
+
+    job.status = 'completed'
+    job.result_path = filename
+    job.result_size = os.path.getsize(os.path.join(folder, filename))
+    job.items_done = job.items_total
+    job.completed_at = datetime.utcnow()
+    db.session.commit()
+
+
+def _init_worker(config_name):
+    """Worker process initializer: one app (and connection pool) per process"""
+    global _worker_app
+    from app import create_app
+    _worker_app = create_app(config_name)
+
+
+def _run_in_worker(job_id):
+    with _worker_app.app_context():
+        run_export_job(job_id)
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        # spawn: workers must not inherit the parent's open database connections
+        _executor = ProcessPoolExecutor(
+            max_workers=current_app.config['EXPORT_WORKERS'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(current_app.config['CONFIG_NAME'],)
+        )
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def _submit(job_id):
+    """Hand a job to the pool, replacing the pool if a dead worker broke it"""
+    global _executor
+    try:
+        _get_executor().submit(_run_in_worker, job_id)
+    except BrokenProcessPool:
+        current_app.logger.error('Export worker pool was broken by a dead worker; starting a new one')
+        _executor = None
+        _get_executor().submit(_run_in_worker, job_id)
+
+
+def stale_cutoff():
+    """Creation time before which a pending or running job is considered lost"""
+    return datetime.utcnow() - timedelta(seconds=current_app.config['EXPORT_TIMEOUT'])
+
+
+def fail_stale_exports():
+    """Mark jobs still pending/running after EXPORT_TIMEOUT (their worker died) as failed"""
+    now = datetime.utcnow()
+    ExportJob.query.filter(ExportJob.status.in_(['pending', 'running']),
+                           ExportJob.created_at < stale_cutoff()).update({
+        'status': 'failed',
+        'failure_reason': 'The export did not finish in time. Please try again.',
+        'completed_at': now
+    }, synchronize_session=False)
+    db.session.commit()
+
+
+def purge_expired_exports():
+    """Delete export jobs (and their files) older than EXPORT_RETENTION_DAYS"""
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['EXPORT_RETENTION_DAYS'])
+    expired = ExportJob.query.filter(ExportJob.created_at < cutoff,
+                                     ExportJob.status.in_(['completed', 'failed'])).all()
+    for job in expired:
+        if job.result_path:
+            path = os.path.join(current_app.config['EXPORT_FOLDER'], job.result_path)
+            if os.path.exists(path):
+                os.remove(path)
+        db.session.delete(job)
+    db.session.commit()
+
+
+def queue_patient_history(patient, user_id):
+    """Create a patient history export job and hand it to the worker pool"""
+    fail_stale_exports()
+    purge_expired_exports()
+
+    job = ExportJob(kind=ExportJob.PATIENT_HISTORY, patient_id=patient.id, requested_by_id=user_id)
+    db.session.add(job)
+    db.session.commit()
+
+    if current_app.config['EXPORT_WORKERS']:
+        _submit(job.id)
+    else:
+        run_export_job(job.id)
+    return job
@@ -0,0 +1,338 @@
+"""
+Bulk patient import
+Streams CSV/XLSX spreadsheets into the patients table in validated chunks.
+
+Rows are read one at a time and grouped into chunks; each chunk is validated,
+checked for duplicates with a single indexed query, bulk inserted and
+committed together with the import progress. A failed import can be restarted
+with the same file and continues after the last committed chunk.
+"""
+import csv
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from datetime import date, datetime
+
+from dateutil import parser as date_parser
+from sqlalchemy import insert
+
+from app import db
+from app.models import Patient, PatientImport, MedicalTag, Counter, AuditEvent
+from app.utils import audit
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_STORED_ERRORS = 500
+
+# Patient fields that can be filled from a spreadsheet
+IMPORT_FIELDS = [
+    'first_name', 'last_name', 'date_of_birth', 'gender', 'blood_type',
+    'email', 'phone', 'address', 'city', 'state', 'zip_code', 'country',
+    'emergency_contact_name', 'emergency_contact_phone', 'emergency_contact_relationship',
+    'insurance_provider', 'insurance_number', 'allergies', 'chronic_conditions',
+    'notes', 'referred_by', 'referral_source', 'referral_notes'
+]
+
+REQUIRED_FIELDS = ['first_name', 'last_name', 'date_of_birth', 'phone']
+
+# Normalized spreadsheet headers recognized for each field (English and Spanish)
+COLUMN_ALIASES = {
+    'first_name': ['firstname', 'first', 'given_name', 'nombre', 'nombres'],
+    'last_name': ['lastname', 'last', 'surname', 'family_name', 'apellido', 'apellidos'],
+    'date_of_birth': ['dob', 'birth_date', 'birthdate', 'date_of_birth', 'fecha_de_nacimiento', 'fecha_nacimiento'],
+    'gender': ['sex', 'sexo', 'genero'],
+    'blood_type': ['blood_group', 'tipo_de_sangre', 'tipo_sangre', 'grupo_sanguineo'],
+    'email': ['e_mail', 'email_address', 'correo', 'correo_electronico'],
+    'phone': ['phone_number', 'telephone', 'mobile', 'cell', 'telefono', 'celular'],
+    'address': ['street', 'street_address', 'direccion'],
+    'city': ['town', 'ciudad'],
+    'state': ['province', 'region', 'estado', 'provincia'],
+    'zip_code': ['zip', 'postal_code', 'postcode', 'codigo_postal'],
+    'country': ['pais'],
+    'insurance_provider': ['insurance', 'insurer', 'aseguradora', 'seguro'],
+    'insurance_number': ['policy_number', 'numero_de_poliza', 'poliza'],
+    'allergies': ['allergy', 'alergias'],
+    'chronic_conditions': ['conditions', 'enfermedades_cronicas', 'condiciones_cronicas'],
+    'notes': ['comments', 'notas', 'observaciones'],
+}
+
+GENDER_VALUES = {
+    'm': 'male', 'male': 'male', 'man': 'male', 'h': 'male', 'hombre': 'male', 'masculino': 'male',
+    'f': 'female', 'female': 'female', 'woman': 'female', 'mujer': 'female', 'femenino': 'female',
+    'o': 'other', 'other': 'other', 'otro': 'other',
+}
+
+BLOOD_TYPES = {'A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'}
+
+
+def normalize_header(header):
+    """Normalize a spreadsheet header for alias matching ('Teléfono ' -> 'telefono')"""
+    text = unicodedata.normalize('NFKD', str(header or '')).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', '_', text.lower()).strip('_')
+
+
+def build_column_mapping(headers, mapping=None):
+    """
+    Map column positions to Patient fields.
+    An explicit `mapping` ({header: field}) takes precedence over the built-in aliases;
+    columns that match nothing are ignored.
+    """
+    explicit = {normalize_header(header): field for header, field in (mapping or {}).items()}
+    aliases = {}
+    for field, names in COLUMN_ALIASES.items():
+        aliases[field] = field
+        for name in names:
+            aliases[name] = field
+    for field in IMPORT_FIELDS:
+        aliases.setdefault(field, field)
+
+    columns = {}
+    for position, header in enumerate(headers):
+        key = normalize_header(header)
+        field = explicit.get(key) or aliases.get(key)
+        if field in IMPORT_FIELDS and field not in columns.values():
+            columns[position] = field
+
+    missing = [field for field in REQUIRED_FIELDS if field not in columns.values()]
+    if missing:
+        raise ValueError(f'Missing required columns: {", ".join(missing)}')
+    return columns
+
+
+def file_checksum(path):
+    """SHA-256 of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _iter_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        sample = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(f, dialect)
+
+
+def _iter_xlsx(path):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError('XLSX import requires openpyxl (pip install openpyxl).')
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def iter_spreadsheet(path):
+    """Yield spreadsheet rows as lists, header row first"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return _iter_csv(path)
+    if extension in ('.xlsx', '.xlsm'):
+        return _iter_xlsx(path)
+    raise ValueError('Unsupported file type. Please upload a .csv or .xlsx file.')
+
+
+def parse_date(value, dayfirst=True):
+    """Parse a spreadsheet date cell (date objects, ISO strings or local formats)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    try:
+        return datetime.strptime(text, '%Y-%m-%d').date()
+    except ValueError:
+        return date_parser.parse(text, dayfirst=dayfirst).date()
+
+
+def validate_row(row, columns, dayfirst=True):
+    """
+    Turn a raw spreadsheet row into Patient column values.
+    Returns (values, None) or (None, error message).
+    """
+    values = dict.fromkeys(IMPORT_FIELDS)
+    for position, field in columns.items():
+        cell = row[position] if position < len(row) else None
+        if cell is None:
+            continue
+        if field == 'date_of_birth':
+            values[field] = cell
+            continue
+        if isinstance(cell, float) and cell.is_integer():
+            cell = int(cell)  # Numeric XLSX cells such as phone numbers
+        text = str(cell).strip()
+        values[field] = text or None
+
+    for field in REQUIRED_FIELDS:
+        if values[field] in (None, ''):
+            return None, f'{field.replace("_", " ").capitalize()} is required'
+
+    try:
+        values['date_of_birth'] = parse_date(values['date_of_birth'], dayfirst=dayfirst)
+    except (ValueError, OverflowError):
+        return None, f'Invalid date of birth: {values["date_of_birth"]}'
+    if values['date_of_birth'] > datetime.utcnow().date():
+        return None, 'Date of birth is in the future'
+
+    if values['gender']:
+        gender = GENDER_VALUES.get(values['gender'].lower())
+        if gender is None:
+            return None, f'Invalid gender: {values["gender"]}'
+        values['gender'] = gender
+
+    if values['blood_type']:
+        blood_type = values['blood_type'].upper().replace(' ', '')
+        if blood_type not in BLOOD_TYPES:
+            return None, f'Invalid blood type: {values["blood_type"]}'
+        values['blood_type'] = blood_type
+
+    for field in IMPORT_FIELDS:
+        length = getattr(Patient.__table__.c[field].type, 'length', None)
+        if length and values[field] and len(values[field]) > length:
+            return None, f'{field.replace("_", " ").capitalize()} is longer than {length} characters'
+
+    return values, None
+
+
+def _name_key(first_name, last_name, date_of_birth):
+    return (first_name.strip().casefold(), last_name.strip().casefold(), date_of_birth)
+
+
+def _phone_key(phone, date_of_birth):
+    return (re.sub(r'\D', '', phone or ''), date_of_birth)
+
+
+def _import_chunk(job, chunk, columns, dayfirst):
+    """Validate, de-duplicate and insert one chunk of (row_number, row) pairs"""
+    errors = []
+    candidates = []
+    for row_number, row in chunk:
+        values, error = validate_row(row, columns, dayfirst=dayfirst)
+        if error:
+            errors.append({'row': row_number, 'error': error})
+        else:
+            candidates.append((row_number, values))
+
+    # One indexed lookup for the whole chunk: existing patients sharing a birth date
+    seen_names = set()
+    seen_phones = set()
+    birth_dates = {values['date_of_birth'] for _, values in candidates}
+    if birth_dates:
+        existing = db.session.query(
+            Patient.first_name, Patient.last_name, Patient.date_of_birth, Patient.phone
+        ).filter(Patient.date_of_birth.in_(birth_dates))
+        for first_name, last_name, date_of_birth, phone in existing:
+            seen_names.add(_name_key(first_name, last_name, date_of_birth))
+            seen_phones.add(_phone_key(phone, date_of_birth))
+
+    rows = []
+    duplicates = 0
+    for row_number, values in candidates:
+        name_key = _name_key(values['first_name'], values['last_name'], values['date_of_birth'])
+        phone_key = _phone_key(values['phone'], values['date_of_birth'])
+        if name_key in seen_names or phone_key in seen_phones:
+            duplicates += 1
+            continue
+        seen_names.add(name_key)
+        seen_phones.add(phone_key)
+        rows.append(values)
+
+    if rows:
+        inserted = db.session.execute(insert(Patient).returning(Patient.id, sort_by_parameter_order=True), rows).scalars().all()
+        # Bulk inserts skip the model events that maintain the counters (imported patients are active)
+        Counter.adjust(db.session.connection(), Counter.ACTIVE_PATIENTS, len(rows))
+        audit.record_on_commit(db.session, AuditEvent.CREATE, 'patient', inserted)
+        tagged = [
+            (patient_id, values['allergies'], values['chronic_conditions'])
+            for patient_id, values in zip(inserted, rows)
+            if values['allergies'] or values['chronic_conditions']
+        ]
+        if tagged:
+            MedicalTag.link_patients(tagged)
+
+    job.rows_processed = chunk[-1][0]
+    job.rows_imported += len(rows)
+    job.rows_duplicate += duplicates
+    job.rows_invalid += len(errors)
+    job.add_errors(errors, MAX_STORED_ERRORS)
+    db.session.commit()
+
+
+def import_patients(path, filename=None, mapping=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                    dayfirst=True, user_id=None):
+    """
+    Import patients from a CSV or XLSX file.
+
+    If an unfinished import of the same file exists it is resumed: rows up to
+    its last committed chunk are skipped without being validated again.
+    Returns the PatientImport tracking the run.
+    """
+    checksum = file_checksum(path)
+    job = PatientImport.query.filter_by(checksum=checksum).order_by(
+        PatientImport.created_at.desc()
+    ).first()
+
+    if job and job.status == 'completed':
+        return job
+
+    if job is None:
+        job = PatientImport(
+            filename=filename or os.path.basename(path),
+            checksum=checksum,
+            column_mapping=json.dumps(mapping) if mapping else None,
+            chunk_size=chunk_size,
+            created_by_id=user_id,
+            rows_processed=0,
+            rows_imported=0,
+            rows_duplicate=0,
+            rows_invalid=0
+        )
+        db.session.add(job)
+    else:
+        mapping = json.loads(job.column_mapping) if job.column_mapping else None
+    job.status = 'running'
+    job.failure_reason = None
+    db.session.commit()
+
+    try:
+        rows = iter_spreadsheet(path)
+        headers = next(rows, None)
+        if headers is None:
+            raise ValueError('The file is empty.')
+        columns = build_column_mapping(headers, mapping)
+
+        chunk = []
+        for row_number, row in enumerate(rows, start=1):
+            if row_number <= job.rows_processed:
+                continue
+            if not any(cell not in (None, '') for cell in row):
+                continue
+            chunk.append((row_number, row))
+            if len(chunk) >= job.chunk_size:
+                _import_chunk(job, chunk, columns, dayfirst)
+                chunk = []
+        if chunk:
+            _import_chunk(job, chunk, columns, dayfirst)
+
+        job.status = 'completed'
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        job.status = 'failed'
+        job.failure_reason = str(e)
+        db.session.commit()
+        raise
+
+    return job
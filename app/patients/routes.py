@@ -1,9 +1,18 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, current_app, Response, stream_with_context, abort, send_file
 from flask_login import login_required, current_user
 from app.patients import patients_bp
-from app.models import Patient, Referral
+from app.models import Patient, Referral, PatientImport, ArchivedPatient, ExportJob, Counter
+from app.patients.importer import import_patients as run_patient_import
+from app.patients.cohorts import Cohort
+from app.patients.timeline import timeline_page, DEFAULT_PAGE_SIZE
+from app.patients.exports import queue_patient_history, fail_stale_exports, stale_cutoff
 from app import db
 from datetime import datetime
+from werkzeug.utils import secure_filename
+import csv
+import io
+import os
+import secrets
 
 
 @patients_bp.route('/')
@@ -38,8 +47,87 @@ def index():
 @login_required
 def view(patient_id):
     """View patient details"""
+    patient = Patient.query.get(patient_id)
+
+    if patient is None:
+        # Long-inactive patients live in the archive tables
+        archived = ArchivedPatient.query.get_or_404(patient_id)
+        return render_template('patients/archived.html',
+                             archived=archived,
+                             patient=archived.to_patient(),
+                             medical_records=archived.get_records('medical_record'),
+                             appointments=archived.get_records('appointment'),
+                             transactions=archived.get_records('transaction'),
+                             referrals=archived.get_records('referral'))
+
+    return render_template('patients/view.html', patient=patient, counts=Counter.for_patient(patient.id))
+
+
+@patients_bp.route('/<int:patient_id>/export', methods=['POST'])
+@login_required
+def export_history(patient_id):
+    """Queue a PDF export of the patient's medical history"""
+    patient = Patient.query.get_or_404(patient_id)
+    job = queue_patient_history(patient, current_user.id)
+    return redirect(url_for('patients.export_status', job_id=job.id))
+
+
+@patients_bp.route('/exports/<int:job_id>')
+@login_required
+def export_status(job_id):
+    """Progress of an export job (JSON with format=json, for polling)"""
+    job = ExportJob.query.get_or_404(job_id)
+    if job.status in ('pending', 'running') and job.created_at < stale_cutoff():
+        fail_stale_exports()
+        db.session.refresh(job)
+
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'id': job.id,
+            'status': job.status,
+            'progress': job.progress,
+            'download_url': url_for('patients.export_download', job_id=job.id) if job.status == 'completed' else None,
+            'failure_reason': job.failure_reason
+        })
+
+    return render_template('patients/export.html', job=job, patient=Patient.query.get(job.patient_id))
+
+
+@patients_bp.route('/exports/<int:job_id>/download')
+@login_required
+def export_download(job_id):
+    """Download the result of a completed export job"""
+    job = ExportJob.query.get_or_404(job_id)
+    if job.status != 'completed':
+        abort(404)
+
+    path = os.path.join(current_app.config['EXPORT_FOLDER'], job.result_path)
+    if not os.path.exists(path):
+        abort(404)
+    return send_file(path, mimetype='application/pdf', as_attachment=True, download_name=job.download_name)
+
+
+@patients_bp.route('/<int:patient_id>/timeline')
+@login_required
+def timeline(patient_id):
+    """Patient history (visits, appointments, transactions, referrals) newest first"""
     patient = Patient.query.get_or_404(patient_id)
-    return render_template('patients/view.html', patient=patient)
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+
+    try:
+        entries, next_cursor = timeline_page(patient_id, cursor=cursor, limit=limit)
+    except ValueError:
+        abort(400)
+
+    # Infinite scroll requests the following pages as JSON
+    if request.args.get('format') == 'json':
+        return jsonify({'entries': entries, 'next_cursor': next_cursor})
+
+    return render_template('patients/timeline.html',
+                         patient=patient,
+                         entries=entries,
+                         next_cursor=next_cursor)
 
 
 @patients_bp.route('/create', methods=['GET', 'POST'])
@@ -152,6 +240,93 @@ def delete(patient_id):
     return redirect(url_for('patients.index'))
 
 
+@patients_bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_patients():
+    """Bulk import patients from a CSV/XLSX spreadsheet"""
+    if not current_user.is_admin():
+        flash('Only administrators can import patients.', 'danger')
+        return redirect(url_for('patients.index'))
+
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        filename = secure_filename(upload.filename) if upload and upload.filename else ''
+
+        if not filename or os.path.splitext(filename)[1].lower() not in ('.csv', '.xlsx', '.xlsm'):
+            flash('Please select a .csv or .xlsx file.', 'danger')
+            return redirect(url_for('patients.import_patients'))
+
+        # Saved under a unique name outside the static folder for the length of the import;
+        # an interrupted import is resumed by uploading the same file again
+        import_folder = current_app.config['IMPORT_FOLDER']
+        os.makedirs(import_folder, exist_ok=True)
+        path = os.path.join(import_folder, secrets.token_hex(16) + os.path.splitext(filename)[1].lower())
+        upload.save(path)
+
+        try:
+            job = run_patient_import(
+                path,
+                filename=filename,
+                dayfirst=request.form.get('date_format', 'dayfirst') == 'dayfirst',
+                user_id=current_user.id
+            )
+        except ValueError as e:
+            flash(f'Import failed: {e}', 'danger')
+            return redirect(url_for('patients.import_patients'))
+        finally:
+            os.remove(path)
+
+        flash(f'Import of {job.filename} finished: {job.rows_imported} imported, '
+              f'{job.rows_duplicate} duplicates skipped, {job.rows_invalid} invalid rows.', 'success')
+        return redirect(url_for('patients.import_patients'))
+
+    imports = PatientImport.query.order_by(PatientImport.created_at.desc()).limit(10).all()
+    return render_template('patients/import.html', imports=imports)
+
+
+@patients_bp.route('/cohort')
+@login_required
+def cohort():
+    """Build a patient cohort from demographic and clinical filters"""
+    patients = None
+    total = None
+
+    if request.args:
+        cohort = Cohort.from_args(request.args)
+        total = cohort.count()
+        patients = cohort.query().order_by(Patient.last_name, Patient.first_name).limit(20).all()
+
+    blood_types = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+    return render_template('patients/cohort.html',
+                         patients=patients,
+                         total=total,
+                         blood_types=blood_types)
+
+
+@patients_bp.route('/cohort/export')
+@login_required
+def cohort_export():
+    """Stream the cohort as CSV (for export or bulk messaging)"""
+    cohort = Cohort.from_args(request.args)
+    columns = (Patient.id, Patient.first_name, Patient.last_name, Patient.phone, Patient.email)
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['id', 'first_name', 'last_name', 'phone', 'email'])
+        for row in cohort.iter_rows(*columns):
+            writer.writerow(row)
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return Response(stream_with_context(generate()),
+                    mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=cohort.csv'})
+
+
 # ============================================================================
 # REFERRAL ROUTES - For patients who want to refer others
 # ============================================================================
@@ -0,0 +1,140 @@
+"""
+Patient timeline
+Merges a patient's medical records, appointments, transactions and referrals
+into one newest-first stream with cursor pagination.
+
+Each source is read with its own (patient_id, date) index seek starting just
+after the cursor and limited to one page (plus one look-ahead row), and the
+sources are merged lazily with a heap. A page therefore reads about `limit`
+rows per source no matter how long the patient's history is.
+
+Global order: date desc, then source rank, then id desc. The cursor is the
+sort key of the last entry returned, encoded as an opaque URL-safe token.
+"""
+import base64
+import heapq
+import json
+from datetime import datetime
+from flask import url_for
+from app import db
+from app.models import MedicalRecord, Appointment, Transaction, Referral
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def _medical_record_entry(record):
+    return {
+        'title': record.visit_reason,
+        'subtitle': record.diagnosis,
+        'status': 'abnormal vitals' if record.has_abnormal_vitals() else None,
+        'url': url_for('medical.view', record_id=record.id)
+    }
+
+
+def _appointment_entry(appointment):
+    return {
+        'title': appointment.reason,
+        'subtitle': f'{appointment.appointment_type or "appointment"} ({appointment.duration_minutes} min)',
+        'status': appointment.status,
+        'url': url_for('appointments.view', appointment_id=appointment.id)
+    }
+
+
+def _transaction_entry(transaction):
+    return {
+        'title': transaction.description,
+        'subtitle': f'{transaction.category} - ${transaction.amount:.2f}',
+        'status': transaction.status,
+        'url': url_for('finance.view', transaction_id=transaction.id)
+    }
+
+
+def _referral_entry(referral):
+    return {
+        'title': f'Referred {referral.referred_name}',
+        'subtitle': referral.relationship_display,
+        'status': referral.status,
+        'url': None
+    }
+
+
+# (type, model, date column, entry builder); list position is the tie-break rank
+SOURCES = [
+    ('medical_record', MedicalRecord, MedicalRecord.visit_date, _medical_record_entry),
+    ('appointment', Appointment, Appointment.appointment_date, _appointment_entry),
+    ('transaction', Transaction, Transaction.transaction_date, _transaction_entry),
+    ('referral', Referral, Referral.created_at, _referral_entry),
+]
+
+
+def encode_cursor(key):
+    """Encode a (date, rank, id) sort key as an opaque token"""
+    date, rank, item_id = key
+    payload = json.dumps([date.isoformat(), rank, item_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor token; raises ValueError if it is malformed"""
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        date, rank, item_id = json.loads(payload)
+        return datetime.fromisoformat(date), int(rank), int(item_id)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid timeline cursor')
+
+
+def _read_source(rank, model, date_column, patient_id, cursor, limit):
+    """
+    Yield (merge key, sort key, object) for one source, newest first, strictly after the cursor.
+    Reads one row more than the page so the caller can tell whether more entries exist.
+    """
+    query = model.query.filter(model.patient_id == patient_id)
+
+    if cursor:
+        cursor_date, cursor_rank, cursor_id = cursor
+        if rank > cursor_rank:
+            query = query.filter(date_column <= cursor_date)
+        elif rank < cursor_rank:
+            query = query.filter(date_column < cursor_date)
+        else:
+            query = query.filter(db.or_(
+                date_column < cursor_date,
+                db.and_(date_column == cursor_date, model.id < cursor_id)
+            ))
+
+    rows = query.order_by(date_column.desc(), model.id.desc()).limit(limit + 1).all()
+    for row in rows:
+        date = getattr(row, date_column.key)
+        yield (date, -rank, row.id), (date, rank, row.id), row
+
+
+def timeline_page(patient_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Return (entries, next_cursor) for one page of the patient's timeline.
+    `cursor` is a token from a previous page (None for the first page);
+    next_cursor is None when the timeline is exhausted.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    position = decode_cursor(cursor) if cursor else None
+
+    streams = [
+        _read_source(rank, model, date_column, patient_id, position, limit)
+        for rank, (_, model, date_column, _) in enumerate(SOURCES)
+    ]
+
+    entries = []
+    last_key = None
+    has_more = False
+    for _, key, row in heapq.merge(*streams, key=lambda item: item[0], reverse=True):
+        if len(entries) == limit:
+            has_more = True
+            break
+        item_type, _, _, build_entry = SOURCES[key[1]]
+        entry = build_entry(row)
+        entry.update({'type': item_type, 'id': row.id, 'date': key[0].isoformat()})
+        entries.append(entry)
+        last_key = key
+
+    return entries, encode_cursor(last_key) if has_more else None
@@ -1,11 +1,65 @@
-from flask import Blueprint, render_template, redirect, url_for
+from flask import Blueprint, render_template, redirect, url_for, current_app, request, abort, make_response, flash, jsonify
 from flask_login import login_required, current_user
-from app.models import Patient, Appointment, Transaction, MedicalRecord
+from app.models import Patient, Appointment, Transaction, MedicalRecord, Counter, AuditEvent, User
 from datetime import datetime, timedelta
+import hashlib
+import hmac
 from app import db
+from app.utils.cache import TTLCache, invalidate_on_commit
+from app.utils import audit, metrics, sqlstats
+from app.utils.database import pool_status
 
 main_bp = Blueprint('main', __name__)
 
+ACTIVE_APPOINTMENT_STATUSES = ['scheduled', 'confirmed', 'in_progress']
+
+# Dashboard statistics, keyed by date; cleared when patients, appointments or transactions change
+_stats_cache = TTLCache(ttl=30, max_entries=4)
+invalidate_on_commit(_stats_cache, Patient, Appointment, Transaction)
+
+
+def dashboard_stats():
+    """Dashboard counters and this month's totals in one query: stored counters plus conditional aggregates"""
+    today = datetime.utcnow().date()
+    today_start = datetime.combine(today, datetime.min.time())
+    week_start = today_start - timedelta(days=today.weekday())
+    month_start = today_start.replace(day=1)
+
+    appointments = db.select(
+        db.func.count(db.case((db.and_(Appointment.appointment_date >= today_start,
+                                       Appointment.appointment_date < today_start + timedelta(days=1)), 1)))
+        .label('appointments_today'),
+        db.func.count().label('appointments_week')
+    ).where(
+        Appointment.appointment_date >= week_start,
+        Appointment.status.in_(ACTIVE_APPOINTMENT_STATUSES)
+    ).subquery()
+
+    transactions = db.select(
+        db.func.coalesce(db.func.sum(db.case((Transaction.transaction_type == 'income', Transaction.amount))), 0)
+        .label('income_month'),
+        db.func.coalesce(db.func.sum(db.case((Transaction.transaction_type == 'expense', Transaction.amount))), 0)
+        .label('expenses_month')
+    ).where(
+        Transaction.status == 'completed',
+        Transaction.transaction_date >= month_start
+    ).subquery()
+
+    row = db.session.execute(
+        db.select(
+            Counter.value_of(Counter.ACTIVE_PATIENTS).label('total_patients'),
+            Counter.value_of(Counter.PENDING_PAYMENTS).label('pending_payments'),
+            appointments,
+            transactions
+        ).select_from(appointments).join(transactions, db.true())
+    ).mappings().one()
+
+    stats = dict(row)
+    stats['income_month'] = float(stats['income_month'])
+    stats['expenses_month'] = float(stats['expenses_month'])
+    stats['balance_month'] = stats['income_month'] - stats['expenses_month']
+    return stats
+
 
 @main_bp.route('/')
 def index():
@@ -15,73 +69,148 @@ def index():
     return redirect(url_for('auth.login'))
 
 
+def _stats_context():
+    return {'stats': _stats_cache.get_or_set(datetime.utcnow().date(), dashboard_stats,
+                                             ttl=current_app.config['DASHBOARD_CACHE_TTL'])}
+
+
+def _today_context():
+    today_start = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    return {'today_appointments': Appointment.query.options(db.joinedload(Appointment.patient)).filter(
+        Appointment.appointment_date >= today_start,
+        Appointment.appointment_date < today_start + timedelta(days=1),
+        Appointment.status.in_(ACTIVE_APPOINTMENT_STATUSES)
+    ).order_by(Appointment.appointment_date.asc()).all()}
+
+
+def _upcoming_context():
+    return {'upcoming_appointments': Appointment.query.options(db.joinedload(Appointment.patient)).filter(
+        Appointment.appointment_date >= datetime.utcnow(),
+        Appointment.status.in_(['scheduled', 'confirmed'])
+    ).order_by(Appointment.appointment_date.asc()).limit(5).all()}
+
+
+def _recent_patients_context():
+    return {'recent_patients': Patient.query.filter(Patient.is_active == db.true())
+            .order_by(Patient.created_at.desc()).limit(5).all()}
+
+
+def _recent_transactions_context():
+    return {'recent_transactions': Transaction.query.order_by(Transaction.transaction_date.desc()).limit(5).all()}
+
+
+# Dashboard panels: name -> (template, context loader, TTL in seconds (None: DASHBOARD_CACHE_TTL), models shown)
+FRAGMENTS = {
+    'stats': ('dashboard/stats.html', _stats_context, None, (Patient, Appointment, Transaction)),
+    'finance': ('dashboard/finance.html', _stats_context, None, (Transaction,)),
+    'today': ('dashboard/today_appointments.html', _today_context, 60, (Appointment, Patient)),
+    'upcoming': ('dashboard/upcoming_appointments.html', _upcoming_context, 60, (Appointment, Patient)),
+    'recent_patients': ('dashboard/recent_patients.html', _recent_patients_context, 600, (Patient,)),
+    'recent_transactions': ('dashboard/recent_transactions.html', _recent_transactions_context, 300, (Transaction,)),
+}
+
+# Rendered fragments (html, etag) keyed by date; panels hold no per-user content
+_fragment_caches = {name: TTLCache(ttl=ttl or 30, max_entries=2) for name, (_, _, ttl, _) in FRAGMENTS.items()}
+for _name, (_, _, _, _models) in FRAGMENTS.items():
+    invalidate_on_commit(_fragment_caches[_name], *_models)
+
+
 @main_bp.route('/dashboard')
 @login_required
 def dashboard():
-    """Main dashboard with statistics and recent activity"""
+    """Main dashboard shell; the panels are loaded from dashboard_fragment"""
+    return render_template('dashboard.html')
 
-    # Get current date
-    today = datetime.utcnow().date()
-    week_start = today - timedelta(days=today.weekday())
-    month_start = today.replace(day=1)
-
-    # Statistics
-    stats = {
-        'total_patients': Patient.query.filter_by(is_active=True).count(),
-        'appointments_today': Appointment.query.filter(
-            db.func.date(Appointment.appointment_date) == today,
-            Appointment.status.in_(['scheduled', 'confirmed', 'in_progress'])
-        ).count(),
-        'appointments_week': Appointment.query.filter(
-            Appointment.appointment_date >= week_start,
-            Appointment.status.in_(['scheduled', 'confirmed', 'in_progress'])
-        ).count(),
-        'pending_payments': Transaction.query.filter_by(
-            transaction_type='income',
-            status='pending'
-        ).count(),
-    }
-
-    # Financial summary (this month)
-    income_this_month = Transaction.get_total_income(
-        start_date=month_start,
-        status='completed'
-    )
-    expenses_this_month = Transaction.get_total_expenses(
-        start_date=month_start,
-        status='completed'
-    )
-    balance_this_month = income_this_month - expenses_this_month
-
-    stats['income_month'] = income_this_month
-    stats['expenses_month'] = expenses_this_month
-    stats['balance_month'] = balance_this_month
-
-    # Recent appointments (next 5)
-    upcoming_appointments = Appointment.query.filter(
-        Appointment.appointment_date >= datetime.utcnow(),
-        Appointment.status.in_(['scheduled', 'confirmed'])
-    ).order_by(Appointment.appointment_date.asc()).limit(5).all()
-
-    # Today's appointments
-    today_appointments = Appointment.query.filter(
-        db.func.date(Appointment.appointment_date) == today,
-        Appointment.status.in_(['scheduled', 'confirmed', 'in_progress'])
-    ).order_by(Appointment.appointment_date.asc()).all()
-
-    # Recent patients (last 5 registered)
-    recent_patients = Patient.query.order_by(
-        Patient.created_at.desc()
-    ).limit(5).all()
-
-    # Recent transactions (last 5)
-    recent_transactions = Transaction.query.order_by(
-        Transaction.transaction_date.desc()
-    ).limit(5).all()
-
-    return render_template('dashboard.html',
-                         stats=stats,
-                         upcoming_appointments=upcoming_appointments,
-                         today_appointments=today_appointments,
-                         recent_patients=recent_patients,
-                         recent_transactions=recent_transactions)
+
+@main_bp.route('/dashboard/fragments/<name>')
+@login_required
+def dashboard_fragment(name):
+    """One dashboard panel as an HTML fragment, cached server-side and validated by ETag"""
+    if name not in FRAGMENTS:
+        abort(404)
+    template, load_context, ttl, _ = FRAGMENTS[name]
+
+    def render():
+        html = render_template(template, **load_context())
+        return html, hashlib.sha1(html.encode()).hexdigest()
+
+    html, etag = _fragment_caches[name].get_or_set(datetime.utcnow().date(), render,
+                                                   ttl=ttl or current_app.config['DASHBOARD_CACHE_TTL'])
+
+    response = make_response(html)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'  # Always revalidate: 304 while unchanged
+    return response.make_conditional(request)
+
+
+@main_bp.route('/audit')
+@login_required
+def audit_log():
+    """Audit log viewer, newest first, keyset-paginated (?before=<id>)"""
+    if not current_user.is_admin():
+        flash('Only administrators can view the audit log.', 'danger')
+        return redirect(url_for('main.dashboard'))
+
+    audit.flush()  # Include events still buffered in this process
+
+    user_id = request.args.get('user_id', type=int)
+    action = request.args.get('action', '')
+    entity = request.args.get('entity', '')
+    entity_id = request.args.get('entity_id', type=int)
+    before = request.args.get('before', type=int)
+    page_size = current_app.config['ITEMS_PER_PAGE'] * 5
+
+    query = AuditEvent.query.options(db.joinedload(AuditEvent.user))
+    if user_id:
+        query = query.filter(AuditEvent.user_id == user_id)
+    if action:
+        query = query.filter(AuditEvent.action == action)
+    if entity:
+        query = query.filter(AuditEvent.entity == entity)
+        if entity_id:
+            query = query.filter(AuditEvent.entity_id == entity_id)
+    if before:
+        query = query.filter(AuditEvent.id < before)
+    events = query.order_by(AuditEvent.id.desc()).limit(page_size + 1).all()
+
+    next_before = events[page_size - 1].id if len(events) > page_size else None
+    filters = {key: value for key, value in request.args.items() if key != 'before' and value}
+    return render_template('audit/index.html',
+                           events=events[:page_size],
+                           next_before=next_before,
+                           filters=filters,
+                           users=User.query.order_by(User.username).all(),
+                           actions=[AuditEvent.VIEW, AuditEvent.CREATE, AuditEvent.UPDATE, AuditEvent.DELETE,
+                                    AuditEvent.LOGIN, AuditEvent.LOGOUT],
+                           entities=sorted(set(audit.VIEW_ARGUMENTS.values()) | {'user'}))
+
+
+@main_bp.route('/status/database')
+@login_required
+def database_status():
+    """Connection pool usage and checkout waits of the worker serving the request (JSON, admins)"""
+    if not current_user.is_admin():
+        abort(403)
+    return jsonify(pool_status(db.engine))
+
+
+@main_bp.route('/status/sql')
+@login_required
+def sql_status():
+    """Queries per endpoint of the sampled requests served by this worker (JSON, admins)"""
+    if not current_user.is_admin():
+        abort(403)
+    return jsonify(sqlstats.endpoint_report())
+
+
+@main_bp.route('/metrics')
+def prometheus_metrics():
+    """Runtime metrics of all workers in Prometheus text format (bearer METRICS_TOKEN when configured)"""
+    token = current_app.config['METRICS_TOKEN']
+    if not token and current_app.config['METRICS_REQUIRE_TOKEN']:
+        abort(404)
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    response = make_response(metrics.render(metrics.collect_all()))
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
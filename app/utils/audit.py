@@ -0,0 +1,125 @@
+"""
+Audit log
+Records who viewed or changed patient data without a write per request.
+
+Events (user, action, entity, id, time, IP) are captured by an after_request
+hook (GET requests for a patient, medical record or attachment URL are
+views) and by session events (patients and medical records created, updated
+or deleted, recorded once the transaction commits; bulk Core statements that
+bypass the ORM report their rows with record_on_commit()). They are buffered in the
+process and written to audit_events with multi-row inserts by a background
+batch writer (app/utils/batch.py), every AUDIT_FLUSH_INTERVAL seconds or as
+soon as AUDIT_FLUSH_EVENTS events are waiting. A full buffer
+(AUDIT_BUFFER_SIZE) is written by the request that fills it.
+"""
+from datetime import datetime
+from flask import has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+from app.models import AuditEvent, MedicalRecord, Patient
+from app.utils.batch import BatchWriter
+
+# URL argument -> audited entity, for views
+VIEW_ARGUMENTS = {
+    'patient_id': 'patient',
+    'record_id': 'medical_record',
+    'attachment_id': 'attachment',
+}
+
+# Models whose changes are audited -> entity
+AUDITED_MODELS = {
+    Patient: 'patient',
+    MedicalRecord: 'medical_record',
+}
+
+_PENDING_KEY = 'audit_events'  # session.info key: events to record on commit
+
+
+class AuditBuffer(BatchWriter):
+    """Audit events (dicts of AuditEvent columns), written with multi-row inserts"""
+
+    name = 'audit-writer'
+
+    def write(self, connection, batch):
+        connection.execute(insert(AuditEvent.__table__), batch)
+
+
+audit_buffer = AuditBuffer()
+
+
+def _actor():
+    """(user id, IP address) of the current request, (None, None) outside requests"""
+    if not has_request_context():
+        return None, None
+    user_id = current_user.id if current_user and current_user.is_authenticated else None
+    return user_id, request.remote_addr
+
+
+def record(action, entity, entity_id=None, actor=None):
+    """Audit an action of the current user (none outside requests), or of actor=(user id, IP), on an entity"""
+    user_id, ip_address = actor or _actor()
+    audit_buffer.append({
+        'user_id': user_id,
+        'action': action,
+        'entity': entity,
+        'entity_id': entity_id,
+        'ip_address': ip_address,
+        'created_at': datetime.utcnow(),
+    })
+
+
+def flush():
+    """Write the buffered events now (e.g. before reading the log)"""
+    return audit_buffer.flush()
+
+
+def init_app(app):
+    audit_buffer.configure(app, app.config['AUDIT_BUFFER_SIZE'], app.config['AUDIT_FLUSH_EVENTS'],
+                           app.config['AUDIT_FLUSH_INTERVAL'])
+    app.after_request(_record_views)
+
+
+def _record_views(response):
+    if request.method == 'GET' and response.status_code < 400 and request.view_args:
+        for argument, entity in VIEW_ARGUMENTS.items():
+            if argument in request.view_args:
+                record(AuditEvent.VIEW, entity, request.view_args[argument])
+    return response
+
+
+# Changes are recorded when the transaction commits, so rolled back changes are not audited.
+# The user is looked up when the change is queued: after the commit their row may be expired.
+
+@event.listens_for(Session, 'after_flush')
+def _track_changes(session, flush_context):
+    changes = session.info.setdefault(_PENDING_KEY, [])
+    actor = None
+    for instances, action in ((session.new, AuditEvent.CREATE), (session.dirty, AuditEvent.UPDATE),
+                              (session.deleted, AuditEvent.DELETE)):
+        for instance in instances:
+            entity = AUDITED_MODELS.get(type(instance))
+            if entity is None:
+                continue
+            if action == AuditEvent.UPDATE and not session.is_modified(instance, include_collections=False):
+                continue
+            actor = actor or _actor()
+            changes.append((action, entity, instance.id, actor))
+
+
+def record_on_commit(session, action, entity, entity_ids):
+    """Audit rows written by a bulk statement (no ORM events) when the session's transaction commits"""
+    actor = _actor()
+    session.info.setdefault(_PENDING_KEY, []).extend((action, entity, entity_id, actor) for entity_id in entity_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _record_changes(session):
+    for action, entity, entity_id, actor in dict.fromkeys(session.info.pop(_PENDING_KEY, [])):
+        record(action, entity, entity_id, actor)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop(_PENDING_KEY, None)
+
@@ -0,0 +1,119 @@
+"""
+Background batch writers
+Writes that do not need to happen inside the request (audit events,
+last-login times) are buffered in the process and written in batches by a
+background thread, on its own connection, every `interval` seconds or as
+soon as `batch_size` items are waiting. Buffers are flushed when the
+process exits.
+
+A full buffer (`capacity` items) is written by the thread that fills it
+rather than dropped. Items still buffered when a process is killed are
+lost. Without background threads (BACKGROUND_WRITERS off, used for testing)
+items are written as they are added.
+"""
+import atexit
+import os
+import threading
+from collections import deque
+from app import db
+
+_writers = []  # Every BatchWriter, flushed at exit
+
+
+class BatchWriter:
+    """Thread-safe buffer written to the database in batches; subclasses implement write()"""
+
+    name = 'batch-writer'
+
+    def __init__(self, capacity=10000, batch_size=500, interval=1.0, background=True):
+        self.app = None
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.interval = interval
+        self.background = background
+        self.dropped = 0
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # One writer at a time keeps items in order
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        _writers.append(self)
+
+    def configure(self, app, capacity, batch_size, interval):
+        self.app = app
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.interval = interval
+        self.background = app.config['BACKGROUND_WRITERS']
+
+    def write(self, connection, batch):
+        """Write a list of items on the connection (committed by the caller)"""
+        raise NotImplementedError
+
+    def append(self, item):
+        """Buffer one item"""
+        if self.background and self._pid != os.getpid():
+            self._start()
+        with self._lock:
+            self._items.append(item)
+            waiting = len(self._items)
+
+        if not self.background or waiting >= self.capacity:
+            self.flush()  # The writer fell behind: write in this thread rather than drop
+        elif waiting >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write every buffered item. Returns the number written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._items.popleft() for _ in range(min(self.batch_size, len(self._items)))]
+                if not batch:
+                    return written
+                try:
+                    with self.app.app_context():
+                        with db.engine.begin() as connection:
+                            self.write(connection, batch)
+                except Exception:
+                    self.app.logger.exception('%s: writing %d items failed', self.name, len(batch))
+                    self._requeue(batch)
+                    return written
+                written += len(batch)
+
+    def _requeue(self, batch):
+        """Put a failed batch back in front, dropping the oldest items past capacity"""
+        with self._lock:
+            self._items.extendleft(reversed(batch))
+            overflow = len(self._items) - self.capacity
+            for _ in range(max(overflow, 0)):
+                self._items.popleft()
+                self.dropped += 1
+        if overflow > 0:
+            self.app.logger.error('%s: buffer full, dropped %d items', self.name, overflow)
+
+    def _start(self):
+        """Start the writer thread (again in a forked worker, which does not inherit it)"""
+        if self._pid is not None:
+            self._items = deque()  # Items copied from the parent are written by the parent
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+@atexit.register
+def _flush_on_exit():
+    for writer in _writers:
+        if writer.app is not None and writer._pid in (None, os.getpid()):
+            writer.flush()
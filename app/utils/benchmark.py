@@ -0,0 +1,116 @@
+"""
+Benchmark data
+Deterministic sample data and a SQL statement counter for the benchmark
+suite (tests/test_benchmarks.py, run with pytest-benchmark).
+
+The database is seeded at a fixed scale (SCALES: the number of patients,
+appointments and transactions), written with multi-row Core inserts (model
+events are skipped; counters are reconciled afterwards).
+"""
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import event, insert
+from app import db
+from app.models import Appointment, Counter, Patient, Transaction, User
+
+SCALES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+INSERT_BATCH = 10000
+SEED = 1234
+
+FIRST_NAMES = ['Ana', 'Luis', 'Maria', 'Jose', 'Carmen', 'Juan', 'Lucia', 'Pedro', 'Sofia', 'Diego',
+               'Elena', 'Pablo', 'Laura', 'Miguel', 'Paula', 'Carlos', 'Marta', 'Jorge', 'Sara', 'Andres']
+LAST_NAMES = ['Garcia', 'Lopez', 'Martinez', 'Sanchez', 'Perez', 'Gomez', 'Diaz', 'Torres', 'Ruiz', 'Flores',
+              'Ramirez', 'Castro', 'Vargas', 'Rojas', 'Morales', 'Ortiz', 'Silva', 'Herrera', 'Medina', 'Reyes']
+
+
+def _insert_batches(table, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= INSERT_BATCH:
+            db.session.execute(insert(table), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(table), batch)
+
+
+def seed(size, now=None):
+    """Insert `size` patients, appointments and transactions of deterministic sample data"""
+    rng = random.Random(SEED)
+    now = now or datetime.utcnow().replace(microsecond=0)
+    user_id = db.session.query(User.id).order_by(User.id).limit(1).scalar()
+
+    _insert_batches(Patient.__table__, ({
+        'id': i,
+        'first_name': rng.choice(FIRST_NAMES),
+        'last_name': rng.choice(LAST_NAMES),
+        'date_of_birth': (now - timedelta(days=rng.randint(365, 90 * 365))).date(),
+        'gender': rng.choice(['male', 'female']),
+        'email': f'patient{i}@example.com',
+        'phone': f'555-{i:07d}',
+        'is_active': rng.random() < 0.95,
+        'created_at': now - timedelta(minutes=rng.randint(0, 3 * 365 * 24 * 60)),
+        'updated_at': now,
+    } for i in range(1, size + 1)))
+
+    _insert_batches(Appointment.__table__, ({
+        'patient_id': rng.randint(1, size),
+        'created_by_id': user_id,
+        'appointment_date': now + timedelta(minutes=15 * rng.randint(-365 * 40, 90 * 40)),
+        'duration_minutes': rng.choice([15, 30, 45, 60]),
+        'appointment_type': rng.choice(['consultation', 'follow_up', 'emergency']),
+        'reason': rng.choice(['Regular checkup', 'Follow-up visit', 'New symptoms', 'Prescription refill']),
+        'status': rng.choice(['scheduled', 'confirmed', 'completed', 'completed', 'cancelled']),
+        'cost': rng.choice([50.0, 75.0, 100.0]),
+        'paid': False,
+        'created_at': now,
+        'updated_at': now,
+    } for _ in range(size)))
+
+    def transactions():
+        invoices = {}
+        for _ in range(size):
+            transaction_type = rng.choice(['income', 'income', 'expense'])
+            date = now - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60))
+            invoice_number = None
+            if transaction_type == 'income':
+                prefix = date.strftime('INV-%Y%m%d')
+                invoices[prefix] = invoices.get(prefix, 0) + 1
+                invoice_number = f'{prefix}-{invoices[prefix]:04d}'
+            yield {
+                'created_by_id': user_id,
+                'patient_id': rng.randint(1, size) if transaction_type == 'income' else None,
+                'transaction_date': date,
+                'transaction_type': transaction_type,
+                'category': rng.choice(['consultation', 'laboratory', 'supplies', 'rent']),
+                'amount': round(rng.uniform(20, 500), 2),
+                'currency': 'USD',
+                'payment_method': rng.choice(['cash', 'card', 'transfer']),
+                'status': rng.choice(['completed', 'completed', 'completed', 'pending']),
+                'description': f'Sample {transaction_type}',
+                'invoice_number': invoice_number,
+                'created_at': date,
+                'updated_at': date,
+            }
+
+    _insert_batches(Transaction.__table__, transactions())
+    db.session.commit()
+    Counter.reconcile()
+
+
+class QueryCounter:
+    """Counts the SQL statements run on an engine while in use as a context manager"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
@@ -0,0 +1,101 @@
+"""
+In-process caches
+Small thread-safe TTL cache, plus invalidation when a committed transaction
+changed the tables a cached value was computed from.
+
+Each worker process has its own caches. Invalidation covers writes made by
+this process through the session: ORM flushes and Core/ORM bulk statements
+run with db.session.execute(). Writes from other processes are picked up
+when entries expire, so keep TTLs short.
+"""
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Watched table name -> caches to clear when a transaction that wrote it commits
+_watchers = {}
+_PENDING_KEY = 'invalidate_caches'  # session.info key: caches to clear on commit
+
+
+class TTLCache:
+    """Thread-safe mapping whose entries expire after `ttl` seconds (least recently used dropped first)"""
+
+    def __init__(self, ttl, max_entries=128):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return entry[1] if entry else None
+
+    def get_or_set(self, key, compute, ttl=None):
+        """Cached value for key, computed (outside the lock) and stored on a miss"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def invalidate_on_commit(cache, *models):
+    """Clear `cache` after any commit that inserted, updated or deleted rows of these models"""
+    for model in models:
+        _watchers.setdefault(model.__table__.name, []).append(cache)
+
+
+def _mark(session, table_name):
+    for cache in _watchers.get(table_name, ()):
+        session.info.setdefault(_PENDING_KEY, {})[id(cache)] = cache
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush(session, flush_context):
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(instance, '__table__', None)
+        if table is not None:
+            _mark(session, table.name)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk(orm_execute_state):
+    """Bulk insert/update/delete statements skip the flush: watch them here"""
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            _mark(orm_execute_state.session, table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate(session):
+    for cache in session.info.pop(_PENDING_KEY, {}).values():
+        cache.clear()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop(_PENDING_KEY, None)
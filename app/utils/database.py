@@ -0,0 +1,122 @@
+"""
+Database engine configuration
+Engine and connection pool options built from the DB_* settings for the
+configured database, SQLite pragmas applied to every new connection, and
+connection pool statistics.
+
+- PostgreSQL (and other servers): a queue pool of DB_POOL_SIZE connections
+  plus DB_MAX_OVERFLOW, recycled after DB_POOL_RECYCLE seconds, checked
+  with a ping on checkout (DB_POOL_PRE_PING) and, for PostgreSQL, a
+  statement_timeout of DB_STATEMENT_TIMEOUT ms.
+- SQLite files: the same queue pool, and SQLITE_PRAGMAS (WAL journal,
+  synchronous=NORMAL, busy timeout, mmap and page cache size) run on every
+  new connection. In-memory databases keep Flask-SQLAlchemy's single static
+  connection.
+
+Queue pools record how long requests wait for a connection; waits longer
+than DB_SLOW_CHECKOUT seconds are logged. pool_status() reports them with
+the pool usage (per process).
+"""
+import logging
+import threading
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """Connection checkout counters of one pool"""
+
+    def __init__(self, slow_checkout=None):
+        self.slow_checkout = slow_checkout
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, wait, timed_out=False):
+        with self._lock:
+            self.checkouts += not timed_out
+            self.timeouts += timed_out
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+        if self.slow_checkout and wait > self.slow_checkout:
+            logger.warning('Waited %.2fs for a database connection%s', wait, ' (timed out)' if timed_out else '')
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records the time spent waiting for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.add(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.add(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats  # Keep counting across dispose()
+        return pool
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database"""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    backend = url.get_backend_name()
+    if backend == 'sqlite' and url.database in (None, '', ':memory:'):
+        return {}
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+    }
+    if backend != 'sqlite':
+        options['pool_recycle'] = config['DB_POOL_RECYCLE']
+        options['pool_pre_ping'] = config['DB_POOL_PRE_PING']
+    if backend == 'postgresql' and config['DB_STATEMENT_TIMEOUT']:
+        options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"}
+    return options
+
+
+def configure_engine(engine, config):
+    """Install the SQLite pragmas and pool statistics settings on an engine"""
+    if isinstance(engine.pool, TimedQueuePool):
+        engine.pool.stats.slow_checkout = config['DB_SLOW_CHECKOUT']
+
+    pragmas = config['SQLITE_PRAGMAS']
+    if engine.dialect.name == 'sqlite' and pragmas:
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+            cursor.close()
+
+
+def pool_status(engine):
+    """Connection pool usage and checkout waits of this process, as a dict"""
+    pool = engine.pool
+    status = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(size=pool.size(), checked_out=pool.checkedout(), idle=pool.checkedin(),
+                      overflow=max(pool.overflow(), 0))
+    stats = getattr(pool, 'stats', None)
+    if stats is not None:
+        status.update(checkouts=stats.checkouts, timeouts=stats.timeouts,
+                      wait_total=round(stats.wait_total, 4), wait_max=round(stats.wait_max, 4),
+                      wait_mean=round(stats.wait_total / stats.checkouts, 6) if stats.checkouts else 0.0)
+    return status
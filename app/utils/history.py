@@ -0,0 +1,19 @@
+"""
+Attribute history
+Model events that compare old and new values (counters, record revisions)
+need the committed value of an attribute even when it was expired, e.g.
+after a commit. SQLAlchemy only loads it before a set when a 'set' listener
+asks for active history.
+"""
+from sqlalchemy import event
+
+
+def _receive_set(target, value, oldvalue, initiator):
+    pass  # Registered only for active_history
+
+
+def load_old_values(*attributes):
+    """Load the committed value of these mapped attributes before they are replaced"""
+    for attribute in attributes:
+        if not event.contains(attribute, 'set', _receive_set):
+            event.listen(attribute, 'set', _receive_set, active_history=True)
@@ -0,0 +1,323 @@
+"""
+Runtime metrics
+Request counts, latency and response size histograms and in-flight
+requests per endpoint, served as Prometheus text at /metrics.
+
+Recording takes no lock: every thread updates its own shard (plain dicts),
+and shards are only summed when a snapshot is taken. Shards of threads that
+have exited (the threaded dev server starts one per request) are folded
+into a retired total when a snapshot is taken or the number of shards has
+doubled, so their list stays bounded by the live threads. Each worker process
+writes its snapshot to METRICS_DIR/<pid>.json (at most every
+METRICS_WRITE_INTERVAL seconds, after a request, and at exit), and /metrics
+adds up the files of every worker, so any gunicorn worker can answer a
+scrape. Other workers' numbers are up to METRICS_WRITE_INTERVAL seconds
+old. Counters and histograms of exited workers are kept so totals never go
+backwards; gauges only count live workers. Empty METRICS_DIR when the
+server is (re)started. Without METRICS_DIR only this process is reported.
+"""
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from flask import request
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)  # bytes
+
+REQUESTS = 'clinicx_http_requests_total'
+DURATION = 'clinicx_http_request_duration_seconds'
+RESPONSE_SIZE = 'clinicx_http_response_size_bytes'
+IN_FLIGHT = 'clinicx_http_requests_in_flight'
+
+# Metric -> (type, help)
+METRICS = {
+    REQUESTS: ('counter', 'Requests by endpoint, method and status code'),
+    DURATION: ('histogram', 'Time from routing to response, by endpoint'),
+    RESPONSE_SIZE: ('histogram', 'Response body size (when known), by endpoint'),
+    IN_FLIGHT: ('gauge', 'Requests being handled'),
+    'clinicx_db_pool_connections': ('gauge', 'Database connections by state (checked_out, idle, overflow)'),
+    'clinicx_db_pool_checkouts_total': ('counter', 'Database connection checkouts'),
+    'clinicx_db_pool_checkout_timeouts_total': ('counter', 'Database connection checkouts that timed out'),
+    'clinicx_db_pool_checkout_wait_seconds_total': ('counter', 'Time spent waiting for a database connection'),
+    'clinicx_sql_sampled_requests_total': ('counter', 'Requests instrumented by the SQL statistics, by endpoint'),
+    'clinicx_sql_queries_total': ('counter', 'SQL statements of the instrumented requests, by endpoint'),
+    'clinicx_sql_duration_seconds_total': ('counter', 'Database time of the instrumented requests, by endpoint'),
+    'clinicx_sql_n_plus_one_requests_total': ('counter', 'Instrumented requests with a likely N+1 query, by endpoint'),
+}
+
+_shards = []  # Every live (or not yet retired) thread's _Shard
+_shards_lock = threading.Lock()  # Adding and retiring shards
+_retire_at = [64]  # Number of shards that triggers retiring the dead ones
+_local = threading.local()
+_collectors = []  # Functions adding process-level samples to a snapshot
+_settings = {'directory': None, 'interval': 10.0, 'app': None}
+_last_write = [0.0]
+_series_keys = {}  # (endpoint, method, status) -> (request counter key, endpoint labels)
+_IN_FLIGHT_KEY = (IN_FLIGHT, ())
+
+
+class _Shard:
+    """Samples recorded by one thread"""
+    __slots__ = ('counters', 'gauges', 'histograms', 'started', 'thread')
+
+    def __init__(self, thread=None):
+        self.thread = thread
+        self.started = None  # perf_counter() at the start of the thread's current request
+        self.counters = {}  # (name, labels) -> value
+        self.gauges = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [count per bucket..., count above the last bucket, sum]
+
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        _local.shard = shard = _Shard(threading.current_thread())
+        with _shards_lock:
+            _shards.append(shard)
+            if len(_shards) >= _retire_at[0]:
+                _retire_dead_shards()
+                _retire_at[0] = max(64, 2 * len(_shards))
+        return shard
+
+
+_retired = _Shard()  # Counters and histograms of exited threads
+
+
+def _retire_dead_shards():
+    """Fold the shards of exited threads into _retired (hold _shards_lock)"""
+    alive = []
+    for shard in _shards:
+        if shard.thread.is_alive():
+            alive.append(shard)
+            continue
+        # The thread is gone, so nothing writes to its shard any more. Its gauges (requests in flight) are 0.
+        for key, value in shard.counters.items():
+            _retired.counters[key] = _retired.counters.get(key, 0) + value
+        for key, counts in shard.histograms.items():
+            _add_histogram(_retired.histograms, key, counts)
+    _shards[:] = alive
+
+
+def observe(shard, name, labels, value, buckets):
+    """Add a value to a histogram"""
+    key = (name, labels)
+    counts = shard.histograms.get(key)
+    if counts is None:
+        counts = shard.histograms[key] = [0] * (len(buckets) + 2)
+    counts[bisect.bisect_left(buckets, value)] += 1
+    counts[-1] += value
+
+
+def add_collector(collect):
+    """Register collect(snapshot) once; it is called for every snapshot to add process-level samples"""
+    if collect not in _collectors:
+        _collectors.append(collect)
+
+
+def snapshot():
+    """Samples of this process: {'counters': {...}, 'gauges': {...}, 'histograms': {...}} keyed by (name, labels)"""
+    merged = {'counters': {}, 'gauges': {}, 'histograms': {}}
+    with _shards_lock:
+        _retire_dead_shards()
+        shards = list(_shards)
+        for key, value in _retired.counters.items():
+            merged['counters'][key] = value
+        for key, counts in _retired.histograms.items():
+            merged['histograms'][key] = list(counts)
+    for shard in shards:
+        for kind in ('counters', 'gauges'):
+            totals = merged[kind]
+            for key, value in dict(getattr(shard, kind)).items():
+                totals[key] = totals.get(key, 0) + value
+        for key, counts in dict(shard.histograms).items():
+            _add_histogram(merged['histograms'], key, counts)
+    for collect in _collectors:
+        collect(merged)
+    return merged
+
+
+def _add_histogram(histograms, key, counts):
+    total = histograms.get(key)
+    if total is None:
+        histograms[key] = list(counts)
+    else:
+        for i, value in enumerate(counts):
+            total[i] += value
+
+
+def _to_json(samples):
+    return {kind: [[name, [list(label) for label in labels], value] for (name, labels), value in values.items()]
+            for kind, values in samples.items()}
+
+
+def _from_json(data):
+    return {kind: {(name, tuple(tuple(label) for label in labels)): value for name, labels, value in values}
+            for kind, values in data.items()}
+
+
+def write_snapshot():
+    """Write this process's snapshot to METRICS_DIR for the other workers to read"""
+    directory = _settings['directory']
+    if not directory:
+        return
+    _last_write[0] = time.monotonic()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    with open(f'{path}.tmp', 'w') as file:
+        json.dump(_to_json(snapshot()), file)
+    os.replace(f'{path}.tmp', path)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect_all():
+    """This process's snapshot plus the last ones written by the other workers"""
+    merged = snapshot()
+    directory = _settings['directory']
+    if not directory:
+        return merged
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        pid = int(os.path.basename(path).split('.')[0])
+        if pid == os.getpid():
+            continue
+        try:
+            with open(path) as file:
+                samples = _from_json(json.load(file))
+        except (OSError, ValueError):
+            continue  # Being replaced
+        for key, value in samples['counters'].items():
+            merged['counters'][key] = merged['counters'].get(key, 0) + value
+        if _alive(pid):
+            for key, value in samples['gauges'].items():
+                merged['gauges'][key] = merged['gauges'].get(key, 0) + value
+        for key, counts in samples['histograms'].items():
+            _add_histogram(merged['histograms'], key, counts)
+    return merged
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(samples):
+    """Samples as Prometheus text exposition format"""
+    by_name = {}
+    for kind in ('counters', 'gauges', 'histograms'):
+        for (name, labels), value in samples[kind].items():
+            by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(by_name):
+        metric_type, help_text = METRICS.get(name, ('untyped', ''))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for labels, value in sorted(by_name[name]):
+            if metric_type != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+            buckets = DURATION_BUCKETS if name == DURATION else SIZE_BUCKETS
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value[-1])}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+# Request hooks
+
+def _start_request():
+    shard = _shard()
+    shard.started = time.perf_counter()  # A thread handles one request at a time
+    shard.gauges[_IN_FLIGHT_KEY] = shard.gauges.get(_IN_FLIGHT_KEY, 0) + 1
+
+
+def _series(endpoint, method, status):
+    """Sample keys of a request, made once per endpoint, method and status"""
+    blueprint = endpoint.rpartition('.')[0] if endpoint else ''
+    endpoint = endpoint or 'unmatched'  # Unknown URLs share one series
+    keys = ((REQUESTS, (('blueprint', blueprint), ('endpoint', endpoint), ('method', method), ('status', str(status)))),
+            (('endpoint', endpoint),))
+    _series_keys[(endpoint, method, status)] = keys
+    return keys
+
+
+def _finish_request(response):
+    shard = _shard()
+    if shard.started is None:
+        return response
+    duration = time.perf_counter() - shard.started
+    current = request._get_current_object()  # One proxy lookup
+    status = response.status_code
+    keys = _series_keys.get((current.endpoint or 'unmatched', current.method, status))
+    if keys is None:
+        keys = _series(current.endpoint, current.method, status)
+    counter_key, labels = keys
+
+    shard.counters[counter_key] = shard.counters.get(counter_key, 0) + 1
+    observe(shard, DURATION, labels, duration, DURATION_BUCKETS)
+    size = response.content_length
+    if size is not None:
+        observe(shard, RESPONSE_SIZE, labels, size, SIZE_BUCKETS)
+
+    if _settings['directory'] and time.monotonic() - _last_write[0] >= _settings['interval']:
+        write_snapshot()
+    return response
+
+
+def _end_request(error):
+    shard = _shard()
+    if shard.started is not None:
+        shard.started = None
+        shard.gauges[_IN_FLIGHT_KEY] -= 1
+
+
+def _collect_pool(samples):
+    """Connection pool usage and waits of this process (app/utils/database.py)"""
+    from app import db
+    from app.utils.database import pool_status
+    with _settings['app'].app_context():
+        status = pool_status(db.engine)
+    for state in ('checked_out', 'idle', 'overflow'):
+        if state in status:
+            samples['gauges'][('clinicx_db_pool_connections', (('state', state),))] = status[state]
+    if 'checkouts' in status:
+        samples['counters'][('clinicx_db_pool_checkouts_total', ())] = status['checkouts']
+        samples['counters'][('clinicx_db_pool_checkout_timeouts_total', ())] = status['timeouts']
+        samples['counters'][('clinicx_db_pool_checkout_wait_seconds_total', ())] = status['wait_total']
+
+
+def init_app(app):
+    _settings.update(directory=app.config['METRICS_DIR'], interval=app.config['METRICS_WRITE_INTERVAL'], app=app)
+    add_collector(_collect_pool)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+
+
+@atexit.register
+def _write_on_exit():
+    if _settings['directory'] and _shards:
+        write_snapshot()
@@ -0,0 +1,186 @@
+"""
+Streaming PDF writer
+Minimal text-only PDF generator that writes each page to the output file as
+soon as it is full, so memory use does not grow with the document length.
+
+Uses the standard Helvetica fonts (no embedding) with WinAnsi encoding,
+which covers Spanish and English text.
+"""
+import zlib
+
+A4 = (595.28, 841.89)
+
+# Helvetica advance widths (1/1000 em) for ASCII 32..126
+_HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_BOLD_FACTOR = 1.08  # Helvetica-Bold is slightly wider; close enough for wrapping
+
+
+def text_width(text, size, bold=False):
+    """Approximate width of a string in points"""
+    width = sum(_HELVETICA_WIDTHS[ord(char) - 32] if 32 <= ord(char) <= 126 else 556 for char in text)
+    return width * size / 1000 * (_BOLD_FACTOR if bold else 1)
+
+
+def wrap_text(text, size, max_width, bold=False):
+    """Split text into lines that fit in max_width (hard-breaking overlong words)"""
+    lines = []
+    for paragraph in str(text).splitlines() or ['']:
+        line = ''
+        for word in paragraph.split():
+            candidate = f'{line} {word}' if line else word
+            if text_width(candidate, size, bold) <= max_width:
+                line = candidate
+                continue
+            if line:
+                lines.append(line)
+            while text_width(word, size, bold) > max_width:
+                cut = len(word)
+                while cut > 1 and text_width(word[:cut], size, bold) > max_width:
+                    cut -= 1
+                lines.append(word[:cut])
+                word = word[cut:]
+            line = word
+        lines.append(line)
+    return lines
+
+
+def _escape(text):
+    data = text.encode('cp1252', errors='replace')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+class PdfWriter:
+    """
+    Write a PDF to a binary file object, page by page
+    Call close() to finish the document (it does not close the file)
+    """
+
+    # Fixed object numbers; pages and their content streams follow
+    CATALOG, PAGES, FONT, FONT_BOLD = 1, 2, 3, 4
+
+    def __init__(self, fileobj, page_size=A4, margin=50, title=None, footer=None):
+        self.file = fileobj
+        self.width, self.height = page_size
+        self.margin = margin
+        self.title = title
+        self.footer = footer  # Text printed at the bottom of every page, with the page number
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 5
+        self.commands = []
+        self.y = None
+
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._write_object(self.FONT, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+                                      b'/Encoding /WinAnsiEncoding >>')
+        self._write_object(self.FONT_BOLD, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold '
+                                           b'/Encoding /WinAnsiEncoding >>')
+
+    @property
+    def content_width(self):
+        return self.width - 2 * self.margin
+
+    def _write(self, data):
+        self.file.write(data)
+
+    def _write_object(self, object_id, body):
+        self.offsets[object_id] = self.file.tell()
+        self._write(f'{object_id} 0 obj\n'.encode() + body + b'\nendobj\n')
+
+    def _new_id(self):
+        object_id = self.next_id
+        self.next_id += 1
+        return object_id
+
+    def _draw(self, text, x, y, size, bold=False):
+        font = '/F2' if bold else '/F1'
+        self.commands.append(b'BT %s %.1f Tf %.2f %.2f Td (%s) Tj ET' % (
+            font.encode(), size, x, y, _escape(text)))
+
+    def _flush_page(self):
+        if self.footer:
+            footer = f'{self.footer} - {len(self.page_ids) + 1}'
+            self._draw(footer, self.margin, self.margin / 2, 8)
+
+        stream = zlib.compress(b'\n'.join(self.commands))
+        content_id = self._new_id()
+        self._write_object(content_id, b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(stream)
+                           + stream + b'\nendstream')
+        page_id = self._new_id()
+        self._write_object(page_id, (
+            f'<< /Type /Page /Parent {self.PAGES} 0 R /MediaBox [0 0 {self.width:.2f} {self.height:.2f}] '
+            f'/Resources << /Font << /F1 {self.FONT} 0 R /F2 {self.FONT_BOLD} 0 R >> >> '
+            f'/Contents {content_id} 0 R >>'
+        ).encode())
+        self.page_ids.append(page_id)
+        self.commands = []
+        self.y = None
+
+    def _ensure_space(self, height):
+        if self.y is not None and self.y - height >= self.margin:
+            return
+        if self.y is not None:
+            self._flush_page()
+        self.y = self.height - self.margin
+
+    def new_page(self):
+        """Start a new page"""
+        if self.y is not None:
+            self._flush_page()
+
+    def text(self, text, size=10, bold=False, indent=0, leading=1.3):
+        """Write wrapped text"""
+        line_height = size * leading
+        for line in wrap_text(text, size, self.content_width - indent, bold):
+            self._ensure_space(line_height)
+            self.y -= line_height
+            self._draw(line, self.margin + indent, self.y, size, bold)
+
+    def heading(self, text, size=14):
+        """Write a bold heading, kept together with some of what follows"""
+        self._ensure_space(size * 4)
+        self.spacer(size * 0.5)
+        self.text(text, size=size, bold=True)
+
+    def spacer(self, height=6):
+        """Vertical space"""
+        self._ensure_space(height)
+        self.y -= height
+
+    def rule(self):
+        """Horizontal line across the content width"""
+        self.spacer(4)
+        self.commands.append(b'0.5 w %.2f %.2f m %.2f %.2f l S' % (
+            self.margin, self.y, self.width - self.margin, self.y))
+        self.spacer(4)
+
+    def close(self):
+        """Write the page tree, catalog and cross-reference table"""
+        if self.y is not None or not self.page_ids:
+            self._ensure_space(0)
+            self._flush_page()
+
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.page_ids)
+        self._write_object(self.PAGES, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>'.encode())
+        self._write_object(self.CATALOG, f'<< /Type /Catalog /Pages {self.PAGES} 0 R >>'.encode())
+
+        info = ''
+        if self.title:
+            info_id = self._new_id()
+            self._write_object(info_id, b'<< /Title (' + _escape(self.title) + b') /Producer (ClinicX) >>')
+            info = f' /Info {info_id} 0 R'
+
+        xref_offset = self.file.tell()
+        lines = [f'xref\n0 {self.next_id}\n', '0000000000 65535 f \n']
+        for object_id in range(1, self.next_id):
+            lines.append(f'{self.offsets[object_id]:010d} 00000 n \n')
+        self._write(''.join(lines).encode())
+        self._write((f'trailer\n<< /Size {self.next_id} /Root {self.CATALOG} 0 R{info} >>\n'
+                     f'startxref\n{xref_offset}\n%%EOF\n').encode())
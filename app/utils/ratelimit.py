@@ -0,0 +1,45 @@
+"""
+Rate limiting
+In-memory token buckets, one per key (e.g. a username or an IP address).
+
+Each worker process keeps its own buckets, so the effective limit is the
+configured one times the number of workers. That is enough to keep
+repeated attempts from using up the CPU; it is not a global quota.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+    """
+    Per-key buckets of `burst` tokens, refilled at `rate` tokens per second
+    The least recently used keys are forgotten past max_keys (a forgotten key starts with a full bucket).
+    """
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def acquire(self, key, cost=1):
+        """Take `cost` tokens for key. Returns 0 if allowed, otherwise the seconds to wait."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return 0 if allowed else (cost - tokens) / self.rate
+
+    def reset(self, key):
+        """Refill the bucket of key"""
+        with self._lock:
+            self._buckets.pop(key, None)
@@ -0,0 +1,69 @@
+"""
+Schema upgrades for existing databases
+
+db.create_all() only creates missing tables. Indexes and columns added to a
+model after its table exists are created here, at startup, so existing
+installations pick them up without a migration tool.
+
+New columns on existing tables must be nullable or define a server_default;
+columns derived from existing data are filled by their BACKFILLS entry.
+An index whose definition changes gets a new name; the old name goes in
+RETIRED_INDEXES so it is dropped.
+"""
+import json
+from sqlalchemy import bindparam, inspect, select, text, update
+from sqlalchemy.schema import CreateColumn
+from app import db
+
+# Indexes replaced by a new definition under another name: table -> names to drop
+RETIRED_INDEXES = {
+    'patients': ['ix_patients_active_gender_dob'],  # Now the partial ix_patients_active_only_gender_dob
+}
+
+
+def _backfill_archived_attachment_hashes(connection):
+    """Copy the file hash of attachments archived before archived_records.sha256 existed"""
+    records = db.metadata.tables['archived_records']
+    rows = connection.execute(
+        select(records.c.id, records.c.data).where(records.c.entity == 'attachment')
+    ).all()
+    if rows:
+        connection.execute(
+            update(records).where(records.c.id == bindparam('record_id')).values(sha256=bindparam('hash')),
+            [{'record_id': record_id, 'hash': json.loads(data).get('sha256')} for record_id, data in rows]
+        )
+
+
+# Columns whose values are derived from existing data: (table, column) -> fill(connection), run once when added
+BACKFILLS = {
+    ('archived_records', 'sha256'): _backfill_archived_attachment_hashes,
+}
+
+
+def upgrade_schema():
+    """Add missing columns and indexes to existing tables"""
+    engine = db.engine
+    inspector = inspect(engine)
+
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                with engine.begin() as connection:
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+                    backfill = BACKFILLS.get((table.name, column.name))
+                    if backfill:
+                        backfill(connection)
+
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for name in RETIRED_INDEXES.get(table.name, ()):
+            if name in existing_indexes:
+                with engine.begin() as connection:
+                    connection.execute(text(f'DROP INDEX {name}'))
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(engine)
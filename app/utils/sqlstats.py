@@ -0,0 +1,171 @@
+"""
+SQL instrumentation
+Per-request query count, database time and statement fingerprints, recorded
+by before/after_cursor_execute hooks on the engine.
+
+A request is instrumented with probability SQL_STATS_SAMPLE_RATE (every
+request in development). For an instrumented request:
+- a statement fingerprint (the SQL with literals and IN lists collapsed) run
+  SQL_N_PLUS_ONE_THRESHOLD times or more is reported as a likely N+1 query,
+  with a warning in the log;
+- with SQL_STATS_HEADERS, the response carries a Server-Timing header
+  (database time and query count, total time) that browser dev tools show;
+- totals per endpoint are kept in the process, reported at /status/sql and
+  exported as counters on /metrics (added up over the worker processes).
+
+With a sample rate of 0 the hooks are not installed, so there is no
+overhead. Queries run while a streamed response body is generated are not
+counted.
+"""
+import random
+import re
+import threading
+import time
+from collections import Counter as Tally
+from functools import lru_cache
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from app.utils import metrics
+
+MAX_REPEATED_PER_ENDPOINT = 20  # N+1 fingerprints kept per endpoint
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'\bIN\s*\([^()]*\)', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+_settings = {}  # From the app config, set by init_app()
+_endpoints = {}  # endpoint -> EndpointStats
+_endpoints_lock = threading.Lock()
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement):
+    """Statement with literals replaced by ? and IN lists collapsed, so repeats of one query compare equal"""
+    statement = _IN_LISTS.sub('IN (...)', statement)
+    statement = _LITERALS.sub('?', statement)
+    return _SPACES.sub(' ', statement).strip()
+
+
+class RequestStats:
+    """Queries of one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = Tally()  # statement -> executions
+
+    def add(self, statement, seconds):
+        self.queries += 1
+        self.db_time += seconds
+        self.statements[statement] += 1
+
+    def repeated(self, threshold):
+        """[(fingerprint, executions)] run at least threshold times, most repeated first"""
+        counts = Tally()
+        for statement, executions in self.statements.items():
+            counts[fingerprint(statement)] += executions
+        return [(text, count) for text, count in counts.most_common() if count >= threshold]
+
+
+class EndpointStats:
+    """Totals of the instrumented requests of one endpoint"""
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.max_queries = 0
+        self.n_plus_one_requests = 0
+        self.repeated = Tally()  # fingerprint -> requests where it looked like an N+1
+
+    def add(self, stats, repeated):
+        self.requests += 1
+        self.queries += stats.queries
+        self.db_time += stats.db_time
+        self.max_queries = max(self.max_queries, stats.queries)
+        self.n_plus_one_requests += bool(repeated)
+        for text, _ in repeated:
+            if text in self.repeated or len(self.repeated) < MAX_REPEATED_PER_ENDPOINT:
+                self.repeated[text] += 1
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'queries': self.queries,
+            'queries_mean': round(self.queries / self.requests, 1) if self.requests else 0,
+            'queries_max': self.max_queries,
+            'db_time': round(self.db_time, 4),
+            'db_time_mean': round(self.db_time / self.requests, 6) if self.requests else 0,
+            'n_plus_one': [{'statement': text, 'requests': count} for text, count in self.repeated.most_common()],
+        }
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    if context is not None and has_app_context() and g.get('sql_stats') is not None:
+        context.sql_stats_start = time.perf_counter()
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    start = getattr(context, 'sql_stats_start', None)
+    if start is not None and has_app_context() and g.get('sql_stats') is not None:
+        g.sql_stats.add(statement, time.perf_counter() - start)
+
+
+def _start_request():
+    if random.random() < _settings['sample_rate']:
+        g.sql_stats = RequestStats()
+
+
+def _finish_request(response):
+    stats = g.pop('sql_stats', None)
+    if stats is None or request.endpoint is None:
+        return response
+
+    repeated = stats.repeated(_settings['threshold'])
+    for text, count in repeated:
+        _settings['logger'].warning('Possible N+1 query in %s: %d x %s', request.endpoint, count, text[:300])
+
+    with _endpoints_lock:
+        _endpoints.setdefault(request.endpoint, EndpointStats()).add(stats, repeated)
+
+    if _settings['headers']:
+        timings = [f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"',
+                   f'app;dur={(time.perf_counter() - stats.started) * 1000:.1f}']
+        if repeated:
+            timings.append(f'nplusone;desc="{len(repeated)} repeated statements"')
+        response.headers.add('Server-Timing', ', '.join(timings))
+    return response
+
+
+def init_app(app, engine):
+    """Install the hooks if SQL_STATS_SAMPLE_RATE is above 0"""
+    rate = app.config['SQL_STATS_SAMPLE_RATE']
+    if rate <= 0:
+        return
+    _settings.update(sample_rate=rate, threshold=app.config['SQL_N_PLUS_ONE_THRESHOLD'],
+                     headers=app.config['SQL_STATS_HEADERS'], logger=app.logger)
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    metrics.add_collector(_collect)
+
+
+def _collect(samples):
+    """Per-endpoint totals of this process as /metrics counters"""
+    counters = samples['counters']
+    with _endpoints_lock:
+        for endpoint, stats in _endpoints.items():
+            labels = (('endpoint', endpoint),)
+            counters[('clinicx_sql_sampled_requests_total', labels)] = stats.requests
+            counters[('clinicx_sql_queries_total', labels)] = stats.queries
+            counters[('clinicx_sql_duration_seconds_total', labels)] = stats.db_time
+            counters[('clinicx_sql_n_plus_one_requests_total', labels)] = stats.n_plus_one_requests
+
+
+def endpoint_report():
+    """Totals per endpoint of the instrumented requests of this process, busiest first"""
+    with _endpoints_lock:
+        report = {endpoint: stats.to_dict() for endpoint, stats in _endpoints.items()}
+    return dict(sorted(report.items(), key=lambda item: item[1]['db_time'], reverse=True))
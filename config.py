@@ -21,6 +21,37 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False
 
+    # Engine and connection pool (app/utils/database.py builds SQLALCHEMY_ENGINE_OPTIONS from these)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = 30  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = 1800  # seconds; reconnect before server/proxy idle timeouts
+    DB_POOL_PRE_PING = True
+    DB_STATEMENT_TIMEOUT = 0  # milliseconds (PostgreSQL); 0 = no limit
+    DB_SLOW_CHECKOUT = 0.5  # seconds; longer waits for a connection are logged
+    # Run on every new SQLite connection
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',  # Readers do not block the writer
+        'synchronous': 'NORMAL',  # Safe with WAL; no fsync per commit
+        'busy_timeout': 5000,  # ms to wait for a lock instead of failing
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64000,  # KiB (64MB)
+    }
+
+    # SQL instrumentation (app/utils/sqlstats.py): share of requests whose queries are counted and timed
+    SQL_STATS_SAMPLE_RATE = float(os.environ.get('SQL_STATS_SAMPLE_RATE', 0))
+    SQL_STATS_HEADERS = False  # Server-Timing header on instrumented responses
+    SQL_N_PLUS_ONE_THRESHOLD = 5  # executions of one statement in a request reported as an N+1
+
+    # Prometheus metrics at /metrics. With several worker processes, METRICS_DIR holds each
+    # worker's latest numbers (empty it when the server starts). METRICS_TOKEN, when set,
+    # is required as "Authorization: Bearer <token>"; with METRICS_REQUIRE_TOKEN and no
+    # token, /metrics is not served at all.
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_WRITE_INTERVAL = 10  # seconds
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_REQUIRE_TOKEN = False
+
     # Session
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
     SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
@@ -32,6 +63,59 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx'}
 
+    # Medical Record Attachments (content-addressed, kept outside the static folder)
+    ATTACHMENT_FOLDER = os.environ.get('ATTACHMENT_FOLDER') or os.path.join(basedir, 'instance', 'attachments')
+    ATTACHMENT_MAX_SIZE = 100 * 1024 * 1024  # 100MB, streamed to disk
+    # Let the web server send attachment files:
+    # USE_X_SENDFILE=1 for Apache/lighttpd, or an nginx internal location for X-Accel-Redirect
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE') == '1'
+    ATTACHMENT_ACCEL_REDIRECT = os.environ.get('ATTACHMENT_ACCEL_REDIRECT')  # e.g. '/protected-attachments'
+
+    # Image thumbnails/previews (generated in a process pool, LRU-evicted)
+    DERIVATIVE_FOLDER = os.environ.get('DERIVATIVE_FOLDER') or os.path.join(basedir, 'instance', 'derivatives')
+    DERIVATIVE_CACHE_SIZE = 512 * 1024 * 1024  # bytes
+    THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+
+    # Uploaded import spreadsheets, kept outside the static folder while the import runs
+    IMPORT_FOLDER = os.environ.get('IMPORT_FOLDER') or os.path.join(basedir, 'instance', 'imports')
+
+    # Background exports (patient history PDFs)
+    EXPORT_FOLDER = os.environ.get('EXPORT_FOLDER') or os.path.join(basedir, 'instance', 'exports')
+    EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', 1))  # 0 = build exports inside the request
+    EXPORT_RETENTION_DAYS = 7
+    EXPORT_TIMEOUT = 30 * 60  # seconds; jobs still pending/running after this are marked failed
+
+    # Dashboard statistics cache (also cleared when this process commits a change)
+    DASHBOARD_CACHE_TTL = 30  # seconds
+
+    # Population health analytics (results cached per date range)
+    ANALYTICS_CACHE_TTL = 600  # seconds
+
+    # Logged-in user snapshots, cached per process for the Flask-Login user loader.
+    # Password, role and status changes touch the stamp file to invalidate every worker.
+    USER_CACHE_TTL = 60  # seconds
+    USER_CACHE_STAMP = os.environ.get('USER_CACHE_STAMP') or os.path.join(basedir, 'instance', 'user_cache.stamp')
+
+    # Buffered writes (audit log, last login times) are written in batches by background threads
+    BACKGROUND_WRITERS = True
+
+    # Audit log
+    AUDIT_BUFFER_SIZE = 10000  # events; a full buffer is written by the request that fills it
+    AUDIT_FLUSH_EVENTS = 500  # write as soon as this many events are waiting...
+    AUDIT_FLUSH_INTERVAL = 1.0  # ...or after this many seconds
+
+    # Login
+    # Werkzeug hash method for new passwords; older hashes are replaced at the next successful login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+    # Password checks run in a thread pool (0 = inside the request); logins beyond
+    # workers + queue get a "busy, try again" response instead of queueing up
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+    PASSWORD_HASH_QUEUE = 32
+    # Login attempts allowed per minute (token buckets, per process)
+    LOGIN_ATTEMPTS_PER_USERNAME = 5
+    LOGIN_ATTEMPTS_PER_IP = 60
+    LAST_LOGIN_FLUSH_INTERVAL = 5.0  # seconds
+
     # Babel (Internationalization)
     BABEL_DEFAULT_LOCALE = 'es'
     BABEL_SUPPORTED_LOCALES = ['es', 'en']
@@ -49,6 +133,11 @@ class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     SQLALCHEMY_ECHO = False  # Set to True to see SQL queries
+    DB_POOL_SIZE = 2
+    DB_MAX_OVERFLOW = 5
+    DB_POOL_PRE_PING = False
+    SQL_STATS_SAMPLE_RATE = 1.0
+    SQL_STATS_HEADERS = True
 
 
 class ProductionConfig(Config):
@@ -56,6 +145,15 @@ class ProductionConfig(Config):
     DEBUG = False
     SQLALCHEMY_ECHO = False
     SESSION_COOKIE_SECURE = True  # Require HTTPS
+    # Per worker process: keep DB_POOL_SIZE + DB_MAX_OVERFLOW times the number of workers
+    # under the server's max_connections
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = 10  # Fail fast rather than hold the request
+    DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))
+    SQL_STATS_SAMPLE_RATE = float(os.environ.get('SQL_STATS_SAMPLE_RATE', 0.05))
+    METRICS_DIR = os.environ.get('METRICS_DIR') or os.path.join(basedir, 'instance', 'metrics')
+    METRICS_REQUIRE_TOKEN = True  # Unset METRICS_TOKEN: /metrics answers 404
 
 
 class TestingConfig(Config):
@@ -63,6 +161,10 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    DB_POOL_PRE_PING = False
+    SQLITE_PRAGMAS = {'synchronous': 'OFF', 'cache_size': -16000}  # In-memory: no journal to tune
+    EXPORT_WORKERS = 0  # Worker processes cannot see an in-memory database
+    BACKGROUND_WRITERS = False  # Write buffered items inline: the in-memory database has one connection
 
 
 # Configuration dictionary
@@ -1,4 +1,6 @@
 import os
+import json
+import click
 from app import create_app, db
 from app.models import User, Patient, MedicalRecord, Appointment, Transaction, Referral
 
@@ -143,5 +145,154 @@ def seed_db():
     print("Database seeded successfully!")
 
 
+@app.cli.command('import-patients')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows validated and committed per batch')
+@click.option('--mapping', help='JSON object mapping spreadsheet headers to patient fields')
+@click.option('--month-first', is_flag=True, help='Parse ambiguous dates as MM/DD/YYYY')
+def import_patients(path, chunk_size, mapping, month_first):
+    """Bulk import patients from a CSV/XLSX file (re-run to resume)"""
+    from app.patients.importer import import_patients as run_patient_import
+
+    job = run_patient_import(
+        path,
+        mapping=json.loads(mapping) if mapping else None,
+        chunk_size=chunk_size,
+        dayfirst=not month_first
+    )
+
+    print(f"Import {job.status}: {job.rows_processed} rows read, {job.rows_imported} imported, "
+          f"{job.rows_duplicate} duplicates skipped, {job.rows_invalid} invalid")
+    for error in job.get_errors()[:20]:
+        print(f"  Row {error['row']}: {error['error']}")
+
+
+@app.cli.command('sync-medical-tags')
+@click.option('--batch-size', default=1000, show_default=True)
+def sync_medical_tags(batch_size):
+    """Parse existing allergies/chronic conditions text into normalized tags"""
+    from app.models import MedicalTag
+
+    last_id = 0
+    total = 0
+    while True:
+        batch = db.session.query(
+            Patient.id, Patient.allergies, Patient.chronic_conditions
+        ).filter(Patient.id > last_id).order_by(Patient.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        MedicalTag.link_patients([tuple(row) for row in batch])
+        db.session.commit()
+
+        last_id = batch[-1].id
+        total += len(batch)
+        print(f"Tagged {total} patients...")
+
+    print(f"Medical tags synced for {total} patients ({MedicalTag.query.count()} distinct tags).")
+
+
+@app.cli.command('archive-patients')
+@click.option('--inactive-days', default=730, show_default=True,
+              help='Archive deactivated patients untouched for this many days')
+@click.option('--batch-size', default=200, show_default=True)
+def archive_patients(inactive_days, batch_size):
+    """Move long-inactive patients and their history to the archive tables"""
+    from app.patients.archive import archive_inactive_patients
+
+    total = archive_inactive_patients(inactive_days=inactive_days, batch_size=batch_size)
+    print(f"Archived {total} inactive patients.")
+
+
+@app.cli.command('backfill-vitals')
+@click.option('--batch-size', default=2000, show_default=True)
+def backfill_vitals(batch_size):
+    """Copy vital signs of existing medical records into the vital readings series"""
+    from app.models import VitalReading
+
+    columns = [getattr(MedicalRecord, column) for column in VitalReading.METRICS.values()]
+    last_id = 0
+    total = 0
+    while True:
+        batch = db.session.query(
+            MedicalRecord.id, MedicalRecord.patient_id, MedicalRecord.visit_date, *columns
+        ).filter(MedicalRecord.id > last_id).order_by(MedicalRecord.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        VitalReading.sync_records(db.session.connection(), [
+            (row[0], row[1], row[2], dict(zip(VitalReading.METRICS.values(), row[3:])))
+            for row in batch
+        ])
+        db.session.commit()
+
+        last_id = batch[-1][0]
+        total += len(batch)
+        print(f"Processed {total} medical records...")
+
+    print(f"Vital readings backfilled from {total} medical records.")
+
+
+@app.cli.command('backfill-vital-flags')
+@click.option('--chunk-size', default=5000, show_default=True)
+@click.option('--all', 'recompute_all', is_flag=True, help='Recompute records that already have flags')
+def backfill_vital_flags(chunk_size, recompute_all):
+    """Compute BMI and abnormal vitals flags for existing medical records"""
+    from app.medical.flags import backfill_vital_flags as run_backfill
+
+    total = run_backfill(chunk_size=chunk_size, only_missing=not recompute_all)
+    print(f"Vital flags computed for {total} medical records.")
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    """Rebuild the full-text index over medical records"""
+    from app.medical.search import rebuild_search_index as run_rebuild
+
+    total = run_rebuild()
+    print(f"Search index rebuilt for {total} medical records.")
+
+
+@app.cli.command('create-device-token')
+@click.argument('name')
+def create_device_token(name):
+    """Create an API token for a bedside device (shown only once)"""
+    from app.models import DeviceToken
+
+    if DeviceToken.query.filter_by(name=name).first():
+        print(f"Device '{name}' already exists.")
+        return
+    _, token = DeviceToken.issue(name)
+    print(f"Token for device '{name}' (store it now, it is not shown again):")
+    print(token)
+
+
+@app.cli.command('revoke-device-token')
+@click.argument('name')
+def revoke_device_token(name):
+    """Disable the API token of a device"""
+    from app.models import DeviceToken
+
+    device = DeviceToken.query.filter_by(name=name).first()
+    if device is None:
+        print(f"Device '{name}' not found.")
+        return
+    device.is_active = False
+    db.session.commit()
+    print(f"Token for device '{name}' revoked.")
+
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters():
+    """Recompute the stored counters and repair any drift"""
+    from app.models import Counter
+
+    repaired = Counter.reconcile()
+    for name, subject_id, stored, actual in repaired:
+        subject = f" (patient {subject_id})" if subject_id else ''
+        print(f"  {name}{subject}: {stored} -> {actual}")
+    print(f"Counters reconciled: {len(repaired)} repaired.")
+
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
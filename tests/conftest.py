@@ -0,0 +1,103 @@
+"""
+Test fixtures
+Behavior tests get a fresh testing app (empty in-memory SQLite, files under
+tmp_path) per test. Benchmarks share one testing app per session, seeded at
+--scale rows per table with app/utils/benchmark.py.
+"""
+from datetime import date
+import pytest
+from flask import g, request_started
+from app import create_app, db
+from app.models import Patient, User
+from app.utils import audit
+from app.utils.benchmark import SCALES, QueryCounter, seed
+
+FOLDERS = ('ATTACHMENT_FOLDER', 'DERIVATIVE_FOLDER', 'IMPORT_FOLDER', 'EXPORT_FOLDER')
+
+
+def pytest_addoption(parser):
+    parser.addoption('--scale', choices=sorted(SCALES), default='1k',
+                     help='Rows per seeded table for the benchmarks (default 1k)')
+    parser.addoption('--rounds', type=int, default=20, help='Timed calls per benchmark (default 20)')
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing')
+    for name in FOLDERS:
+        app.config[name] = str(tmp_path / name.lower())
+    app.config['USER_CACHE_STAMP'] = str(tmp_path / 'user_cache.stamp')
+    # Requests reuse the test's app context, and so its g: forget the user Flask-Login loaded for the last one
+    request_started.connect(lambda sender, **extra: g.pop('_login_user', None), app, weak=False)
+    with app.app_context():
+        yield app
+        audit.flush()
+        db.session.remove()
+
+
+@pytest.fixture
+def admin(app):
+    return User.query.filter_by(username='admin').one()
+
+
+@pytest.fixture
+def client(app, admin):
+    """Test client with the default admin user's session (no login request: logins are rate limited)"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
+    return client
+
+
+@pytest.fixture
+def make_patient(app):
+    """make_patient(**columns): add and commit a patient"""
+    def make(**columns):
+        patient = Patient(**{'first_name': 'Ana', 'last_name': 'Garcia', 'date_of_birth': date(1980, 1, 1),
+                             'phone': '555-0000001', **columns})
+        db.session.add(patient)
+        db.session.commit()
+        return patient
+    return make
+
+
+@pytest.fixture(scope='session')
+def seeded_app(request):
+    app = create_app('testing')
+    with app.app_context():
+        seed(SCALES[request.config.getoption('--scale')])
+        yield app
+
+
+@pytest.fixture(scope='session')
+def seeded_client(seeded_app):
+    """Test client logged in as the default admin user"""
+    client = seeded_app.test_client()
+    response = client.post('/auth/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 302
+    return client
+
+
+def _clear_caches():
+    from app import routes
+    routes._stats_cache.clear()
+    for cache in routes._fragment_caches.values():
+        cache.clear()
+    db.session.remove()  # Every call starts with an empty session, like a request
+
+
+@pytest.fixture
+def measure(seeded_app, benchmark, request):
+    """
+    measure(call, max_queries): count the SQL statements of one call, then time it.
+    Server-side caches are cleared before every call, so routes do their work.
+    """
+    def run(call, max_queries):
+        _clear_caches()
+        with QueryCounter(db.engine) as counter:
+            call()
+        benchmark.extra_info['queries'] = counter.count
+        assert counter.count <= max_queries, f'{counter.count} queries (at most {max_queries} expected)'
+        benchmark.pedantic(call, setup=_clear_caches, rounds=request.config.getoption('--rounds'), warmup_rounds=1)
+    return run
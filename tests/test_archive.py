@@ -0,0 +1,90 @@
+"""Archiving inactive patients (app/patients/archive.py)"""
+from datetime import datetime, timedelta
+from app import db
+from app.models import (Appointment, ArchivedPatient, AuditEvent, Counter, MedicalRecord, Patient, Transaction,
+                        VitalReading)
+from app.utils import audit
+from app.patients.archive import archive_inactive_patients
+
+LONG_AGO = datetime.utcnow() - timedelta(days=5 * 365)
+
+
+def _inactive_patient(make_patient):
+    patient = make_patient(is_active=False)
+    patient_id = patient.id
+    db.session.add(MedicalRecord(patient_id=patient_id, visit_date=LONG_AGO, visit_reason='Checkup',
+                                 diagnosis='Healthy', heart_rate=70, temperature=36.6))
+    db.session.add_all([VitalReading(patient_id=patient_id, metric='heart_rate', ts=LONG_AGO + timedelta(hours=hour),
+                                     value=80 + hour) for hour in range(3)])
+    db.session.commit()
+    patient.updated_at = LONG_AGO  # Set after the inserts above, which would touch it
+    db.session.commit()
+    return patient.id
+
+
+def test_archives_device_readings(make_patient):
+    patient_id = _inactive_patient(make_patient)
+    active_id = make_patient(first_name='Luis').id
+    db.session.add(VitalReading(patient_id=active_id, metric='heart_rate', ts=LONG_AGO, value=75))
+    db.session.commit()
+
+    assert archive_inactive_patients() == 1
+
+    assert db.session.get(Patient, patient_id) is None
+    assert VitalReading.query.filter_by(patient_id=patient_id).count() == 0
+    assert VitalReading.query.filter_by(patient_id=active_id).count() == 1
+    archived = db.session.get(ArchivedPatient, patient_id)
+    readings = archived.get_records('vital_reading')
+    assert sorted(reading.value for reading in readings) == [80, 81, 82]
+    # Readings copied from the medical record are not archived twice: the record holds their values
+    assert all(reading.medical_record_id is None for reading in readings)
+    assert [record.heart_rate for record in archived.get_records('medical_record')] == [70]
+
+
+def test_keeps_recently_seen_patients(make_patient):
+    patient_id = _inactive_patient(make_patient)
+    db.session.add(MedicalRecord(patient_id=patient_id, visit_reason='Fever', diagnosis='Flu'))
+    db.session.commit()
+
+    assert archive_inactive_patients() == 0
+    assert db.session.get(Patient, patient_id) is not None
+    assert ArchivedPatient.query.count() == 0
+
+
+def test_moves_dependents_and_keeps_the_ledger(app, client, make_patient, admin):
+    patient_id = _inactive_patient(make_patient)
+    db.session.add(Appointment(patient_id=patient_id, created_by_id=admin.id, appointment_date=LONG_AGO,
+                               reason='Checkup', status='completed'))
+    db.session.add(Transaction(patient_id=patient_id, created_by_id=admin.id, transaction_date=LONG_AGO,
+                               transaction_type='income', category='consultation', amount=50,
+                               description='Consultation'))
+    db.session.commit()
+    record_id = MedicalRecord.query.filter_by(patient_id=patient_id).one().id
+
+    assert archive_inactive_patients() == 1
+
+    assert Appointment.query.count() == 0
+    assert Counter.for_patient(patient_id) == {Counter.MEDICAL_RECORDS: 0, Counter.APPOINTMENTS: 0}
+    transaction = Transaction.query.one()
+    assert transaction.patient_id is None and transaction.amount == 50
+    archived = db.session.get(ArchivedPatient, patient_id)
+    assert archived.to_patient().first_name == 'Ana'
+    assert [t.patient_id for t in archived.get_records('transaction')] == [patient_id]
+    assert len(archived.get_records('appointment')) == 1
+    audit.flush()
+    assert {(event.entity, event.entity_id) for event in AuditEvent.query.filter_by(action=AuditEvent.DELETE)} == \
+        {('patient', patient_id), ('medical_record', record_id)}
+
+    response = client.get(f'/patients/view/{patient_id}')
+    assert response.status_code == 200
+    assert b'Checkup' in response.data
+
+
+def test_keeps_patients_with_pending_payments(make_patient, admin):
+    patient_id = _inactive_patient(make_patient)
+    db.session.add(Transaction(patient_id=patient_id, created_by_id=admin.id, transaction_date=LONG_AGO,
+                               transaction_type='income', category='consultation', amount=50,
+                               description='Consultation', status='pending'))
+    db.session.commit()
+
+    assert archive_inactive_patients() == 0
@@ -0,0 +1,76 @@
+"""Content-addressed attachment storage (app/medical/attachments.py)"""
+import hashlib
+import os
+from app import db
+from app.medical.attachments import release_file
+from app.models import ArchivedPatient, ArchivedRecord, Attachment, MedicalRecord
+
+REPORT = b'%PDF-1.4 lab report ' * 10000  # Several read chunks
+
+
+def _record(make_patient):
+    record = MedicalRecord(patient_id=make_patient().id, visit_reason='Checkup', diagnosis='Healthy')
+    db.session.add(record)
+    db.session.commit()
+    return record.id
+
+
+def _upload(client, record_id, data, filename='report.pdf'):
+    return client.post(f'/medical/{record_id}/attachments', data=data,
+                       headers={'X-Filename': filename, 'Content-Type': 'application/pdf'})
+
+
+def test_same_content_is_stored_once(client, make_patient):
+    record_id = _record(make_patient)
+
+    first = _upload(client, record_id, REPORT).get_json()
+    second = _upload(client, record_id, REPORT, filename='report%20copy.pdf').get_json()
+
+    sha256 = hashlib.sha256(REPORT).hexdigest()
+    assert first['sha256'] == second['sha256'] == sha256
+    assert (first['size'], second['filename']) == (len(REPORT), 'report_copy.pdf')
+    attachment = db.session.get(Attachment, first['id'])
+    with open(attachment.path, 'rb') as file:
+        assert file.read() == REPORT
+    assert os.listdir(os.path.join(os.path.dirname(attachment.path))) == [sha256]
+    assert os.listdir(os.path.join(client.application.config['ATTACHMENT_FOLDER'], 'tmp')) == []
+
+
+def test_downloads_support_ranges(client, make_patient):
+    attachment = _upload(client, _record(make_patient), REPORT).get_json()
+
+    response = client.get(attachment['url'], headers={'Range': 'bytes=0-7'})
+
+    assert response.status_code == 206
+    assert response.data == REPORT[:8]
+    assert response.headers['ETag'] == f'"{attachment["sha256"]}"'
+
+
+def test_rejects_disallowed_types(client, make_patient):
+    assert _upload(client, _record(make_patient), b'MZ', filename='setup.exe').status_code == 415
+    assert Attachment.query.count() == 0
+
+
+def test_file_is_removed_with_its_last_reference(client, make_patient):
+    record_id = _record(make_patient)
+    ids = [_upload(client, record_id, REPORT).get_json()['id'] for _ in range(2)]
+    path = db.session.get(Attachment, ids[0]).path
+
+    client.post(f'/medical/attachments/{ids[0]}/delete')
+    assert os.path.exists(path)
+    client.post(f'/medical/attachments/{ids[1]}/delete')
+    assert not os.path.exists(path)
+
+
+def test_archived_attachments_keep_their_file(client, make_patient):
+    attachment = _upload(client, _record(make_patient), REPORT).get_json()
+    row = db.session.get(Attachment, attachment['id'])
+    path, patient_id = row.path, row.patient_id
+    db.session.add(ArchivedPatient(id=patient_id, first_name='Ana', last_name='Garcia', data='{}'))
+    db.session.add(ArchivedRecord(patient_id=patient_id, entity='attachment', entity_id=row.id, data='{}',
+                                  sha256=attachment['sha256']))
+    db.session.delete(row)
+    db.session.commit()
+
+    assert release_file(attachment['sha256']) is False
+    assert os.path.exists(path)
@@ -0,0 +1,87 @@
+"""Buffered audit log (app/utils/audit.py, app/utils/batch.py)"""
+from app import db
+from app.models import AuditEvent, MedicalRecord, Patient
+from app.utils import audit
+from app.utils.batch import BatchWriter
+
+
+def _events(**filters):
+    audit.flush()
+    return [(event.action, event.entity, event.entity_id, event.user_id)
+            for event in AuditEvent.query.filter_by(**filters).order_by(AuditEvent.id)]
+
+
+def test_records_views_of_patient_data(client, make_patient, admin):
+    patient_id = make_patient().id
+
+    assert client.get(f'/patients/view/{patient_id}').status_code == 200
+    assert client.get('/patients/view/999').status_code == 404
+    client.get('/patients/')
+
+    assert _events(action=AuditEvent.VIEW) == [('view', 'patient', patient_id, admin.id)]
+    assert AuditEvent.query.filter_by(action=AuditEvent.VIEW).one().ip_address == '127.0.0.1'
+
+
+def test_records_committed_changes_only(make_patient):
+    patient = make_patient()
+    record = MedicalRecord(patient_id=patient.id, visit_reason='Checkup', diagnosis='Healthy')
+    db.session.add(record)
+    db.session.commit()
+
+    patient.phone = patient.phone  # Not a change
+    record.diagnosis = 'Flu'
+    db.session.commit()
+    patient.first_name = 'Rolled back'
+    db.session.flush()
+    db.session.rollback()
+    db.session.delete(record)
+    db.session.commit()
+
+    assert _events() == [('create', 'patient', patient.id, None), ('create', 'medical_record', record.id, None),
+                         ('update', 'medical_record', record.id, None), ('delete', 'medical_record', record.id, None)]
+
+
+def test_actor_of_changes_made_in_a_request(client, admin):
+    response = client.post('/patients/create', data={
+        'first_name': 'Ana', 'last_name': 'Garcia', 'date_of_birth': '1980-01-01', 'gender': 'female',
+        'phone': '555-0001'})
+    assert response.status_code == 302
+
+    patient_id = Patient.query.one().id
+    assert ('create', 'patient', patient_id, admin.id) in _events()
+
+
+def test_log_is_for_admins(app, client, admin, make_patient):
+    patient_id = make_patient().id
+    assert client.get(f'/audit?entity=patient&entity_id={patient_id}').status_code == 200
+
+    admin.role = 'doctor'
+    db.session.commit()
+    assert client.get('/audit').status_code == 302
+
+
+class ListWriter(BatchWriter):
+    name = 'test-writer'
+
+    def __init__(self, fail=False, **kwargs):
+        super().__init__(**kwargs)
+        self.fail = fail
+        self.batches = []
+
+    def write(self, connection, batch):
+        if self.fail:
+            raise RuntimeError('database down')
+        self.batches.append(batch)
+
+
+def test_failed_writes_are_kept_up_to_capacity(app):
+    writer = ListWriter(fail=True)
+    writer.configure(app, capacity=3, batch_size=2, interval=1.0)
+
+    for item in range(5):
+        writer.append(item)
+
+    assert (list(writer._items), writer.dropped) == ([2, 3, 4], 2)  # Oldest dropped first
+    writer.fail = False
+    assert writer.flush() == 3
+    assert writer.batches == [[2, 3], [4]]
@@ -0,0 +1,51 @@
+"""Sign-in and password changes (app/auth)"""
+import os
+from werkzeug.security import check_password_hash, generate_password_hash
+from app import db
+from app.auth import security
+from app.models import User
+
+
+def _user(username, password, method=None):
+    user = User(username=username, email=f'{username}@example.com', first_name='Ana', last_name='Garcia',
+                role='doctor', password_hash=generate_password_hash(password, method or 'scrypt:32768:8:1'))
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def test_login_upgrades_old_hash_without_bumping_user_cache_stamp(app):
+    user_id = _user('pbkdf2-user', 'secret123', method='pbkdf2:sha256:1000')
+
+    response = app.test_client().post('/auth/login', data={'username': 'pbkdf2-user', 'password': 'secret123'})
+
+    assert response.status_code == 302
+    password_hash = db.session.get(User, user_id).password_hash
+    assert not security.needs_rehash(password_hash)
+    assert check_password_hash(password_hash, 'secret123')
+    assert not os.path.exists(app.config['USER_CACHE_STAMP'])  # Other workers keep their snapshots
+
+
+def test_change_password_bumps_user_cache_stamp(app, client, admin):
+    response = client.post('/auth/change-password', data={
+        'current_password': 'admin123', 'new_password': 'new-secret', 'confirm_password': 'new-secret'})
+
+    assert response.status_code == 302
+    db.session.expire_all()
+    assert check_password_hash(db.session.get(User, admin.id).password_hash, 'new-secret')
+    assert os.path.exists(app.config['USER_CACHE_STAMP'])
+
+
+def test_change_password_when_hashing_is_busy(client, admin, monkeypatch):
+    old_hash = admin.password_hash
+
+    def busy(password):
+        raise security.HashingBusy()
+    monkeypatch.setattr(security, 'hash_password', busy)
+    response = client.post('/auth/change-password', data={
+        'current_password': 'admin123', 'new_password': 'new-secret', 'confirm_password': 'new-secret'})
+
+    assert response.status_code == 200
+    assert b'The server is busy' in response.data
+    db.session.expire_all()
+    assert db.session.get(User, admin.id).password_hash == old_hash
@@ -0,0 +1,59 @@
+"""
+Hot routes and model methods
+
+Timed with pytest-benchmark; each result also stores the number of SQL
+statements per call (extra_info['queries']), and a case that needs more than
+its query budget fails. Save and compare baselines with:
+
+    pytest tests --benchmark-autosave
+    pytest tests --benchmark-compare --benchmark-compare-fail=median:20%
+
+Use --scale 100k or 1m for larger databases.
+"""
+from datetime import datetime, timedelta
+from app import routes
+from app.models import Appointment, Transaction
+
+
+def _get(client, url):
+    def call():
+        response = client.get(url)
+        assert response.status_code == 200
+    return call
+
+
+def test_dashboard(seeded_client, measure):
+    def call():
+        assert seeded_client.get('/dashboard').status_code == 200
+        for name in routes.FRAGMENTS:
+            assert seeded_client.get(f'/dashboard/fragments/{name}').status_code == 200
+    measure(call, max_queries=5)
+
+
+def test_patient_search(seeded_client, measure):
+    measure(_get(seeded_client, '/patients/?search=garcia'), max_queries=2)
+
+
+def test_calendar_feed(seeded_client, measure):
+    now = datetime.utcnow()
+    week_start = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    url = (f'/appointments/api/appointments?start={week_start.isoformat()}'
+           f'&end={(week_start + timedelta(days=7)).isoformat()}')
+    measure(_get(seeded_client, url), max_queries=1)
+
+
+def test_finance_overview(seeded_client, measure):
+    measure(_get(seeded_client, '/finance/'), max_queries=11)
+
+
+def test_schedule_conflicts(seeded_app, measure):
+    start = datetime.utcnow().replace(hour=10, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    measure(lambda: Appointment.get_schedule_conflicts(start, 30), max_queries=1)
+
+
+def test_generate_invoice_number(seeded_app, measure):
+    measure(Transaction.generate_invoice_number, max_queries=1)
+
+
+def test_total_income(seeded_app, measure):
+    measure(Transaction.get_total_income, max_queries=1)
@@ -0,0 +1,50 @@
+"""Event-maintained counters (app/models/counter.py)"""
+from app import db
+from app.models import Counter, MedicalRecord, Patient, Transaction
+
+
+def _transaction(admin, **columns):
+    transaction = Transaction(**{'created_by_id': admin.id, 'transaction_type': 'income', 'category': 'consultation',
+                                 'amount': 50, 'description': 'Consultation', 'status': 'pending', **columns})
+    db.session.add(transaction)
+    db.session.commit()
+    return transaction
+
+
+def test_counts_follow_inserts_updates_and_deletes(make_patient, admin):
+    ana = make_patient()
+    luis = make_patient(first_name='Luis', is_active=False)
+    record = MedicalRecord(patient_id=ana.id, visit_reason='Checkup', diagnosis='Healthy')
+    db.session.add(record)
+    paid = _transaction(admin)
+    _transaction(admin)
+    _transaction(admin, transaction_type='expense')
+    assert (Counter.get(Counter.ACTIVE_PATIENTS), Counter.get(Counter.PENDING_PAYMENTS)) == (1, 2)
+    assert Counter.for_patient(ana.id)[Counter.MEDICAL_RECORDS] == 1
+
+    db.session.expire_all()  # Changes to unloaded attributes are counted too
+    luis.is_active = True
+    paid.status = 'completed'
+    record.patient_id = luis.id
+    db.session.commit()
+    assert (Counter.get(Counter.ACTIVE_PATIENTS), Counter.get(Counter.PENDING_PAYMENTS)) == (2, 1)
+    assert (Counter.for_patient(ana.id)[Counter.MEDICAL_RECORDS],
+            Counter.for_patient(luis.id)[Counter.MEDICAL_RECORDS]) == (0, 1)
+
+    db.session.delete(record)
+    db.session.delete(luis)
+    db.session.commit()
+    assert Counter.get(Counter.ACTIVE_PATIENTS) == 1
+    assert Counter.query.filter_by(subject_id=luis.id).count() == 0
+    assert Counter.reconcile() == []
+
+
+def test_reconcile_repairs_drift(make_patient):
+    patient_id = make_patient().id
+    db.session.execute(Patient.__table__.update().values(is_active=False))  # Core: no counter events
+    Counter.adjust(db.session.connection(), Counter.MEDICAL_RECORDS, 3, patient_id)
+    db.session.commit()
+
+    assert Counter.reconcile() == [(Counter.ACTIVE_PATIENTS, 0, 1, 0), (Counter.MEDICAL_RECORDS, patient_id, 3, 0)]
+    assert Counter.get(Counter.ACTIVE_PATIENTS) == 0
+    assert Counter.reconcile() == []
@@ -0,0 +1,52 @@
+"""Bulk scheduling of follow-up appointments (app/medical/follow_ups.py)"""
+from datetime import datetime, time, timedelta
+from app import db
+from app.medical.follow_ups import schedule_follow_ups
+from app.models import Appointment, MedicalRecord
+
+
+def _follow_up(make_patient, day, name):
+    patient = make_patient(first_name=name)
+    record = MedicalRecord(patient_id=patient.id, visit_reason='Checkup', diagnosis='Healthy',
+                           follow_up_required=True, follow_up_date=day)
+    db.session.add(record)
+    db.session.commit()
+    return record.id
+
+
+def _overlapping(appointments):
+    spans = sorted((a.appointment_date, a.appointment_date + timedelta(minutes=a.duration_minutes))
+                   for a in appointments)
+    return [(first, second) for first, second in zip(spans, spans[1:]) if second[0] < first[1]]
+
+
+def test_calls_for_the_same_day_do_not_double_book(make_patient, admin):
+    day = datetime.utcnow().date() + timedelta(days=3)
+    db.session.add(Appointment(patient_id=make_patient(first_name='Booked').id, created_by_id=admin.id,
+                               appointment_date=datetime.combine(day, time(9, 30)), duration_minutes=45,
+                               reason='Consultation'))
+    db.session.commit()
+
+    first = schedule_follow_ups([_follow_up(make_patient, day, 'Ana'), _follow_up(make_patient, day, 'Luis')],
+                                created_by_id=admin.id)
+    second = schedule_follow_ups([_follow_up(make_patient, day, 'Maria')], created_by_id=admin.id)
+
+    assert [a.appointment_date.time() for a in first + second] == [time(9, 0), time(10, 15), time(10, 45)]
+    assert _overlapping(Appointment.query.all()) == []
+
+
+def test_fills_gaps_and_ignores_cancelled_appointments(make_patient, admin):
+    day = datetime.utcnow().date() + timedelta(days=3)
+    patient_id = make_patient(first_name='Booked').id
+    db.session.add_all([
+        Appointment(patient_id=patient_id, created_by_id=admin.id, appointment_date=datetime.combine(day, time(9, 0)),
+                    duration_minutes=30, reason='Consultation', status='cancelled'),
+        Appointment(patient_id=patient_id, created_by_id=admin.id, appointment_date=datetime.combine(day, time(9, 30)),
+                    duration_minutes=30, reason='Consultation'),
+    ])
+    db.session.commit()
+
+    appointments = schedule_follow_ups([_follow_up(make_patient, day, name) for name in ('Ana', 'Luis')],
+                                       created_by_id=admin.id)
+
+    assert [a.appointment_date.time() for a in appointments] == [time(9, 0), time(10, 0)]
@@ -0,0 +1,72 @@
+"""Bulk patient import (app/patients/importer.py)"""
+from datetime import date
+import pytest
+from app.models import AuditEvent, Counter, Patient, PatientImport
+from app.patients import importer
+from app.utils import audit
+
+ROWS = [
+    'Nombre;Apellido;Fecha de nacimiento;Teléfono;Sexo;Alergias',
+    'Ana;Garcia;05/03/1980;555 0001;F;Penicillin, latex',
+    'Luis;Lopez;1975-11-20;555-0002;m;',
+    'Maria;Perez;;555-0003;F;',  # No date of birth
+    'ana;GARCIA;1980-03-05;555-9999;F;',  # Same name and birth date as row 1
+    'Jose;Diaz;1990-01-01;555-0005;x;',  # Unknown gender
+    'Carmen;Ruiz;1985-07-07;(555) 0006;F;',
+]
+
+
+def _csv(tmp_path, rows=ROWS):
+    path = tmp_path / 'patients.csv'
+    path.write_text('\n'.join(rows) + '\n', encoding='utf-8')
+    return str(path)
+
+
+def test_imports_valid_rows_and_reports_the_others(app, tmp_path):
+    job = importer.import_patients(_csv(tmp_path), chunk_size=2)
+
+    assert (job.status, job.rows_processed, job.rows_imported, job.rows_duplicate, job.rows_invalid) == \
+        ('completed', 6, 3, 1, 2)
+    assert [error['row'] for error in job.get_errors()] == [3, 5]
+    ana = Patient.query.filter_by(first_name='Ana').one()
+    assert ana.date_of_birth == date(1980, 3, 5)  # Day first
+    assert sorted(ana.allergy_tags) == ['latex', 'penicillin']
+    assert Counter.get(Counter.ACTIVE_PATIENTS) == 3
+    audit.flush()
+    assert AuditEvent.query.filter_by(action=AuditEvent.CREATE, entity='patient').count() == 3
+
+
+def test_skips_patients_already_in_the_database(app, tmp_path, make_patient):
+    make_patient(first_name='Carmen', last_name='Ruiz', date_of_birth=date(1984, 1, 1), phone='555-0006')
+    make_patient(first_name='Luisa', last_name='Lopez', date_of_birth=date(1975, 11, 20), phone='5550002')
+
+    job = importer.import_patients(_csv(tmp_path))
+
+    # Luis shares Luisa's phone and birth date; Carmen's birth date differs, so she is new
+    assert (job.rows_imported, job.rows_duplicate) == (2, 2)
+
+
+def test_resumes_after_the_last_committed_chunk(app, tmp_path, monkeypatch):
+    path = _csv(tmp_path)
+    import_chunk = importer._import_chunk
+    calls = []
+
+    def failing_chunk(job, chunk, columns, dayfirst):
+        calls.append([row_number for row_number, _ in chunk])
+        if len(calls) == 2:
+            raise RuntimeError('connection lost')
+        import_chunk(job, chunk, columns, dayfirst)
+    monkeypatch.setattr(importer, '_import_chunk', failing_chunk)
+
+    with pytest.raises(RuntimeError):
+        importer.import_patients(path, chunk_size=2)
+    job = PatientImport.query.one()
+    assert (job.status, job.failure_reason, job.rows_processed) == ('failed', 'connection lost', 2)
+
+    monkeypatch.setattr(importer, '_import_chunk', import_chunk)
+    job = importer.import_patients(path, chunk_size=2)
+
+    assert calls == [[1, 2], [3, 4]]
+    assert (job.status, job.rows_processed, job.rows_imported, job.rows_duplicate) == ('completed', 6, 3, 1)
+    assert Patient.query.count() == 3
+    assert importer.import_patients(path).id == job.id  # A completed file is not imported again
@@ -0,0 +1,82 @@
+"""Vitals ingestion from bedside devices (app/medical/ingest.py)"""
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app import db
+from app.medical.ingest import ingest_lines
+from app.models import DeviceToken, VitalReading
+
+URL = '/medical/api/vitals/ingest'
+
+
+def _ndjson(*readings):
+    return ''.join(json.dumps(reading) + '\n' for reading in readings)
+
+
+def _post(client, body, token=None):
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    return client.post(URL, data=body, headers=headers, content_type='application/x-ndjson')
+
+
+def test_requires_an_active_device_token_or_session(app, make_patient):
+    patient_id = make_patient().id
+    body = _ndjson({'patient_id': patient_id, 'heart_rate': 80})
+    device, token = DeviceToken.issue('ward-1-monitor')
+    anonymous = app.test_client()
+
+    assert _post(anonymous, body).status_code == 401
+    assert _post(anonymous, body, token='not-a-token').status_code == 401
+    assert VitalReading.query.count() == 0
+
+    response = _post(anonymous, body, token=token)
+    assert response.status_code == 200
+    assert response.headers['X-Ingest-Accepted'] == '1'
+    assert db.session.get(DeviceToken, device.id).last_used_at is not None
+
+    device.is_active = False
+    db.session.commit()
+    assert _post(anonymous, body, token=token).status_code == 401
+
+
+def test_acknowledges_every_line_in_order(client, make_patient):
+    patient_id = make_patient().id
+    inactive_id = make_patient(first_name='Luis', is_active=False).id
+    future = (datetime.utcnow() + timedelta(hours=1)).isoformat()
+    body = '\n'.join([
+        json.dumps({'patient_id': patient_id, 'ts': '2026-01-05T08:30:00Z', 'heart_rate': 120, 'oxygen_saturation': 97,
+                    'ref': 'm1-1'}),
+        'not json',
+        '',
+        json.dumps({'patient_id': patient_id, 'heart_rate': 900}),
+        json.dumps({'patient_id': patient_id, 'ts': future, 'heart_rate': 80}),
+        json.dumps({'patient_id': 999, 'heart_rate': 80, 'ref': 'm1-5'}),
+        json.dumps({'patient_id': inactive_id, 'heart_rate': 80}),
+        json.dumps({'patient_id': patient_id, 'glucose': 5.1}),
+    ])
+
+    response = _post(client, body)
+
+    acks = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(ack['line'], ack['status']) for ack in acks] == \
+        [(1, 'ok'), (2, 'error'), (4, 'error'), (5, 'error'), (6, 'error'), (7, 'error'), (8, 'error')]
+    assert acks[0] == {'line': 1, 'status': 'ok', 'abnormal': ['heart_rate'], 'ref': 'm1-1'}
+    assert acks[4] == {'line': 6, 'status': 'error', 'error': 'unknown patient', 'ref': 'm1-5'}
+    assert (response.headers['X-Ingest-Accepted'], response.headers['X-Ingest-Rejected']) == ('1', '6')
+    readings = VitalReading.query.order_by(VitalReading.metric).all()
+    assert [(r.metric, r.value, r.ts, r.medical_record_id) for r in readings] == [
+        ('heart_rate', 120, datetime(2026, 1, 5, 8, 30), None),
+        ('oxygen_saturation', 97, datetime(2026, 1, 5, 8, 30), None)]
+
+
+def test_commits_in_batches(make_patient):
+    patient_id = make_patient().id
+    lines = [json.dumps({'patient_id': patient_id, 'heart_rate': 60 + number}) for number in range(5)]
+
+    result = ingest_lines(line.encode() for line in lines)
+    assert (result.accepted, VitalReading.query.count()) == (5, 5)
+
+    commits = []
+    event.listen(db.session(), 'after_commit', commits.append)
+    result = ingest_lines(iter(lines), batch_size=2)
+    assert [ack['status'] for ack in result.acks] == ['ok'] * 5
+    assert (len(commits), VitalReading.query.count()) == (3, 10)
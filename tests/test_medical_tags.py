@@ -0,0 +1,53 @@
+"""Allergy and chronic condition tags (app/models/medical_tag.py)"""
+from datetime import date
+from app import db
+from app.models import MedicalTag, Patient
+
+
+def _names(patients):
+    return sorted(patient.first_name for patient in patients)
+
+
+def test_tags_follow_the_free_text_fields(make_patient):
+    patient = make_patient(allergies='Penicillin; latex.\nNone', chronic_conditions='Diabetes, Asthma')
+    assert sorted(patient.allergy_tags) == ['latex', 'penicillin']
+    assert sorted(patient.condition_tags) == ['asthma', 'diabetes']
+
+    patient.allergies = 'Latex'
+    db.session.commit()
+
+    assert patient.allergy_tags == ['latex']
+    assert _names(Patient.find_by_tags(allergies=['penicillin']).all()) == []
+
+
+def test_patients_flushed_together_share_new_tags(app):
+    db.session.add_all([Patient(first_name=name, last_name='Garcia', date_of_birth=date(1980, 1, 1),
+                                phone=f'555-000{number}', allergies='Penicillin')
+                        for number, name in enumerate(['Ana', 'Luis'])])
+    db.session.commit()
+
+    assert MedicalTag.query.filter_by(kind=MedicalTag.ALLERGY, name='penicillin').count() == 1
+    assert _names(Patient.find_by_tags(allergies=['PENICILLIN']).all()) == ['Ana', 'Luis']
+
+
+def test_find_by_every_given_tag(make_patient):
+    make_patient(first_name='Ana', allergies='penicillin', chronic_conditions='diabetes')
+    make_patient(first_name='Luis', allergies='penicillin')
+    make_patient(first_name='Maria', allergies='penicillin', chronic_conditions='diabetes', is_active=False)
+
+    assert _names(Patient.find_by_tags(allergies=['penicillin'], conditions=['diabetes']).all()) == ['Ana']
+    assert _names(Patient.find_by_tags(allergies=['penicillin'], conditions=['diabetes'], active_only=False)) == \
+        ['Ana', 'Maria']
+    assert Patient.find_by_tags(conditions=['gout']).all() == []
+
+
+def test_link_patients_rebuilds_links_in_bulk(make_patient):
+    ana = make_patient(first_name='Ana', allergies='latex')
+    luis = make_patient(first_name='Luis')
+
+    MedicalTag.link_patients([(ana.id, 'Aspirin', None), (luis.id, 'aspirin, latex', 'Gout')])
+    db.session.commit()
+    db.session.expire_all()
+
+    assert ana.allergy_tags == ['aspirin']
+    assert (sorted(luis.allergy_tags), luis.condition_tags) == (['aspirin', 'latex'], ['gout'])
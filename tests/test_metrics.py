@@ -0,0 +1,46 @@
+"""Prometheus metrics at /metrics (app/utils/metrics.py)"""
+import os
+from app import db
+from app.utils import metrics, sqlstats
+from config import config
+
+
+def test_requires_configured_token(app):
+    client = app.test_client()
+    app.config['METRICS_TOKEN'] = 'scrape-secret'
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+    assert response.status_code == 200
+    assert b'clinicx_http_requests_total' in response.data
+
+
+def test_not_served_without_token_when_required(app):
+    assert config['production'].METRICS_REQUIRE_TOKEN
+    client = app.test_client()
+    app.config.update(METRICS_TOKEN=None, METRICS_REQUIRE_TOKEN=True)
+
+    assert client.get('/metrics').status_code == 404
+
+
+def test_exports_sql_stats_of_all_workers(app, client, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, 'SQL_STATS_SAMPLE_RATE', 1.0)
+    sqlstats.init_app(app, db.engine)
+    monkeypatch.setattr(sqlstats, '_endpoints', {})
+    monkeypatch.setitem(metrics._settings, 'directory', str(tmp_path))
+    for _ in range(2):
+        assert client.get('/patients/').status_code == 200
+    queries = sqlstats.endpoint_report()['patients.index']['queries']
+
+    # Another worker that served the same requests
+    metrics.write_snapshot()
+    os.replace(tmp_path / f'{os.getpid()}.json', tmp_path / '1.json')
+
+    counters = metrics.collect_all()['counters']
+    labels = (('endpoint', 'patients.index'),)
+    assert counters[('clinicx_sql_sampled_requests_total', labels)] == 4
+    assert counters[('clinicx_sql_queries_total', labels)] == 2 * queries
+    assert counters[('clinicx_sql_duration_seconds_total', labels)] > 0
+    assert counters[('clinicx_sql_n_plus_one_requests_total', labels)] == 0
+    assert '# TYPE clinicx_sql_queries_total counter' in metrics.render(metrics.collect_all())
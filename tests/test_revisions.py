@@ -0,0 +1,62 @@
+"""Medical record revision history (app/models/medical_record_revision.py)"""
+from datetime import datetime
+from app import db
+from app.models import MedicalRecord, MedicalRecordRevision
+
+
+def _checkpoint():
+    """A time between two commits"""
+    db.session.expire_all()  # Later changes are made to unloaded attributes too
+    return datetime.utcnow()
+
+
+def test_revisions_store_only_changed_fields(make_patient):
+    record = MedicalRecord(patient_id=make_patient().id, visit_reason='Checkup', diagnosis='Flu', heart_rate=90)
+    db.session.add(record)
+    db.session.commit()
+    record_id = record.id
+    db.session.expire_all()
+
+    record.diagnosis = 'Bronchitis'
+    record.heart_rate = 90
+    db.session.commit()
+    db.session.delete(record)
+    db.session.commit()
+
+    create, update, delete = MedicalRecordRevision.history(record_id)
+    assert (create.action, update.action, delete.action) == ('create', 'update', 'delete')
+    assert create.get_changes()['diagnosis'] == (None, 'Flu')
+    assert update.get_changes() == {'diagnosis': ('Flu', 'Bronchitis')}
+    assert delete.get_changes()['heart_rate'] == (90, None)
+    assert 'updated_at' not in create.get_changes()
+
+
+def test_reconstruct_past_versions(client, make_patient):
+    before = datetime.utcnow()
+    record = MedicalRecord(patient_id=make_patient().id, visit_reason='Checkup', diagnosis='Flu', heart_rate=90)
+    db.session.add(record)
+    db.session.commit()
+    record_id = record.id
+    created = _checkpoint()
+    record.diagnosis = 'Bronchitis'
+    db.session.commit()
+    updated = _checkpoint()
+    record.heart_rate = 70
+    db.session.commit()
+
+    assert MedicalRecordRevision.reconstruct(record_id, before) is None
+    first = MedicalRecordRevision.reconstruct(record_id, created)
+    assert (first.id, first.diagnosis, first.heart_rate) == (record_id, 'Flu', 90)
+    second = MedicalRecordRevision.reconstruct(record_id, updated)
+    assert (second.diagnosis, second.heart_rate) == ('Bronchitis', 90)
+
+    last = _checkpoint()
+    db.session.delete(db.session.get(MedicalRecord, record_id))
+    db.session.commit()
+    assert MedicalRecordRevision.reconstruct(record_id, last).heart_rate == 70  # Rebuilt from the revisions alone
+    assert MedicalRecordRevision.reconstruct(record_id, datetime.utcnow()) is None
+
+    response = client.get(f'/medical/history/{record_id}?at={created.isoformat()}')
+    assert response.status_code == 200
+    assert b'Flu' in response.data
+    assert client.get(f'/medical/history/{record_id}?at=yesterday').status_code == 400
@@ -0,0 +1,71 @@
+"""Full-text search over medical records (app/medical/search.py)"""
+from sqlalchemy import text
+from app import db
+from app.medical.search import build_match_query, rebuild_search_index, search_records
+from app.models import MedicalRecord
+
+
+def _record(patient_id, diagnosis, **fields):
+    record = MedicalRecord(patient_id=patient_id, visit_reason='Checkup', diagnosis=diagnosis, **fields)
+    db.session.add(record)
+    db.session.commit()
+    return record
+
+
+def _ids(query, **filters):
+    return [record.id for record, _ in search_records(query, **filters)]
+
+
+def test_build_match_query():
+    assert build_match_query('fever "chest pain" cardi*') == '"fever" "chest pain" "cardi"*'
+    assert build_match_query('"" ; -') == ''
+
+
+def test_stemmed_accent_insensitive_ranked_matches(make_patient):
+    patient_id = make_patient().id
+    notes = _record(patient_id, 'Healthy', doctor_notes='Mentions diabetes in the family')
+    diagnosis = _record(patient_id, 'Diabétes tipo 2')
+    _record(patient_id, 'Fractured wrist', symptoms='Swelling and fevers')
+
+    assert _ids('diabetes') == [diagnosis.id, notes.id]  # Diagnosis weighs more than notes
+    assert len(_ids('fever')) == 1
+    assert _ids('fract*') and not _ids('fract')
+    assert _ids('') == []
+
+
+def test_index_follows_record_changes(make_patient):
+    patient_id = make_patient().id
+    record = _record(patient_id, 'Migraine')
+    record_id = record.id
+
+    record.diagnosis = 'Tension headache'
+    db.session.commit()
+    assert (_ids('migraine'), _ids('headache')) == ([], [record_id])
+
+    db.session.delete(record)
+    db.session.commit()
+    assert _ids('headache') == []
+
+
+def test_filters_and_snippets(client, make_patient):
+    ana, luis = make_patient(first_name='Ana').id, make_patient(first_name='Luis').id
+    record = _record(ana, 'Asthma <b>severe</b>')
+    _record(luis, 'Asthma')
+
+    assert _ids('asthma', patient_id=ana) == [record.id]
+    [(_, snippet)] = search_records('severe')
+    assert '<mark>severe</mark>' in snippet and '&lt;b&gt;' in snippet
+
+    response = client.get(f'/medical/search?q=asthma&patient_id={luis}')
+    assert response.status_code == 200
+    assert b'Luis' in response.data
+
+
+def test_rebuild(make_patient):
+    record_id = _record(make_patient().id, 'Gout').id
+    db.session.execute(text('DELETE FROM medical_records_fts'))
+    db.session.commit()
+    assert _ids('gout') == []
+
+    assert rebuild_search_index() == 1
+    assert _ids('gout') == [record_id]
@@ -0,0 +1,70 @@
+"""Per-process user snapshots for the login user loader (app/models/user.py)"""
+import os
+from app import db
+from app.models import User
+from app.models.user import CachedUser, _user_cache, load_user
+from app.utils.benchmark import QueryCounter
+
+
+def _stamp_bumped(app):
+    return os.path.exists(app.config['USER_CACHE_STAMP'])
+
+
+def test_snapshots_are_served_without_queries(app, admin):
+    _user_cache.clear()
+    first = load_user(str(admin.id))
+    assert isinstance(first, CachedUser) and first.username == 'admin' and first.is_admin()
+
+    with QueryCounter(db.engine) as counter:
+        assert load_user(str(admin.id)) is first
+    assert counter.count == 0
+    assert load_user('999') is None
+
+
+def test_profile_changes_drop_only_that_snapshot(app, admin):
+    _user_cache.clear()
+    assert load_user(str(admin.id)).first_name != 'Ada'
+
+    admin.first_name = 'Ada'
+    db.session.commit()
+
+    assert load_user(str(admin.id)).first_name == 'Ada'
+    assert not _stamp_bumped(app)
+
+
+def test_security_changes_bump_the_stamp(app, admin):
+    _user_cache.clear()
+    load_user(str(admin.id))
+
+    admin.role = 'doctor'
+    db.session.commit()
+
+    assert _stamp_bumped(app)
+    assert load_user(str(admin.id)).role == 'doctor'
+
+
+def test_stamp_bumped_by_another_worker_clears_every_snapshot(app, admin):
+    _user_cache.clear()
+    load_user(str(admin.id))
+    # Another worker process changes the role and bumps the stamp: this process's session events never see it
+    db.session.execute(User.__table__.update().values(role='receptionist'))
+    db.session.commit()
+    assert load_user(str(admin.id)).role != 'receptionist'
+
+    with open(app.config['USER_CACHE_STAMP'], 'w'):
+        pass
+    os.utime(app.config['USER_CACHE_STAMP'], (1, 1))
+
+    assert load_user(str(admin.id)).role == 'receptionist'
+
+
+def test_rolled_back_changes_keep_the_snapshot(app, admin):
+    _user_cache.clear()
+    snapshot = load_user(str(admin.id))
+
+    admin.role = 'doctor'
+    db.session.flush()
+    db.session.rollback()
+
+    assert load_user(str(admin.id)) is snapshot
+    assert not _stamp_bumped(app)
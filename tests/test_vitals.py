@@ -0,0 +1,66 @@
+"""Vital readings series and trend API (app/models/vital_reading.py, app/medical/vitals.py)"""
+from datetime import datetime, timedelta, timezone
+from app import db
+from app.medical.vitals import lttb, load_series
+from app.models import MedicalRecord, VitalReading
+
+VISIT = datetime(2026, 1, 5, 8, 30)
+
+
+def _readings(patient_id):
+    return sorted((reading.metric, reading.value) for reading in VitalReading.query.filter_by(patient_id=patient_id))
+
+
+def test_readings_follow_the_medical_record(make_patient):
+    patient_id = make_patient().id
+    record = MedicalRecord(patient_id=patient_id, visit_date=VISIT, visit_reason='Checkup', diagnosis='Healthy',
+                           heart_rate=72, temperature=36.8)
+    db.session.add(record)
+    db.session.commit()
+    assert _readings(patient_id) == [('heart_rate', 72), ('temperature', 36.8)]
+
+    record.heart_rate = None
+    record.oxygen_saturation = 97
+    db.session.commit()
+    assert _readings(patient_id) == [('oxygen_saturation', 97), ('temperature', 36.8)]
+
+    db.session.delete(record)
+    db.session.commit()
+    assert _readings(patient_id) == []
+
+
+def test_lttb_keeps_the_ends_and_the_peak():
+    times = list(range(100))
+    values = [0.0] * 100
+    values[37] = 50.0
+
+    sampled_times, sampled_values = lttb(times, values, 10)
+
+    assert len(sampled_times) == 10
+    assert (sampled_times[0], sampled_times[-1]) == (0, 99)
+    assert 50.0 in sampled_values
+    assert lttb(times[:5], values[:5], 10) == (times[:5], values[:5])
+
+
+def test_series_are_filtered_and_downsampled(make_patient):
+    patient_id = make_patient().id
+    db.session.add_all([VitalReading(patient_id=patient_id, metric='heart_rate', ts=VISIT + timedelta(minutes=minute),
+                                     value=60 + minute % 7) for minute in range(50)])
+    db.session.commit()
+
+    series = load_series(patient_id, metrics=['heart_rate'], start=VISIT + timedelta(minutes=10), points=5)
+
+    assert series['heart_rate']['total'] == 40
+    assert len(series['heart_rate']['t']) == len(series['heart_rate']['v']) == 5
+    first = VISIT + timedelta(minutes=10)
+    assert series['heart_rate']['t'][0] == int(first.replace(tzinfo=timezone.utc).timestamp())  # Epoch seconds, UTC
+
+
+def test_trend_api(client, make_patient):
+    patient_id = make_patient().id
+
+    assert client.get(f'/medical/api/vitals/{patient_id}?metric=glucose').status_code == 400
+    assert client.get(f'/medical/api/vitals/{patient_id}?start=yesterday').status_code == 400
+    response = client.get(f'/medical/api/vitals/{patient_id}?metric=heart_rate')
+    assert response.status_code == 200
+    assert response.get_json() == {'patient_id': patient_id, 'series': {'heart_rate': {'t': [], 'v': [], 'total': 0}}}